@@ -0,0 +1,195 @@
+# archive.py
+"""
+Archival tier for long-cold clients.
+
+``ArchivedClient`` has the Client columns (both extend ``ClientFields``)
+and keeps its id, its company and, in its own ``lists`` table, its List
+memberships. ``ClientArchive`` moves rows between the two tables with
+``INSERT ... SELECT`` and ``DELETE``, one chunk per transaction, so the
+client table, its indexes and the search index only hold the active set.
+
+Archiving is recorded like a delete: a client tombstone for the change
+feed and the membership index, the search document removed, list counters
+lowered by the memberships archived and company counters recomputed over
+the active rows. A restore is recorded like a create: ``updated_at`` is
+set to now, the memberships come back as membership add events and the
+tombstones are dropped.
+
+Default queries never read the archive; ``?include_archived=true`` on the
+client list, detail, list members and export endpoints merges archived
+rows in, each row flagged ``archived``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from .changes import log_memberships, record_tombstones
+from .counters import list_counts
+from .filters import client_filters
+from .models import ArchivedClient, Client, List, Tombstone
+from .signals import bulk_client_changes, clients_changed, memberships_changed
+from .writes import serialized_writes
+
+Membership = List.clients.through
+ArchivedMembership = ArchivedClient.lists.through
+
+TRUE_VALUES = ('true', '1')
+
+
+def include_archived(params):
+    """``?include_archived=true``"""
+    return params.get('include_archived', '').lower() in TRUE_VALUES
+
+
+def client_rows(serializer, extra, active, archived=None):
+    """
+    The ``.values()`` querysets a page of clients is read from: ``active``
+    alone, or ``active`` and ``archived`` with an ``archived`` flag on each
+    row, paged together by ``KeysetPagination.paginate_querysets()``.
+    """
+    if archived is None:
+        return [serializer.get_queryset(active, extra=extra)]
+    extra = [*extra, 'archived']
+    return [
+        serializer.get_queryset(active.annotate(archived=Value(False, output_field=BooleanField())), extra=extra),
+        serializer.get_queryset(archived.annotate(archived=Value(True, output_field=BooleanField())), extra=extra),
+    ]
+
+
+class ClientArchive:
+    """Moves clients to the archive and back, a chunk per transaction"""
+
+    def __init__(self, chunk_size=None, using=None):
+        self.chunk_size = chunk_size or getattr(settings, 'ARCHIVE_CHUNK_SIZE', 500)
+        self.using = using or router.db_for_write(Client)
+        self.connection = connections[self.using]
+        qn = self.connection.ops.quote_name
+        self.columns = [field.column for field in Client._meta.concrete_fields]
+        self.client_table = qn(Client._meta.db_table)
+        self.archive_table = qn(ArchivedClient._meta.db_table)
+        self.membership_table = qn(Membership._meta.db_table)
+        self.archived_membership_table = qn(ArchivedMembership._meta.db_table)
+        self.archived_client_column = qn(ArchivedMembership._meta.get_field('archivedclient').column)
+        self.archived_list_column = qn(ArchivedMembership._meta.get_field('list').column)
+        self.qn = qn
+
+    def _execute(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def _placeholders(self, values):
+        return ', '.join(['%s'] * len(values))
+
+    def _now(self):
+        return self.connection.ops.adapt_datetimefield_value(timezone.now())
+
+    def _changed(self, client_ids, company_ids, deltas):
+        clients_changed.send(sender=Client, client_ids=client_ids, company_ids=set(company_ids) - {None})
+        if deltas:
+            memberships_changed.send(sender=List, deltas=deltas, using=self.using)
+
+    def chunks(self, ids):
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    # ----- archiving -----
+
+    def policy(self, stages=None, days=None):
+        """Active clients in ``stages`` not updated for ``days``, ARCHIVE_STAGES / ARCHIVE_AFTER_DAYS by default"""
+        stages = stages or getattr(settings, 'ARCHIVE_STAGES', ['cold'])
+        days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 180) if days is None else days
+        cutoff = timezone.now() - timedelta(days=days)
+        return Client.objects.using(self.using).filter(nurturing_stage__in=stages, updated_at__lt=cutoff)
+
+    def run(self, queryset, limit=None):
+        """Archive the clients of ``queryset`` in id order, yields the count moved per chunk"""
+        last_id = 0
+        moved = 0
+        while limit is None or moved < limit:
+            size = self.chunk_size if limit is None else min(self.chunk_size, limit - moved)
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:size])
+            if not ids:
+                return
+            last_id = ids[-1]
+            with serialized_writes(), transaction.atomic(using=self.using):
+                # Re-checked under the lock, rows updated meanwhile stay active
+                count = self.archive(queryset.filter(id__in=ids))
+            moved += count
+            yield count
+
+    def archive(self, queryset):
+        """Move the clients of ``queryset`` (one chunk) to the archive, returns how many"""
+        found = dict(queryset.select_for_update().values_list('id', 'company_id'))
+        if not found:
+            return 0
+        ids = list(found)
+        placeholders = self._placeholders(ids)
+        memberships = list_counts(Membership.objects.using(self.using).filter(client_id__in=ids))
+        columns = ', '.join(self.qn(column) for column in self.columns)
+        self._execute(
+            f"INSERT INTO {self.archive_table} ({columns}, {self.qn('archived_at')}) "
+            f"SELECT {columns}, %s FROM {self.client_table} WHERE id IN ({placeholders})",
+            [self._now(), *ids]
+        )
+        self._execute(
+            f"INSERT INTO {self.archived_membership_table} ({self.archived_client_column}, {self.archived_list_column}) "
+            f"SELECT client_id, list_id FROM {self.membership_table} WHERE client_id IN ({placeholders})",
+            ids
+        )
+        # Memberships and duplicate candidates go with the rows
+        with bulk_client_changes():
+            Client.objects.using(self.using).filter(id__in=ids).delete()
+        record_tombstones('client', ids)
+        self._changed(ids, found.values(), {list_id: -count for list_id, count in memberships.items()})
+        return len(ids)
+
+    # ----- restoring -----
+
+    def target_ids(self, ids=None, filters=None):
+        """Archived ids to restore, ``filters`` are the ``GET /api/clients/`` params"""
+        if ids is not None:
+            return list(dict.fromkeys(ids))
+        queryset = client_filters.filter(ArchivedClient.objects.using(self.using), filters)
+        return list(queryset.order_by('id').values_list('id', flat=True))
+
+    def restore(self, ids):
+        """Move archived ``ids`` back, returns ``{id: 'restored' | 'not_found'}``"""
+        results = {}
+        for chunk in self.chunks(ids):
+            with serialized_writes(), transaction.atomic(using=self.using):
+                found = dict(
+                    ArchivedClient.objects.using(self.using).filter(id__in=chunk)
+                    .select_for_update().values_list('id', 'company_id')
+                )
+                if found:
+                    self._restore(found)
+            for client_id in chunk:
+                results[client_id] = 'restored' if client_id in found else 'not_found'
+        return results
+
+    def _restore(self, found):
+        ids = list(found)
+        placeholders = self._placeholders(ids)
+        memberships = list_counts(ArchivedMembership.objects.using(self.using).filter(archivedclient_id__in=ids))
+        # A restore is a change, the client feed picks it up again
+        values = ', '.join('%s' if column == 'updated_at' else self.qn(column) for column in self.columns)
+        self._execute(
+            f"INSERT INTO {self.client_table} ({', '.join(self.qn(column) for column in self.columns)}) "
+            f"SELECT {values} FROM {self.archive_table} WHERE id IN ({placeholders})",
+            [self._now(), *ids]
+        )
+        members = (
+            f"SELECT a.{self.archived_list_column} AS list_id, a.{self.archived_client_column} AS client_id "
+            f"FROM {self.archived_membership_table} a WHERE a.{self.archived_client_column} IN ({placeholders})"
+        )
+        log_memberships(self.using, 'add', members, ids)
+        self._execute(f"INSERT INTO {self.membership_table} (list_id, client_id) {members}", ids)
+        ArchivedClient.objects.using(self.using).filter(id__in=ids).delete()
+        # Otherwise a feed (or the membership index) reading the tombstone
+        # after the restore's events would drop the client again
+        Tombstone.objects.using(self.using).filter(model='client', object_id__in=ids).delete()
+        self._changed(ids, found.values(), memberships)
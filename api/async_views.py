@@ -0,0 +1,287 @@
+# async_views.py
+"""
+Async variants of the hot read endpoints, served under ``/api/async/``.
+
+DRF viewsets only run synchronously, so under an ASGI server each of their
+requests holds a thread while it waits on the database. These are plain
+Django async views returning the same JSON as their DRF counterparts, built
+from the same filters, pagination and serializer.
+
+Django's async ORM (``afirst()``, ``acount()``, ``aiterator()``) runs every
+query on the one thread shared with sync code, so queries that don't depend
+on each other (a page and its count, the facet GROUP BYs) go through
+``concurrently()`` instead, each in a worker thread of its own.
+
+The paginated reads and the detail view are cached like their viewsets'
+``CachedResponseMixin`` actions (``cached_response()``): generation keys,
+a strong ETag and 304s for a matching ``If-None-Match``. Exports stream
+and facets keep their own cache, as on the sync side.
+"""
+import asyncio
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+
+from .archive import client_rows, include_archived
+from .cache import etag_matches, get_cache, make_key, params_signature, response_cache_key
+from .exporters import EXPORT_FORMATS, astream_export
+from .facets import facet_queries
+from .filters import client_filters, explain, wants_explain
+from .models import ArchivedClient, Client, List
+from .pagination import KeysetPagination
+from .renderers import dumps
+from .serializers import FastClientSerializer
+from .views import client_filters_applied, list_filters_applied
+
+
+def in_thread(function):
+    """Await ``function()`` run in a worker thread"""
+    def run():
+        # Worker threads keep their connections between requests
+        close_old_connections()
+        return function()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def concurrently(*functions):
+    """Results of ``functions``, run at the same time in worker threads"""
+    return await asyncio.gather(*(in_thread(function) for function in functions))
+
+
+def json_response(data, status=200):
+    # The same bytes as FastJSONRenderer
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def not_found(model):
+    return json_response({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+def async_endpoint(view):
+    """GET only, API errors (bad ?fields=, stale cursors...) render as with DRF"""
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(detail, status=exc.status_code)
+    return wrapper
+
+
+def cached_response(*depends_on):
+    """
+    CachedResponseMixin for an async view: 200 bodies are cached per host,
+    path and params under the generations of ``depends_on``, with the same
+    ETag (the digest of the body) and 304 handling
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def cached(request, *args, **kwargs):
+            cache = get_cache()
+            key = await sync_to_async(response_cache_key)(request, 'application/json', request.GET, depends_on)
+            found = await cache.aget_many([f'{key}:etag', f'{key}:body'])
+            etag, body = found.get(f'{key}:etag'), found.get(f'{key}:body')
+            if etag is not None and etag_matches(etag, request):
+                return not_modified(etag)
+
+            if etag is None or body is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                body = response.content
+                etag = hashlib.sha256(body).hexdigest()
+                await cache.aset_many(
+                    {f'{key}:body': body, f'{key}:etag': etag}, getattr(settings, 'API_CACHE_TIMEOUT', 300)
+                )
+                if etag_matches(etag, request):
+                    return not_modified(etag)
+            else:
+                response = HttpResponse(body, content_type='application/json')
+
+            response['ETag'] = quote_etag(etag)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return cached
+    return decorator
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = quote_etag(etag)
+    return response
+
+
+async def paginate(paginator, querysets, request):
+    """
+    KeysetPagination.paginate_querysets() with the counts and the pages
+    fetched concurrently
+    """
+    page_querysets = await sync_to_async(lambda: [paginator.prepare(queryset, request) for queryset in querysets])()
+    paginator.count, *pages = await concurrently(
+        functools.partial(paginator.get_total, querysets, request),
+        *(functools.partial(list, page_queryset) for page_queryset in page_querysets),
+    )
+    return paginator.finish(pages[0] if len(pages) == 1 else paginator.merge(pages))
+
+
+async def explain_response(paginator, queryset, request, plan):
+    """``?explain=1``: the page query and its plan instead of the page"""
+    data = await sync_to_async(lambda: explain(paginator.prepare(queryset, request), plan))()
+    return json_response(data)
+
+
+# ========== CLIENT API ==========
+@async_endpoint
+@cached_response('client', 'company')
+async def client_list(request):
+    """Async GET /api/clients/"""
+    params = request.GET
+    paginator = KeysetPagination()
+    serializer = FastClientSerializer.from_request(request)
+
+    plan = client_filters.compile(params)
+
+    def build():
+        queryset = plan.apply(Client.objects.all())
+        archived = plan.apply(ArchivedClient.objects.all()) if include_archived(params) else None
+        if 'search_rank' in queryset.query.annotations:
+            paginator.ordering = ('search_rank', '-created_at', 'id')
+        return client_rows(serializer, paginator.ordering_fields(), queryset, archived)
+
+    querysets = await sync_to_async(build)()
+    if wants_explain(params):
+        return await explain_response(paginator, querysets[0], request, plan)
+    page = await paginate(paginator, querysets, request)
+    return json_response({
+        **paginator.get_paginated_data(),
+        'results': serializer.many(page),
+        'filters_applied': client_filters_applied(params),
+    })
+
+
+@async_endpoint
+@cached_response('client', 'company')
+async def client_detail(request, pk):
+    """Async GET /api/clients/{id}/"""
+    serializer = FastClientSerializer.from_request(request)
+    querysets = client_rows(
+        serializer, (), Client.objects.filter(pk=pk),
+        ArchivedClient.objects.filter(pk=pk) if include_archived(request.GET) else None,
+    )
+    for queryset in querysets:
+        if (row := await queryset.afirst()) is not None:
+            return json_response(serializer.many([row])[0])
+    return not_found(Client)
+
+
+@async_endpoint
+async def client_facets(request):
+    """Async GET /api/clients/facets/, every GROUP BY runs concurrently"""
+    params = request.GET
+    try:
+        limit = max(1, min(int(params.get('facet_limit', 50)), 500))
+    except ValueError:
+        return json_response({'error': 'facet_limit must be an integer'}, status=400)
+
+    timeout = settings.FACETS_CACHE_TIMEOUT
+    use_cache = timeout > 0 and params.get('nocache') != 'true'
+    if use_cache:
+        # Same entries as the sync endpoint
+        key = await sync_to_async(make_key)(
+            'facets', params_signature(params, ignore=('nocache',)), ('client', 'company')
+        )
+        if (data := await get_cache().aget(key)) is not None:
+            return json_response({**data, 'cached': True})
+
+    queryset = await sync_to_async(client_filters.filter)(Client.objects.all(), params)
+    queries = facet_queries(queryset, limit)
+    count, *results = await concurrently(queryset.order_by().count, *queries.values())
+    data = {'count': count, 'facets': dict(zip(queries, results))}
+    if use_cache:
+        await get_cache().aset(key, data, timeout)
+    return json_response({**data, 'cached': False})
+
+
+@async_endpoint
+async def client_export(request):
+    """Async GET /api/clients/export/, streamed without holding a thread"""
+    file_format = request.GET.get('file_format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return json_response({'error': f'file_format must be one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+    plan = client_filters.compile(request.GET)
+    queryset = await sync_to_async(plan.apply)(Client.objects.all())
+    archived = None
+    if include_archived(request.GET):
+        archived = await sync_to_async(plan.apply)(ArchivedClient.objects.all())
+    return astream_export(queryset, file_format, 'clients', archived=archived)
+
+
+# ========== LIST API ==========
+@async_endpoint
+@cached_response('list', 'client', 'company')
+async def list_clients(request, pk):
+    """Async GET /api/lists/{id}/get_clients/"""
+    list_obj = await List.objects.filter(pk=pk).afirst()
+    if list_obj is None:
+        return not_found(List)
+    params = request.GET
+    paginator = KeysetPagination()
+    serializer = FastClientSerializer.from_request(request)
+
+    plan = client_filters.compile(params)
+
+    archived = include_archived(params)
+
+    def build():
+        clients = plan.apply(list_obj.clients.all())
+        if 'search_rank' in clients.query.annotations:
+            paginator.ordering = ('search_rank', '-created_at', 'id')
+        return client_rows(
+            serializer, paginator.ordering_fields(), clients,
+            plan.apply(list_obj.archived_clients.all()) if archived else None,
+        )
+
+    querysets = await sync_to_async(build)()
+    if wants_explain(params):
+        return await explain_response(paginator, querysets[0], request, plan)
+    page = await paginate(paginator, querysets, request)
+    pagination = paginator.get_paginated_data()
+    data = {
+        'list_id': list_obj.id,
+        'list_name': list_obj.name,
+        'total_clients': list_obj.count,
+        'filtered_count': pagination.pop('count'),
+        **pagination,
+        'applied_filters': list_filters_applied(params),
+        'clients': serializer.many(page),
+    }
+    if archived:
+        data['archived_clients'] = await list_obj.archived_clients.acount()
+    return json_response(data)
+
+
+@async_endpoint
+async def list_export(request, pk):
+    """Async GET /api/lists/{id}/export/"""
+    list_obj = await List.objects.filter(pk=pk).afirst()
+    if list_obj is None:
+        return not_found(List)
+    file_format = request.GET.get('file_format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return json_response({'error': f'file_format must be one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+    plan = client_filters.compile(request.GET)
+    clients = await sync_to_async(plan.apply)(list_obj.clients.all())
+    archived = None
+    if include_archived(request.GET):
+        archived = await sync_to_async(plan.apply)(list_obj.archived_clients.all())
+    return astream_export(clients, file_format, f'list-{list_obj.id}', archived=archived)
@@ -0,0 +1,157 @@
+# batch.py
+"""
+Batch create / update / delete of clients.
+
+Updates and deletes target either an explicit ``ids`` list or a ``filters``
+object holding the same params as ``GET /api/clients/``. They run one
+``UPDATE`` / ``DELETE ... WHERE id IN (...)`` per chunk, each chunk in its
+own transaction, and send ``clients_changed`` / ``memberships_changed``
+once per chunk instead of the per-instance signals, so search, counters and
+caches stay in step. Every call reports a result per id (or per row for
+creates).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .changes import record_tombstones
+from .counters import list_counts
+from .dedup import email_key, phone_key
+from .filters import client_filters
+from .importers import ClientImporter
+from .models import Client, List
+from .serializers import ClientSerializer
+from .signals import bulk_client_changes, clients_changed, memberships_changed
+from .writes import serialized_writes
+
+# Fields a batch patch may set, ``company_id`` moves clients between companies
+PATCH_FIELDS = (
+    'client', 'job_role', 'phone', 'email', 'social_media', 'status',
+    'remarks', 'lead_owner', 'nurturing_stage', 'company_id',
+)
+
+
+class BatchTargetSerializer(serializers.Serializer):
+    """Either ``ids`` or ``filters``, never both"""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filters = serializers.DictField(child=serializers.CharField(allow_blank=True), required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filters' in attrs):
+            raise serializers.ValidationError('Provide exactly one of "ids" or "filters".')
+        if 'filters' in attrs and not any(attrs['filters'].values()):
+            # An empty filter would silently target every client
+            raise serializers.ValidationError({'filters': ['At least one filter is required.']})
+        return attrs
+
+
+def validate_patch(patch):
+    """Validate a patch with ClientSerializer and return model field values"""
+    if not isinstance(patch, dict) or not patch:
+        raise serializers.ValidationError({'patch': ['Must be a non-empty object.']})
+    if unknown := sorted(set(patch) - set(PATCH_FIELDS)):
+        raise serializers.ValidationError({'patch': [f'Fields cannot be patched: {", ".join(unknown)}']})
+
+    serializer = ClientSerializer(data=patch, partial=True)
+    if not serializer.is_valid():
+        raise serializers.ValidationError({'patch': serializer.errors})
+    values = dict(serializer.validated_data)
+    if 'company' in values:
+        company = values.pop('company')
+        values['company_id'] = company.pk if company else None
+    if 'email' in values:
+        values['email_key'] = email_key(values['email'])
+    if 'phone' in values:
+        values['phone_key'] = phone_key(values['phone'])
+    return values
+
+
+class ClientBatch:
+    """Chunked batch writes to clients"""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or getattr(settings, 'BATCH_CHUNK_SIZE', 500)
+
+    def target_ids(self, ids=None, filters=None):
+        """The ids to work on, explicit ids keep their order and duplicates are dropped"""
+        if ids is not None:
+            return list(dict.fromkeys(ids))
+        queryset = client_filters.filter(Client.objects.all(), filters)
+        return list(queryset.order_by('id').values_list('id', flat=True))
+
+    def chunks(self, ids):
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    # ----- writes -----
+
+    def update(self, ids, values):
+        """Apply ``values`` to ``ids``, returns ``{id: 'updated' | 'not_found'}``"""
+        results = {}
+        changes_company = 'company_id' in values
+        for chunk in self.chunks(ids):
+            with serialized_writes(), transaction.atomic():
+                rows = Client.objects.filter(id__in=chunk).select_for_update()
+                if changes_company:
+                    found = dict(rows.values_list('id', 'company_id'))
+                else:
+                    found = dict.fromkeys(rows.values_list('id', flat=True))
+                if found:
+                    # queryset.update() skips auto_now, so set it here
+                    Client.objects.filter(id__in=found).update(**values, updated_at=timezone.now())
+                    company_ids = set()
+                    if changes_company:
+                        company_ids = {*found.values(), values['company_id']} - {None}
+                    clients_changed.send(sender=Client, client_ids=list(found), company_ids=company_ids)
+            for client_id in chunk:
+                results[client_id] = 'updated' if client_id in found else 'not_found'
+        return results
+
+    def delete(self, ids):
+        """Delete ``ids``, returns ``{id: 'deleted' | 'not_found'}``"""
+        results = {}
+        Membership = List.clients.through
+        for chunk in self.chunks(ids):
+            with serialized_writes(), transaction.atomic():
+                found = dict(Client.objects.filter(id__in=chunk).values_list('id', 'company_id'))
+                if found:
+                    removed = list_counts(Membership.objects.filter(client_id__in=found))
+                    with bulk_client_changes():
+                        Client.objects.filter(id__in=found).delete()
+                    record_tombstones('client', found)
+                    clients_changed.send(
+                        sender=Client, client_ids=list(found), company_ids=set(found.values()) - {None}
+                    )
+                    if removed:
+                        memberships_changed.send(
+                            sender=List, deltas={list_id: -count for list_id, count in removed.items()}
+                        )
+            for client_id in chunk:
+                results[client_id] = 'deleted' if client_id in found else 'not_found'
+        return results
+
+    def create(self, rows):
+        """Create clients from import-style rows, returns one result per row index"""
+        results = {}
+
+        def created(index, client):
+            results[index] = {'index': index, 'status': 'created', 'id': client.pk}
+
+        def failed(index, errors):
+            results[index] = {'index': index, 'status': 'error', 'errors': errors}
+
+        importer = ClientImporter(batch_size=self.chunk_size, on_created=created, on_error=failed, max_errors=0)
+        importer.run(enumerate(rows))
+        return [results[index] for index in sorted(results)]
+
+
+def summarize(results):
+    """Per-id results plus totals per status"""
+    totals = {}
+    for state in results.values():
+        totals[state] = totals.get(state, 0) + 1
+    return {
+        **totals,
+        'results': [{'id': client_id, 'status': state} for client_id, state in results.items()],
+    }
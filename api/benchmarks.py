@@ -0,0 +1,247 @@
+# benchmarks.py
+"""
+Endpoint benchmarks run through the Django test client (see the
+``run_benchmarks`` command).
+
+Every scenario is one API request, timed over several runs after a warmup.
+Each run reports latency, the number of SQL queries and, from one extra
+run under tracemalloc, the peak Python memory. Writes (``add_clients``,
+``move``, ``duplicate``) run inside a transaction that is rolled back, so
+the dataset is the same for every run. Response caches are disabled unless
+asked for, so the numbers measure the queries and not the cache.
+"""
+import json
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .models import Client, Company, List
+
+Scenario = namedtuple('Scenario', 'name method path params writes', defaults=({}, False))
+
+# One scenario per filter of GET /api/clients/
+CLIENT_FILTERS = {
+    'q': {'q': 'priya'},
+    'search': {'search': 'patel'},
+    'search_relevance': {'q': 'sales manager', 'ordering': 'relevance'},
+    'role': {'role': 'manager'},
+    'location': {'location': 'london'},
+    'company': {'company': 'acme'},
+    'status': {'status': 'qualified'},
+    'remarks': {'remarks': 'demo'},
+    'lead_owner': {'lead_owner': 'alex'},
+    'nurturing_stage': {'nurturing_stage': 'hot'},
+    'has_social': {'has_social': 'true'},
+    'platform': {'platform': 'linkedin'},
+    'platform_unindexed': {'platform': 'mastodon'},
+    'role_prefix': {'role__prefix': 'vp'},
+    'combined': {'nurturing_stage': 'hot', 'platform': 'linkedin', 'lead_owner': 'alex'},
+}
+
+# One scenario per filter of GET /api/lists/{id}/get_clients/
+LIST_CLIENT_FILTERS = {
+    'role': {'role': 'manager'},
+    'location': {'location': 'london'},
+    'company': {'company': 'acme'},
+    'media': {'media': 'linkedin'},
+    'lead_owner': {'lead_owner': 'alex'},
+}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def default_scenarios(using=DEFAULT_DB_ALIAS):
+    """Scenarios over the current data, the largest list / company drive the heavy ones"""
+    lists = List.objects.using(using).filter(kind='static').order_by('-client_count', 'id')
+    largest = lists.first()
+    smallest = lists.last()
+    company = Company.objects.using(using).order_by('-client_count', 'id').first()
+    client = Client.objects.using(using).order_by('-created_at', 'id').first()
+    if largest is None or company is None or client is None:
+        return []
+    sample = list(Client.objects.using(using).order_by('?').values_list('id', flat=True)[:100])
+
+    scenarios = [
+        Scenario('companies.list', 'GET', '/api/companies/'),
+        Scenario('companies.retrieve', 'GET', f'/api/companies/{company.pk}/'),
+        Scenario('lists.list', 'GET', '/api/lists/'),
+        Scenario('lists.retrieve', 'GET', f'/api/lists/{largest.pk}/'),
+        Scenario('clients.list', 'GET', '/api/clients/'),
+        Scenario('clients.list.deep', 'GET', '/api/clients/', {'page_size': 1000, 'count': 'none'}),
+        Scenario('clients.retrieve', 'GET', f'/api/clients/{client.pk}/'),
+        Scenario('clients.facets', 'GET', '/api/clients/facets/'),
+    ]
+    scenarios += [
+        Scenario(f'clients.list[{name}]', 'GET', '/api/clients/', params)
+        for name, params in CLIENT_FILTERS.items()
+    ]
+    scenarios += [
+        Scenario('clients.list[email_exact]', 'GET', '/api/clients/', {'email__exact': client.email or ''}),
+        Scenario('clients.list[company_exact]', 'GET', '/api/clients/', {'company__exact': company.company_name}),
+    ]
+    scenarios.append(Scenario('lists.get_clients', 'GET', f'/api/lists/{largest.pk}/get_clients/'))
+    scenarios += [
+        Scenario(f'lists.get_clients[{name}]', 'GET', f'/api/lists/{largest.pk}/get_clients/', params)
+        for name, params in LIST_CLIENT_FILTERS.items()
+    ]
+    scenarios += [
+        Scenario('lists.add_clients', 'POST', f'/api/lists/{smallest.pk}/add_clients/',
+                 {'client_ids': sample}, writes=True),
+        Scenario('lists.duplicate', 'POST', f'/api/lists/{largest.pk}/duplicate/', {}, writes=True),
+    ]
+    if smallest.pk != largest.pk:
+        scenarios += [
+            Scenario('lists.move', 'POST', f'/api/lists/{largest.pk}/move/',
+                     {'target_list_id': smallest.pk}, writes=True),
+            Scenario('lists.move.remove_from_source', 'POST', f'/api/lists/{largest.pk}/move/',
+                     {'target_list_id': smallest.pk, 'remove_from_source': True}, writes=True),
+        ]
+    return scenarios
+
+
+class Benchmark:
+    """Runs scenarios and compares their results against a baseline"""
+
+    def __init__(self, repeat=20, warmup=2, cached=False, using=DEFAULT_DB_ALIAS):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.cached = cached
+        self.using = using
+        # A failing endpoint is reported with its status, not raised
+        self.client = TestClient(raise_request_exception=False)
+
+    def request(self, scenario):
+        if scenario.method == 'GET':
+            response = self.client.get(scenario.path, scenario.params)
+        else:
+            response = self.client.generic(
+                scenario.method, scenario.path, json.dumps(scenario.params), content_type='application/json'
+            )
+        # Streaming bodies are only produced while being read
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    @contextmanager
+    def isolated(self, scenario):
+        """Roll back whatever a write scenario changed"""
+        if not scenario.writes:
+            yield
+            return
+        with transaction.atomic(using=self.using):
+            yield
+            transaction.set_rollback(True, using=self.using)
+
+    def measure(self, scenario):
+        """``(seconds, queries, status, bytes)`` of one request"""
+        with self.isolated(scenario), CaptureQueriesContext(connections[self.using]) as queries:
+            start = time.perf_counter()
+            status, size = self.request(scenario)
+            elapsed = time.perf_counter() - start
+        return elapsed, len(queries.captured_queries), status, size
+
+    def peak_memory(self, scenario):
+        """Peak traced allocation in bytes while serving one request"""
+        tracemalloc.start()
+        try:
+            with self.isolated(scenario):
+                self.request(scenario)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def run_scenario(self, scenario):
+        for _ in range(self.warmup):
+            self.measure(scenario)
+        runs = [self.measure(scenario) for _ in range(self.repeat)]
+        times = [elapsed * 1000 for elapsed, _, _, _ in runs]
+        _, queries, status, size = runs[-1]
+        return {
+            'status': status,
+            'runs': len(runs),
+            'p50_ms': round(percentile(times, 50), 3),
+            'p95_ms': round(percentile(times, 95), 3),
+            'p99_ms': round(percentile(times, 99), 3),
+            'max_ms': round(max(times), 3),
+            'queries': queries,
+            'peak_kb': round(self.peak_memory(scenario) / 1024, 1),
+            'bytes': size,
+        }
+
+    def run(self, scenarios, on_result=None):
+        """Results keyed by scenario name plus a ``dataset`` summary"""
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not self.cached:
+            # A zero timeout stores nothing, every request hits the database
+            overrides.update(API_CACHE_TIMEOUT=0, FACETS_CACHE_TIMEOUT=0)
+        results = {}
+        with override_settings(**overrides):
+            for scenario in scenarios:
+                results[scenario.name] = self.run_scenario(scenario)
+                if on_result:
+                    on_result(scenario.name, results[scenario.name])
+        return {'dataset': self.dataset(), 'repeat': self.repeat, 'results': results}
+
+    def dataset(self):
+        memberships = List.objects.using(self.using).aggregate(total=Count('clients'))['total']
+        return {
+            'vendor': connections[self.using].vendor,
+            'clients': Client.objects.using(self.using).count(),
+            'companies': Company.objects.using(self.using).count(),
+            'lists': List.objects.using(self.using).count(),
+            'memberships': memberships,
+        }
+
+
+def compare(baseline, current, tolerance=0.2, noise_ms=1.0):
+    """
+    Per-scenario deltas against a saved run. Latency and memory regress when
+    they grow by more than ``tolerance`` (and latency by more than
+    ``noise_ms``), query counts regress on any increase.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            rows.append({'name': name, 'regressions': [], 'new': True})
+            continue
+        regressions = []
+        if (result['p95_ms'] > base['p95_ms'] * (1 + tolerance)
+                and result['p95_ms'] - base['p95_ms'] > noise_ms):
+            regressions.append('p95_ms')
+        if result['queries'] > base['queries']:
+            regressions.append('queries')
+        if result['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+            regressions.append('peak_kb')
+        rows.append({
+            'name': name,
+            'regressions': regressions,
+            'new': False,
+            **{
+                f'{key}_change': _change(base[key], result[key])
+                for key in ('p50_ms', 'p95_ms', 'queries', 'peak_kb')
+            },
+        })
+    return rows
+
+
+def _change(before, after):
+    """Relative change, ``None`` when there is nothing to compare against"""
+    if not before:
+        return None
+    return round((after - before) / before, 3)
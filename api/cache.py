@@ -0,0 +1,142 @@
+# cache.py
+"""
+Generation-based cache invalidation and response caching.
+
+Every model family has a generation counter in the cache that is bumped on
+writes (see api/signals.py). Cache keys embed the generations they depend
+on, so a write invalidates every dependent entry without tracking them.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .renderers import dumps
+
+GENERATION_PREFIX = 'api:generation:'
+
+
+def _seed():
+    # A generation that went missing (eviction, cache restart) must not
+    # restart at a value old keys may still be stored under
+    return time.time_ns()
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def get_generations(*names):
+    """Current generation of each name, as a tuple in the same order"""
+    cache = get_cache()
+    keys = [GENERATION_PREFIX + name for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            seed = _seed()
+            cache.add(key, seed, timeout=None)
+            found[key] = cache.get(key, seed)
+    return tuple(found[key] for key in keys)
+
+
+def bump_generation(*names):
+    cache = get_cache()
+    for name in names:
+        key = GENERATION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
+            cache.incr(key)
+
+
+def params_signature(params, ignore=()):
+    """Stable digest of query params, independent of their order"""
+    items = sorted(
+        (key, sorted(params.getlist(key)) if hasattr(params, 'getlist') else [params[key]])
+        for key in params if key not in ignore
+    )
+    return hashlib.sha1(json.dumps(items).encode()).hexdigest()
+
+
+def make_key(namespace, signature, depends_on):
+    generations = '.'.join(str(g) for g in get_generations(*depends_on))
+    return f'api:{namespace}:{generations}:{signature}'
+
+
+def response_cache_key(request, media_type, params, depends_on):
+    # The host is part of the key because responses embed absolute links
+    signature = hashlib.sha1('|'.join([
+        request.get_host(),
+        request.path,
+        media_type or '',
+        params_signature(params),
+    ]).encode()).hexdigest()
+    return make_key('response', signature, depends_on)
+
+
+def etag_matches(etag, request):
+    """Weak If-None-Match comparison, compressed responses carry ``W/`` ETags"""
+    candidates = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in candidates or quote_etag(etag) in [tag.removeprefix('W/') for tag in candidates]
+
+
+class CachedResponseMixin:
+    """
+    Cache GET responses of ``cache_actions`` keyed on the path, the query
+    params, the negotiated media type and the generations of the models in
+    ``cache_depends_on``. Responses carry a strong ETag and matching
+    ``If-None-Match`` requests get a 304 straight from the cache.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_depends_on = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The handler is looked up after initial(), so it can be wrapped here
+        if request.method == 'GET' and self.action in self.cache_actions:
+            self.get = self.cached_handler(self.get)
+
+    def get_response_cache_key(self, request):
+        return response_cache_key(
+            request, request.accepted_media_type, request.query_params, self.cache_depends_on
+        )
+
+    def cached_handler(self, handler):
+        def cached(request, *args, **kwargs):
+            cache = get_cache()
+            key = self.get_response_cache_key(request)
+            timeout = getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+            etag = cache.get(f'{key}:etag')
+            if etag is not None and etag_matches(etag, request):
+                return self.not_modified(etag)
+
+            data = cache.get(f'{key}:data') if etag is not None else None
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200 or not isinstance(response, Response):
+                    return response
+                data = response.data
+                etag = hashlib.sha256(dumps(data)).hexdigest()
+                cache.set_many({f'{key}:data': data, f'{key}:etag': etag}, timeout)
+                if etag_matches(etag, request):
+                    return self.not_modified(etag)
+            else:
+                response = Response(data)
+
+            response['ETag'] = quote_etag(etag)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept'])
+            return response
+        return cached
+
+    def not_modified(self, etag):
+        response = Response(status=304)
+        response['ETag'] = quote_etag(etag)
+        return response
@@ -0,0 +1,46 @@
+# changes.py
+"""
+Change feed bookkeeping.
+
+``updated_since`` feeds read Client / Company rows by ``(updated_at, id)``.
+Deletes leave a ``Tombstone`` and every membership add / remove leaves a
+``MembershipEvent``. Per-instance writes are recorded by receivers in
+api/signals.py; bulk writers call these helpers with the same rows they
+change, as ``bulk_create`` or ``INSERT ... SELECT``.
+"""
+from django.db import connections
+from django.utils import timezone
+
+from .models import MembershipEvent, Tombstone
+
+BATCH_SIZE = 500
+
+
+def record_tombstones(model, ids):
+    """Record deleted ``model`` ('client', 'company', 'list') rows"""
+    now = timezone.now()
+    Tombstone.objects.bulk_create(
+        [Tombstone(model=model, object_id=pk, deleted_at=now) for pk in ids], batch_size=BATCH_SIZE
+    )
+
+
+def record_membership_events(action, pairs):
+    """Record ``(list_id, client_id)`` pairs added / removed"""
+    now = timezone.now()
+    MembershipEvent.objects.bulk_create(
+        [MembershipEvent(list_id=list_id, client_id=client_id, action=action, created_at=now)
+         for list_id, client_id in pairs],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def log_memberships(using, action, select_sql, params):
+    """Record the pairs a ``SELECT ... list_id, ... client_id`` returns, in SQL"""
+    connection = connections[using]
+    table = connection.ops.quote_name(MembershipEvent._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (list_id, client_id, action, created_at) "
+            f"SELECT p.list_id, p.client_id, %s, %s FROM ({select_sql}) p",
+            [action, connection.ops.adapt_datetimefield_value(timezone.now()), *params]
+        )
@@ -0,0 +1,34 @@
+# checks.py
+"""System checks for settings the api app reads at runtime."""
+import re
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from .dedup import phonenumbers
+
+
+@register()
+def check_dedup_settings(app_configs, **kwargs):
+    """DEDUP_DEFAULT_COUNTRY_CODE must be a calling code, phone keys depend on it"""
+    messages = []
+    country_code = getattr(settings, 'DEDUP_DEFAULT_COUNTRY_CODE', '')
+    if country_code and not re.fullmatch(r'[1-9][0-9]{0,2}', str(country_code)):
+        messages.append(Error(
+            f'DEDUP_DEFAULT_COUNTRY_CODE must be a country calling code such as 1 or 91, not {country_code!r}.',
+            id='api.E001',
+        ))
+    elif (country_code and phonenumbers is not None
+          and phonenumbers.region_code_for_country_code(int(country_code)) == phonenumbers.UNKNOWN_REGION):
+        messages.append(Error(
+            f'DEDUP_DEFAULT_COUNTRY_CODE {country_code} is not an assigned country calling code.',
+            id='api.E001',
+        ))
+    if phonenumbers is None:
+        messages.append(Warning(
+            'phonenumbers is not installed, Client.phone_key falls back to digit normalization.',
+            hint='Install it to validate numbers as E.164. Keys stored before that keep '
+                 'the fallback form until their clients are saved again.',
+            id='api.W001',
+        ))
+    return messages
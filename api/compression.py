@@ -0,0 +1,235 @@
+# compression.py
+"""
+Content-negotiated response compression: zstd, brotli or gzip.
+
+``CompressionMiddleware`` picks the first of COMPRESSION_ENCODINGS the
+client accepts (``Accept-Encoding`` q-values honoured) whose library is
+installed; gzip needs only the stdlib, brotli the ``brotli`` package and
+zstd the ``zstandard`` package.
+
+Only JSON and export media types are compressed (see COMPRESSIBLE_TYPES),
+and bodies under COMPRESSION_MIN_SIZE bytes are sent as is. For full bodies the level is chosen per response
+from the throughput measured so far: the best level expected to compress
+the body within COMPRESSION_CPU_BUDGET_MS, the fastest one otherwise.
+Streaming responses (exports) are compressed on the fly at the fastest
+level and flushed every COMPRESSION_STREAM_FLUSH_BYTES of input, so rows
+keep flowing to the client.
+"""
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# API payloads and exports only. HTML pages (admin, the browsable API)
+# carry CSRF tokens next to reflected input, which compression would leak
+# through the body size (BREACH).
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/jsonl', 'application/x-ndjson', 'text/csv',
+)
+
+_ACCEPT_ENCODING = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+# Content-Encoding -> (compressor class, levels fastest first, seed MB/s per level)
+ENCODINGS = {
+    'gzip': (GzipCompressor, (1, 4, 6), (120, 60, 35)),
+    'br': (BrotliCompressor, (1, 4, 6), (150, 50, 25)),
+    'zstd': (ZstdCompressor, (1, 3, 9), (400, 250, 60)),
+}
+
+AVAILABLE = {
+    'gzip': True,
+    'br': brotli is not None,
+    'zstd': zstandard is not None,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def accepted_encoding(header, preferred=None):
+    """The first of ``preferred`` the ``Accept-Encoding`` header allows, or None"""
+    preferred = [name for name in (preferred or _setting('COMPRESSION_ENCODINGS', ['zstd', 'br', 'gzip']))
+                 if AVAILABLE.get(name)]
+    weights = {}
+    for part in header.split(','):
+        if match := _ACCEPT_ENCODING.match(part):
+            try:
+                weights[match.group(1).lower()] = float(match.group(2) or 1)
+            except ValueError:
+                continue
+    if not weights:
+        return None
+    wildcard = weights.get('*', 0)
+    candidates = [name for name in preferred if weights.get(name, wildcard) > 0]
+    # Highest q-value wins, ties go to the server's preference
+    return max(candidates, key=lambda name: weights.get(name, wildcard), default=None)
+
+
+class Throughput:
+    """Moving average of compression speed in bytes per second, per encoding and level"""
+
+    def __init__(self, weight=0.2):
+        self.weight = weight
+        self.lock = threading.Lock()
+        self.rates = {
+            (name, level): seed * 1_000_000
+            for name, (_, levels, seeds) in ENCODINGS.items() for level, seed in zip(levels, seeds)
+        }
+
+    def record(self, encoding, level, size, seconds):
+        if seconds <= 0 or size < 64 * 1024:
+            # Small bodies mostly measure overhead
+            return
+        with self.lock:
+            rate = self.rates[encoding, level]
+            self.rates[encoding, level] = rate + self.weight * (size / seconds - rate)
+
+    def choose_level(self, encoding, size, budget_seconds):
+        """The best level expected to compress ``size`` bytes within the budget"""
+        levels = ENCODINGS[encoding][1]
+        for level in reversed(levels):
+            if size / self.rates[encoding, level] <= budget_seconds:
+                return level
+        return levels[0]
+
+
+throughput = Throughput()
+
+
+def compress(content, encoding, level):
+    start = time.perf_counter()
+    compressor = ENCODINGS[encoding][0](level)
+    compressed = compressor.compress(content) + compressor.finish()
+    throughput.record(encoding, level, len(content), time.perf_counter() - start)
+    return compressed
+
+
+def compress_stream(chunks, encoding, level, flush_bytes):
+    compressor = ENCODINGS[encoding][0](level)
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            output += compressor.flush()
+            pending = 0
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding, level, flush_bytes):
+    compressor = ENCODINGS[encoding][0](level)
+    pending = 0
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_bytes:
+            output += compressor.flush()
+            pending = 0
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with the best encoding the client accepts"""
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return response
+        min_size = _setting('COMPRESSION_MIN_SIZE', 1024)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            level = ENCODINGS[encoding][1][0]
+            flush_bytes = _setting('COMPRESSION_STREAM_FLUSH_BYTES', 64 * 1024)
+            stream = acompress_stream if response.is_async else compress_stream
+            response.streaming_content = stream(response.streaming_content, encoding, level, flush_bytes)
+            del response.headers['Content-Length']
+        else:
+            content = response.content
+            budget = _setting('COMPRESSION_CPU_BUDGET_MS', 50) / 1000
+            compressed = compress(content, encoding, throughput.choose_level(encoding, len(content), budget))
+            if len(compressed) >= len(content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The bytes differ from the uncompressed representation (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,89 @@
+# counters.py
+"""
+Stored membership counters: ``List.client_count`` and ``Company.client_count``.
+
+Writes adjust them atomically with F-expressions (see api/signals.py):
+single-row writes by one, bulk membership writes by the per-list deltas
+they send with ``memberships_changed``. Bulk client writes recompute the
+companies they touch, and the ``reconcile_counters`` command recounts
+everything to repair drift.
+"""
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Company, Client, List
+
+Membership = List.clients.through
+
+
+def _adjust(model, deltas):
+    """Apply ``{pk: delta}`` to ``client_count`` in a single UPDATE"""
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+    delta = Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    # Never go negative, drift is repaired by reconcile_counters
+    model.objects.filter(pk__in=deltas).update(client_count=Greatest(F('client_count') + delta, 0))
+
+
+def adjust_list_counts(deltas):
+    _adjust(List, deltas)
+
+
+def adjust_company_counts(deltas):
+    _adjust(Company, deltas)
+
+
+def list_counts(memberships):
+    """``{list_id: rows}`` of a queryset over a List.clients-like table"""
+    return dict(memberships.order_by().values('list_id').annotate(n=Count('*')).values_list('list_id', 'n'))
+
+
+def _list_count_subquery():
+    return Coalesce(Subquery(
+        Membership.objects.filter(list_id=OuterRef('pk'))
+        .order_by().values('list_id').annotate(n=Count('*')).values('n')
+    ), 0)
+
+
+def _company_count_subquery():
+    return Coalesce(Subquery(
+        Client.objects.filter(company_id=OuterRef('pk'))
+        .order_by().values('company_id').annotate(n=Count('*')).values('n')
+    ), 0)
+
+
+def refresh_list_counts(list_ids=None):
+    """Recompute ``List.client_count`` exactly, for ``list_ids`` or every list"""
+    queryset = List.objects.all() if list_ids is None else List.objects.filter(pk__in=list_ids)
+    return queryset.update(client_count=_list_count_subquery())
+
+
+def refresh_company_counts(company_ids=None):
+    """Recompute ``Company.client_count`` exactly, for ``company_ids`` or every company"""
+    queryset = Company.objects.all()
+    if company_ids is not None:
+        queryset = queryset.filter(pk__in=[pk for pk in company_ids if pk is not None])
+    return queryset.update(client_count=_company_count_subquery())
+
+
+def drifted_lists():
+    """Lists whose stored count disagrees with the through table"""
+    return (
+        List.objects.annotate(actual=Count('clients'))
+        .exclude(client_count=F('actual'))
+        .values_list('pk', 'client_count', 'actual')
+    )
+
+
+def drifted_companies():
+    """Companies whose stored count disagrees with their clients"""
+    return (
+        Company.objects.annotate(actual=Count('clients'))
+        .exclude(client_count=F('actual'))
+        .values_list('pk', 'client_count', 'actual')
+    )
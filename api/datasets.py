@@ -0,0 +1,279 @@
+# datasets.py
+"""
+Synthetic datasets for benchmarking (see the ``generate_dataset`` command).
+
+The shape follows production data rather than uniform noise: company sizes
+follow a Zipf curve so a few companies hold most clients, list sizes fall
+off geometrically from ``max_list_size``, most clients carry one or more
+``social_media`` profiles, and a small share of clients are near-duplicates
+of earlier ones. Rows are written with ``bulk_create`` in chunks, then the
+counters and the search index are rebuilt once at the end. Generated rows
+bypass the change feed.
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_generation
+from .counters import refresh_company_counts, refresh_list_counts
+from .dedup import set_client_keys, set_company_keys
+from .models import Client, Company, List
+from .search import client_search
+
+Membership = List.clients.through
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+FIRST_NAMES = (
+    'Aarav', 'Aditi', 'Alice', 'Amir', 'Ana', 'Ben', 'Chen', 'Chloe', 'Daniel', 'Divya',
+    'Elena', 'Fatima', 'George', 'Hana', 'Ivan', 'Jin', 'Karan', 'Laura', 'Lucas', 'Maria',
+    'Meera', 'Mohammed', 'Nina', 'Omar', 'Priya', 'Rahul', 'Sara', 'Sofia', 'Tom', 'Wei',
+)
+LAST_NAMES = (
+    'Ahmed', 'Brown', 'Chen', 'Costa', 'Das', 'Garcia', 'Gupta', 'Ivanova', 'Jones', 'Kim',
+    'Kumar', 'Lee', 'Martin', 'Menon', 'Muller', 'Nair', 'Nguyen', 'Patel', 'Rossi', 'Sato',
+    'Schmidt', 'Silva', 'Singh', 'Smith', 'Tanaka', 'Taylor', 'Wang', 'Williams', 'Wilson', 'Zhang',
+)
+JOB_ROLES = (
+    'CEO', 'CTO', 'CFO', 'COO', 'Founder', 'VP Sales', 'VP Marketing', 'Head of Growth',
+    'Marketing Manager', 'Sales Manager', 'Account Executive', 'Product Manager',
+    'Engineering Manager', 'Software Engineer', 'Data Analyst', 'HR Manager', 'Consultant',
+)
+STATUSES = ('new', 'contacted', 'qualified', 'proposal', 'negotiation', 'won', 'lost')
+LEAD_OWNERS = ('alex', 'bianca', 'chris', 'deepa', 'erik', 'farah', 'gabriel', 'hiro', 'isha', 'jonas')
+LOCATIONS = (
+    'Bangalore', 'Berlin', 'Chennai', 'Dubai', 'Kochi', 'London', 'Mumbai', 'New York',
+    'Paris', 'San Francisco', 'Singapore', 'Sydney', 'Tokyo', 'Toronto',
+)
+INDUSTRIES = (
+    'Software', 'Fintech', 'Healthcare', 'Retail', 'Manufacturing', 'Education',
+    'Logistics', 'Media', 'Real Estate', 'Energy', 'Hospitality', 'Consulting',
+)
+COMPANY_WORDS = (
+    'Acme', 'Apex', 'Blue', 'Bright', 'Cloud', 'Core', 'Delta', 'Echo', 'Global', 'Green',
+    'Nova', 'Orbit', 'Peak', 'Prime', 'Quantum', 'Red', 'Silver', 'Summit', 'Vertex', 'Zen',
+)
+COMPANY_SUFFIXES = ('Labs', 'Systems', 'Solutions', 'Technologies', 'Group', 'Works', 'Inc', 'Ltd')
+FREE_EMAIL_DOMAINS = ('gmail.com', 'yahoo.com', 'outlook.com', 'hotmail.com')
+FOLDERS = ('Campaigns', 'Events', 'Outbound', 'Partners', 'Webinars', None)
+REMARKS = (
+    'Asked for a demo next quarter', 'Follow up after the conference', 'Budget approved',
+    'Prefers email over calls', 'Evaluating competitors', 'Referred by an existing customer',
+)
+
+# Share of clients having each platform in social_media
+PLATFORMS = (
+    ('linkedin', 0.7), ('twitter', 0.3), ('facebook', 0.15),
+    ('instagram', 0.1), ('github', 0.08), ('youtube', 0.03), ('mastodon', 0.01),
+)
+NURTURING_STAGES = (('warm', 0.5), ('cold', 0.3), ('hot', 0.2))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the generated created_at / updated_at values"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    """Writes a reproducible synthetic dataset, ``seed`` fixes every choice"""
+
+    def __init__(self, clients=10_000, companies=None, lists=20, max_list_size=500_000,
+                 segments=2, duplicate_rate=0.02, days=730, batch_size=5000, seed=0, log=None):
+        self.clients = clients
+        self.companies = companies if companies is not None else max(1, clients // 20)
+        self.lists = lists
+        self.max_list_size = min(max_list_size, clients)
+        self.segments = segments
+        self.duplicate_rate = duplicate_rate
+        self.days = days
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def chunks(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def timestamps(self):
+        created = self.now - timedelta(seconds=self.random.randrange(self.days * 86400))
+        updated = created + timedelta(seconds=self.random.randrange(int((self.now - created).total_seconds()) + 1))
+        return created, updated
+
+    def weighted(self, choices):
+        values, weights = zip(*choices)
+        return self.random.choices(values, weights)[0]
+
+    # ----- companies -----
+
+    def build_company(self, index):
+        name = f'{self.random.choice(COMPANY_WORDS)} {self.random.choice(COMPANY_SUFFIXES)} {index}'
+        slug = name.lower().replace(' ', '')
+        created, updated = self.timestamps()
+        company = Company(
+            company_name=name,
+            domain=f'https://www.{slug}.com' if self.random.random() < 0.9 else None,
+            location=self.random.choice(LOCATIONS),
+            industry=self.random.choice(INDUSTRIES),
+            company_email=f'info@{slug}.com' if self.random.random() < 0.6 else None,
+            created_at=created,
+            updated_at=updated,
+        )
+        set_company_keys(company)
+        return company
+
+    def create_companies(self):
+        """Returns ``[(id, email domain)]`` ordered from the largest company down"""
+        for start, size in self.chunks(self.companies):
+            with transaction.atomic():
+                Company.objects.bulk_create([self.build_company(start + i) for i in range(size)])
+            self.log(f'companies: {start + size}/{self.companies}')
+        return [
+            (pk, domain_key or f'{name.lower().replace(" ", "")}.com')
+            for pk, name, domain_key in Company.objects.order_by('id').values_list('id', 'company_name', 'domain_key')
+        ]
+
+    # ----- clients -----
+
+    def social_media(self, first, last):
+        handle = f'{first}{last}'.lower()
+        profiles = {}
+        for platform, share in PLATFORMS:
+            if self.random.random() < share:
+                profiles[platform] = f'https://{platform}.com/{handle}{self.random.randrange(1000)}'
+        return profiles
+
+    def build_client(self, company):
+        first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+        company_id, domain = company if company else (None, self.random.choice(FREE_EMAIL_DOMAINS))
+        created, updated = self.timestamps()
+        client = Client(
+            company_id=company_id,
+            client=f'{first} {last}',
+            job_role=self.random.choice(JOB_ROLES),
+            phone=f'+91{self.random.randrange(6_000_000_000, 9_999_999_999)}',
+            email=f'{first}.{last}{self.random.randrange(100_000)}@{domain}'.lower(),
+            social_media=self.social_media(first, last),
+            status=self.random.choice(STATUSES),
+            remarks=self.random.choice(REMARKS) if self.random.random() < 0.2 else None,
+            lead_owner=self.random.choice(LEAD_OWNERS),
+            nurturing_stage=self.weighted(NURTURING_STAGES),
+            created_at=created,
+            updated_at=updated,
+        )
+        set_client_keys(client)
+        return client
+
+    def build_duplicate(self, original):
+        """Same person entered again: different case, phone formatting and timestamp"""
+        created, updated = self.timestamps()
+        duplicate = Client(
+            company_id=original.company_id,
+            client=original.client.upper() if self.random.random() < 0.5 else original.client,
+            job_role=original.job_role,
+            phone=f'{original.phone[:3]} {original.phone[3:8]} {original.phone[8:]}',
+            email=original.email.upper() if self.random.random() < 0.5 else original.email,
+            social_media=original.social_media,
+            status=self.random.choice(STATUSES),
+            lead_owner=self.random.choice(LEAD_OWNERS),
+            nurturing_stage=original.nurturing_stage,
+            created_at=created,
+            updated_at=updated,
+        )
+        set_client_keys(duplicate)
+        return duplicate
+
+    def create_clients(self, companies):
+        # Zipf weights: the n-th largest company gets a share proportional to 1 / n
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(companies) + 1)))
+        recent = []
+        for start, size in self.chunks(self.clients):
+            rows = []
+            for _ in range(size):
+                if recent and self.random.random() < self.duplicate_rate:
+                    rows.append(self.build_duplicate(self.random.choice(recent)))
+                    continue
+                company = None
+                if companies and self.random.random() < 0.95:
+                    company = self.random.choices(companies, cum_weights=cum_weights)[0]
+                rows.append(self.build_client(company))
+            recent = rows[-1000:]
+            with transaction.atomic():
+                Client.objects.bulk_create(rows)
+            self.log(f'clients: {start + size}/{self.clients}')
+
+    # ----- lists -----
+
+    def list_sizes(self):
+        """Geometric fall-off from max_list_size, the smallest lists stay non-empty"""
+        return [max(1, int(self.max_list_size / 2 ** (index / 2))) for index in range(self.lists)]
+
+    def create_lists(self):
+        client_ids = list(Client.objects.order_by().values_list('id', flat=True))
+        table = connection.ops.quote_name(Membership._meta.db_table)
+        list_ids = []
+        for index, size in enumerate(self.list_sizes()):
+            created, updated = self.timestamps()
+            list_obj = List.objects.create(
+                name=f'List {index + 1}', folder=self.random.choice(FOLDERS),
+                created_at=created, updated_at=updated,
+            )
+            list_ids.append(list_obj.pk)
+            members = self.random.sample(client_ids, min(size, len(client_ids)))
+            for start in range(0, len(members), self.batch_size):
+                # Plain executemany, model instances cost more than the insert itself
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(
+                        f'INSERT INTO {table} (list_id, client_id) VALUES (%s, %s)',
+                        [(list_obj.pk, client_id) for client_id in members[start:start + self.batch_size]]
+                    )
+            self.log(f'lists: {index + 1}/{self.lists} ({len(members)} members)')
+        return list_ids
+
+    def create_segments(self):
+        # Saving a segment materializes its members (see api/signals.py)
+        definitions = (
+            {'nurturing_stage': 'hot', 'platform': 'linkedin'},
+            {'status': 'qualified'},
+            {'lead_owner__exact': 'alex', 'has_social': 'true'},
+        )
+        for index in range(self.segments):
+            filters = definitions[index % len(definitions)]
+            List.objects.create(name=f'Segment {index + 1}', folder='Segments', kind='segment', filters=filters)
+            self.log(f'segments: {index + 1}/{self.segments}')
+
+    def run(self):
+        """Generate everything, returns row counts per model"""
+        with explicit_timestamps(Company, Client, List):
+            companies = self.create_companies()
+            self.create_clients(companies)
+            list_ids = self.create_lists()
+
+        self.log('refreshing counters and the search index')
+        refresh_company_counts()
+        refresh_list_counts(list_ids)
+        client_search.rebuild()
+        self.create_segments()
+        bump_generation('client', 'company', 'list')
+        return {
+            'companies': self.companies,
+            'clients': self.clients,
+            'lists': self.lists + self.segments,
+            'memberships': Membership.objects.count(),
+        }
@@ -0,0 +1,376 @@
+# dedup.py
+"""
+Duplicate detection and merging for clients and companies.
+
+Every row stores normalized blocking keys (``Client.email_key`` /
+``phone_key``, ``Company.domain_key``). Candidate pairs are only generated
+inside a block of rows sharing a key, scored with ``difflib`` and stored as
+``ClientDuplicate`` / ``CompanyDuplicate`` rows. Saves and bulk writes check
+just the rows they touched (see api/signals.py); ``find_duplicates`` scans
+everything. Merging re-points companies and list memberships in bulk SQL.
+"""
+import re
+from abc import ABC, abstractmethod
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .changes import log_memberships, record_tombstones
+from .counters import list_counts
+from .models import ArchivedClient, Client, ClientDuplicate, Company, CompanyDuplicate, List
+from .writes import serialized_writes
+
+try:
+    import phonenumbers
+except ImportError:
+    phonenumbers = None
+
+Membership = List.clients.through
+
+# Keep IN (...) lists under SQLite's variable limit
+KEY_CHUNK_SIZE = 500
+
+# Mail providers whose domain says nothing about the company
+FREE_EMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'yahoo.com', 'hotmail.com', 'outlook.com',
+    'live.com', 'icloud.com', 'aol.com', 'proton.me', 'protonmail.com', 'zoho.com',
+}
+
+# Second-level labels under country TLDs, e.g. example.co.uk
+_SECOND_LEVEL = {'co', 'com', 'org', 'net', 'ac', 'gov', 'edu', 'ltd', 'plc', 'nic', 'gen'}
+
+_COMPANY_SUFFIXES = re.compile(
+    r'\b(inc|incorporated|llc|ltd|limited|pvt|private|corp|corporation|co|company|gmbh|plc)\b'
+)
+
+
+# ========== BLOCKING KEYS ==========
+def email_key(email):
+    """Lowercased, trimmed address"""
+    if not email or '@' not in email:
+        return None
+    return email.strip().lower()[:254]
+
+
+def phone_key(phone, country_code=None):
+    """
+    E.164 (``+<country><number>``) when the country is known, else the bare
+    digits. Numbers are parsed and validated with ``phonenumbers`` (pinned
+    in requirements.txt); an install without it digit-normalizes them, with
+    DEDUP_DEFAULT_COUNTRY_CODE prefixed to national numbers, and gets the
+    api.W001 warning (see api/checks.py).
+    """
+    if not phone:
+        return None
+    if country_code is None:
+        country_code = getattr(settings, 'DEDUP_DEFAULT_COUNTRY_CODE', '')
+    if phonenumbers is not None:
+        try:
+            region = phonenumbers.region_code_for_country_code(int(country_code)) if country_code else None
+            number = phonenumbers.parse(phone, region)
+            if phonenumbers.is_possible_number(number):
+                return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+        except (phonenumbers.NumberParseException, ValueError):
+            pass
+    stripped = phone.strip()
+    digits = re.sub(r'\D', '', stripped)
+    if stripped.startswith('+'):
+        key = '+' + digits
+    elif digits.startswith('00'):
+        key = '+' + digits[2:]
+    elif country_code:
+        key = '+' + country_code + digits.lstrip('0')
+    else:
+        key = digits.lstrip('0')
+    return key if 7 <= len(key.lstrip('+')) <= 15 else None
+
+
+def registrable_domain(value):
+    """``https://www.Example.co.uk/about`` -> ``example.co.uk``"""
+    if not value:
+        return None
+    host = value.strip().lower()
+    if '@' in host:
+        host = host.rsplit('@', 1)[1]
+    host = re.sub(r'^[a-z][a-z0-9+.-]*://', '', host)
+    host = host.split('/', 1)[0].split(':', 1)[0].strip('.')
+    labels = [label for label in host.split('.') if label]
+    if len(labels) < 2:
+        return None
+    size = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL else 2
+    return '.'.join(labels[-size:])[:100]
+
+
+def company_domain_key(domain, company_email=None):
+    """The company's website domain, or its non-webmail email domain"""
+    if key := registrable_domain(domain):
+        return key
+    key = registrable_domain(company_email)
+    return key if key not in FREE_EMAIL_DOMAINS else None
+
+
+def set_client_keys(client):
+    client.email_key = email_key(client.email)
+    client.phone_key = phone_key(client.phone)
+
+
+def set_company_keys(company):
+    company.domain_key = company_domain_key(company.domain, company.company_email)
+
+
+# ========== SCORING ==========
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _company_name(name):
+    name = _COMPANY_SUFFIXES.sub('', (name or '').lower())
+    return re.sub(r'[^a-z0-9]+', ' ', name).strip()
+
+
+def score_clients(a, b):
+    """Score two client rows, returns ``(score, reasons)``"""
+    score, reasons = 0.0, []
+    if a['email_key'] and a['email_key'] == b['email_key']:
+        score += 0.6
+        reasons.append('email')
+    if a['phone_key'] and a['phone_key'] == b['phone_key']:
+        score += 0.3
+        reasons.append('phone')
+    name = _similarity((a['client'] or '').strip().lower(), (b['client'] or '').strip().lower())
+    score += 0.2 * name
+    if name >= 0.85:
+        reasons.append('name')
+    if a['company_id'] and a['company_id'] == b['company_id']:
+        score += 0.1
+        reasons.append('company')
+    return min(round(score, 3), 1.0), reasons
+
+
+def score_companies(a, b):
+    """Score two company rows, returns ``(score, reasons)``"""
+    score, reasons = 0.0, []
+    if a['domain_key'] and a['domain_key'] == b['domain_key']:
+        score += 0.7
+        reasons.append('domain')
+    name = _similarity(_company_name(a['company_name']), _company_name(b['company_name']))
+    score += 0.3 * name
+    if name >= 0.85:
+        reasons.append('name')
+    return min(round(score, 3), 1.0), reasons
+
+
+# ========== CANDIDATES ==========
+class Deduplicator(ABC):
+    """Blocking, scoring and merging for one model"""
+    model = None
+    candidate_model = None
+    keys = ()
+    fields = ()
+
+    def __init__(self, min_score=None, max_block_size=None):
+        self.min_score = min_score if min_score is not None else getattr(settings, 'DEDUP_MIN_SCORE', 0.5)
+        self.max_block_size = max_block_size or getattr(settings, 'DEDUP_MAX_BLOCK_SIZE', 50)
+
+    @abstractmethod
+    def score(self, a, b):
+        """``(score, reasons)`` of two row dicts holding ``fields``"""
+
+    def block_values(self, key, ids=None):
+        """Values of ``key`` shared by 2..max_block_size rows, optionally only those of ``ids``"""
+        queryset = self.model.objects.exclude(**{f'{key}__isnull': True})
+        if ids is not None:
+            values = set(self.model.objects.filter(id__in=ids).exclude(**{f'{key}__isnull': True})
+                         .values_list(key, flat=True))
+            if not values:
+                return []
+            queryset = queryset.filter(**{f'{key}__in': values})
+        # Huge blocks (info@..., a switchboard number) say nothing about identity
+        return list(
+            queryset.order_by().values(key).annotate(n=Count('id'))
+            .filter(n__gt=1, n__lte=self.max_block_size).values_list(key, flat=True)
+        )
+
+    def pairs(self, ids=None):
+        """Yield ``(a, b)`` row dicts sharing a key, each pair once, ``a['id'] < b['id']``"""
+        ids = set(ids) if ids is not None else None
+        seen = set()
+        for key in self.keys:
+            values = self.block_values(key, ids)
+            for start in range(0, len(values), KEY_CHUNK_SIZE):
+                chunk = values[start:start + KEY_CHUNK_SIZE]
+                blocks = {}
+                rows = self.model.objects.filter(**{f'{key}__in': chunk}).order_by('id').values('id', *self.fields)
+                for row in rows:
+                    blocks.setdefault(row[key], []).append(row)
+                for block in blocks.values():
+                    for a, b in combinations(block, 2):
+                        if (a['id'], b['id']) in seen:
+                            continue
+                        if ids is not None and a['id'] not in ids and b['id'] not in ids:
+                            continue
+                        seen.add((a['id'], b['id']))
+                        yield a, b
+
+    def find(self, ids=None):
+        """Record scored candidate pairs, returns how many passed ``min_score``"""
+        if ids is not None:
+            ids = list(ids)
+            return sum(self._find(ids[start:start + KEY_CHUNK_SIZE])
+                       for start in range(0, len(ids), KEY_CHUNK_SIZE))
+        return self._find(None)
+
+    def _find(self, ids):
+        candidates = []
+        for a, b in self.pairs(ids):
+            score, reasons = self.score(a, b)
+            if score >= self.min_score:
+                candidates.append(self.candidate_model(
+                    first_id=a['id'], second_id=b['id'], score=score, reasons=reasons,
+                ))
+        # Existing pairs keep their status, a dismissed pair stays dismissed
+        self.candidate_model.objects.bulk_create(candidates, batch_size=KEY_CHUNK_SIZE, ignore_conflicts=True)
+        return len(candidates)
+
+    @abstractmethod
+    def merge(self, keep_id, merge_ids):
+        """Fold ``merge_ids`` into ``keep_id``, returns how many rows were merged"""
+
+    def merge_candidates(self, min_score):
+        """Merge every open pair scoring ``min_score`` or more into its older row"""
+        merged = 0
+        pairs = (self.candidate_model.objects.filter(status='open', score__gte=min_score)
+                 .order_by('first_id', 'second_id').values_list('first_id', 'second_id'))
+        # Follow chains (a=b, b=c) to the surviving row
+        survivor = {}
+        for first_id, second_id in list(pairs):
+            keep = survivor.get(first_id, first_id)
+            other = survivor.get(second_id, second_id)
+            if keep == other:
+                continue
+            keep, other = min(keep, other), max(keep, other)
+            with serialized_writes():
+                self.merge(keep, [other])
+            for row_id, target in list(survivor.items()):
+                if target == other:
+                    survivor[row_id] = keep
+            survivor[other] = keep
+            merged += 1
+        return merged
+
+    def _fill_blanks(self, keep, others, fields):
+        """Copy values missing on ``keep`` from ``others``, returns changed field names"""
+        changed = []
+        for field in fields:
+            if getattr(keep, field) in (None, '', {}):
+                for other in others:
+                    if getattr(other, field) not in (None, '', {}):
+                        setattr(keep, field, getattr(other, field))
+                        changed.append(field)
+                        break
+        return changed
+
+
+class ClientDeduplicator(Deduplicator):
+    model = Client
+    candidate_model = ClientDuplicate
+    keys = ('email_key', 'phone_key')
+    fields = ('client', 'email_key', 'phone_key', 'company_id')
+
+    def score(self, a, b):
+        return score_clients(a, b)
+
+    def merge(self, keep_id, merge_ids):
+        """Fold ``merge_ids`` into ``keep_id``: memberships move, blanks are filled, the rest is deleted"""
+        from .signals import bulk_client_changes, clients_changed, memberships_changed
+
+        merge_ids = [pk for pk in merge_ids if pk != keep_id]
+        if not merge_ids:
+            return 0
+        using = router.db_for_write(Membership)
+        connection = connections[using]
+        table = connection.ops.quote_name(Membership._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(merge_ids))
+
+        with transaction.atomic(using=using):
+            keep = Client.objects.select_for_update().get(pk=keep_id)
+            others = list(Client.objects.filter(id__in=merge_ids).order_by('created_at'))
+            # The merged clients' memberships go, keep joins the lists it was not in
+            removed = list_counts(Membership.objects.filter(client_id__in=merge_ids))
+            kept = set(Membership.objects.filter(client_id=keep_id).values_list('list_id', flat=True))
+            deltas = {list_id: (list_id not in kept) - count for list_id, count in removed.items()}
+            select = (
+                f"SELECT DISTINCT m.list_id AS list_id, %s AS client_id FROM {table} m "
+                f"WHERE m.client_id IN ({placeholders}) "
+                f"AND NOT EXISTS (SELECT 1 FROM {table} x WHERE x.list_id = m.list_id AND x.client_id = %s)"
+            )
+            params = [keep_id, *merge_ids, keep_id]
+            log_memberships(using, 'add', select, params)
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table} (list_id, client_id) {select}", params)
+
+            changed = self._fill_blanks(keep, others, (
+                'company_id', 'client', 'job_role', 'phone', 'email', 'status', 'remarks', 'lead_owner',
+            ))
+            social_media = dict(keep.social_media or {})
+            for other in others:
+                for platform, handle in (other.social_media or {}).items():
+                    social_media.setdefault(platform, handle)
+            if social_media != (keep.social_media or {}):
+                keep.social_media = social_media
+                changed.append('social_media')
+
+            company_ids = {keep.company_id, *(other.company_id for other in others)} - {None}
+            with bulk_client_changes():
+                Client.objects.filter(id__in=[other.pk for other in others]).delete()
+                record_tombstones('client', [other.pk for other in others])
+                if changed:
+                    keep.save()
+
+            clients_changed.send(sender=Client, client_ids=[keep_id, *merge_ids], company_ids=company_ids)
+            if deltas:
+                memberships_changed.send(sender=List, deltas=deltas, using=using)
+        return len(others)
+
+
+class CompanyDeduplicator(Deduplicator):
+    model = Company
+    candidate_model = CompanyDuplicate
+    keys = ('domain_key',)
+    fields = ('company_name', 'domain_key')
+
+    def score(self, a, b):
+        return score_companies(a, b)
+
+    def merge(self, keep_id, merge_ids):
+        """Fold ``merge_ids`` into ``keep_id``: clients are re-pointed, blanks are filled, the rest is deleted"""
+        from .signals import clients_changed
+
+        merge_ids = [pk for pk in merge_ids if pk != keep_id]
+        if not merge_ids:
+            return 0
+        with transaction.atomic():
+            keep = Company.objects.select_for_update().get(pk=keep_id)
+            others = list(Company.objects.filter(id__in=merge_ids).order_by('created_at'))
+            moved = list(Client.objects.filter(company_id__in=merge_ids).values_list('id', flat=True))
+            Client.objects.filter(company_id__in=merge_ids).update(company_id=keep_id, updated_at=timezone.now())
+            ArchivedClient.objects.filter(company_id__in=merge_ids).update(company_id=keep_id)
+
+            if self._fill_blanks(keep, others, ('domain', 'location', 'industry', 'company_email')):
+                keep.save()
+            # Nothing cascades any more, the clients have moved
+            Company.objects.filter(id__in=[other.pk for other in others]).delete()
+            clients_changed.send(sender=Client, client_ids=moved, company_ids=[keep_id, *merge_ids])
+        return len(others)
+
+
+DEDUPLICATORS = {
+    'client': ClientDeduplicator,
+    'company': CompanyDeduplicator,
+}
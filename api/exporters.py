@@ -0,0 +1,178 @@
+# exporters.py
+"""
+Streaming export of clients as CSV or JSON lines.
+
+Rows come from ``.values()`` joined to the company and are fetched with
+``.iterator(chunk_size=...)``, so no model instances are built and memory
+stays flat whatever the size of the export. ``astream_export()`` is the
+same export for async views, read with ``.aiterator()``.
+"""
+import csv
+import itertools
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+    'ndjson': 'application/x-ndjson',
+}
+
+# (output column, ORM lookup)
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('client', 'client'),
+    ('job_role', 'job_role'),
+    ('phone', 'phone'),
+    ('email', 'email'),
+    ('social_media', 'social_media'),
+    ('status', 'status'),
+    ('remarks', 'remarks'),
+    ('lead_owner', 'lead_owner'),
+    ('nurturing_stage', 'nurturing_stage'),
+    ('company_id', 'company_id'),
+    ('company_name', 'company__company_name'),
+    ('company_location', 'company__location'),
+    ('company_industry', 'company__industry'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+class Echo:
+    """File-like object whose write() hands the line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def _isoformat(value):
+    # Same representation as DRF's DateTimeField
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def export_rows(queryset):
+    """Yield one dict per client, keyed by output column"""
+    names = [name for name, _ in EXPORT_COLUMNS]
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    rows = queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield dict(zip(names, row))
+
+
+async def aexport_rows(queryset):
+    """Async ``export_rows()``"""
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    # values_list() runs its query before aiterator() hands it to a thread
+    rows = queryset.values(*[lookup for _, lookup in EXPORT_COLUMNS]).aiterator(chunk_size=chunk_size)
+    async for row in rows:
+        yield {name: row[lookup] for name, lookup in EXPORT_COLUMNS}
+
+
+async def _achain(*iterables):
+    for iterable in iterables:
+        async for item in iterable:
+            yield item
+
+
+def _batched(lines, size):
+    # Fewer, larger writes to the socket
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+async def _abatched(lines, size):
+    batch = []
+    async for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def csv_header():
+    return [name for name, _ in EXPORT_COLUMNS]
+
+
+def csv_row(row):
+    if row['social_media'] is not None:
+        row['social_media'] = json.dumps(row['social_media'])
+    for key in ('created_at', 'updated_at'):
+        if row[key] is not None:
+            row[key] = _isoformat(row[key])
+    return row.values()
+
+
+def json_line(row):
+    for key in ('created_at', 'updated_at'):
+        if row[key] is not None:
+            row[key] = _isoformat(row[key])
+    return dumps(row).decode() + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(csv_header())
+    for row in rows:
+        yield writer.writerow(csv_row(row))
+
+
+def json_lines(rows):
+    for row in rows:
+        yield json_line(row)
+
+
+async def acsv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(csv_header())
+    async for row in rows:
+        yield writer.writerow(csv_row(row))
+
+
+async def ajson_lines(rows):
+    async for row in rows:
+        yield json_line(row)
+
+
+def _export_response(content, file_format, filename):
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+def stream_export(queryset, file_format, filename, archived=None):
+    """Return a ``StreamingHttpResponse`` exporting ``queryset``, then ``archived`` if given"""
+    rows = export_rows(queryset)
+    if archived is not None:
+        rows = itertools.chain(rows, export_rows(archived))
+    lines = csv_lines(rows) if file_format == 'csv' else json_lines(rows)
+    return _export_response(
+        _batched(lines, getattr(settings, 'EXPORT_WRITE_BATCH', 100)), file_format, filename
+    )
+
+
+def astream_export(queryset, file_format, filename, archived=None):
+    """``stream_export()`` with an async body, for async views"""
+    rows = aexport_rows(queryset)
+    if archived is not None:
+        rows = _achain(rows, aexport_rows(archived))
+    lines = acsv_lines(rows) if file_format == 'csv' else ajson_lines(rows)
+    return _export_response(
+        _abatched(lines, getattr(settings, 'EXPORT_WRITE_BATCH', 100)), file_format, filename
+    )
@@ -0,0 +1,65 @@
+# facets.py
+"""Grouped counts for the client filters, one GROUP BY per facet"""
+import functools
+from collections import Counter
+
+from django.db import connections
+from django.db.models import Count
+
+FACET_FIELDS = ['nurturing_stage', 'lead_owner', 'status', 'company__industry', 'company__location']
+
+PLATFORM_FACET = 'platform'
+
+
+def field_facet(queryset, lookup, limit):
+    rows = (
+        queryset.order_by()
+        .values(lookup)
+        .annotate(count=Count('id'))
+        .order_by('-count', lookup)[:limit]
+    )
+    return [{'value': row[lookup], 'count': row['count']} for row in rows]
+
+
+def platform_facet(queryset, limit):
+    """Count clients per ``social_media`` key"""
+    connection = connections[queryset.db]
+    subquery, params = queryset.order_by().values('id').query.sql_with_params()
+
+    if connection.vendor == 'sqlite':
+        sql = (
+            "SELECT j.key, COUNT(*) AS n FROM api_client c, json_each(c.social_media) j "
+            f"WHERE c.id IN ({subquery}) AND json_type(c.social_media) = 'object' "
+            "GROUP BY j.key ORDER BY n DESC, j.key LIMIT %s"
+        )
+    elif connection.vendor == 'mysql':
+        sql = (
+            "SELECT jt.k, COUNT(*) AS n FROM api_client c, "
+            "JSON_TABLE(JSON_KEYS(c.social_media), '$[*]' COLUMNS (k VARCHAR(100) PATH '$')) jt "
+            f"WHERE c.id IN ({subquery}) GROUP BY jt.k ORDER BY n DESC, jt.k LIMIT %s"
+        )
+    else:
+        counts = Counter()
+        for social_media in queryset.values_list('social_media', flat=True).iterator():
+            if isinstance(social_media, dict):
+                counts.update(social_media.keys())
+        return [{'value': key, 'count': count} for key, count in counts.most_common(limit)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return [{'value': key, 'count': count} for key, count in cursor.fetchall()]
+
+
+def facet_queries(queryset, limit):
+    """Facet name -> callable running its query, they don't depend on each other"""
+    queries = {lookup: functools.partial(field_facet, queryset, lookup, limit) for lookup in FACET_FIELDS}
+    queries[PLATFORM_FACET] = functools.partial(platform_facet, queryset, limit)
+    return queries
+
+
+def compute_facets(queryset, limit=50):
+    facets = {name: query() for name, query in facet_queries(queryset, limit).items()}
+    return {
+        'count': queryset.order_by().count(),
+        'facets': facets,
+    }
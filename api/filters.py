@@ -0,0 +1,243 @@
+# filters.py
+"""
+Client filtering shared by the list, list-members, facets, export, batch
+and segment code.
+
+Every filter param is declared once below with the operator that fits its
+column: ``contains`` scans, ``equals`` / ``exact`` / ``prefix`` comparisons
+served by the indexes in api/models.py, ``json_key`` lookups served by the
+platform indexes in api/indexes.py and full-text ``search``. A
+FilterCompiler turns query params into a FilterPlan, a canonical tuple of
+steps in declaration order, and caches plans by param signature. Applying
+a plan builds the conditions, so vendor checks (is the search index there?)
+still happen per query.
+"""
+import functools
+import sys
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .indexes import INDEXED_PLATFORMS, platform_q
+from .search import client_search
+
+# ``field`` is the model field, ``company__...`` fields are matched through
+# an id subquery on the company table. ``operator`` handles ``?<param>=``
+# (None when only the suffixed forms exist) and ``suffixes`` the accepted
+# ``?<param>__<operator>=`` forms. ``folded`` columns are stored lowercased
+# already, so exact / prefix compare them directly instead of Lower().
+Filter = namedtuple('Filter', 'field operator suffixes index folded', defaults=((), None, False))
+
+# One step of a plan, ``value`` is normalized for the operator
+Step = namedtuple('Step', 'param operator field value index')
+
+OPERATORS = ('exact', 'prefix')
+
+CLIENT_FILTERS = {
+    'q': Filter('q', 'search', index='full-text'),
+    'search': Filter('search', 'search', index='full-text'),
+    'nurturing_stage': Filter('nurturing_stage', 'equals', index='api_client_stage_created_idx'),
+    'role': Filter('job_role', 'contains', OPERATORS, 'api_client_role_lower_idx'),
+    'status': Filter('status', 'contains', OPERATORS, 'api_client_status_lower_idx'),
+    'lead_owner': Filter('lead_owner', 'contains', OPERATORS, 'api_client_owner_lower_idx'),
+    'company': Filter('company__company_name', 'contains', OPERATORS, 'api_company_name_lower_idx'),
+    # Client has no location of its own, only its company's
+    'location': Filter('company__location', 'contains', OPERATORS, 'api_company_location_lower_idx'),
+    'industry': Filter('company__industry', 'contains', OPERATORS, 'api_company_industry_lower_idx'),
+    'email': Filter('email_key', None, OPERATORS, 'email_key', folded=True),
+    'remarks': Filter('remarks', 'contains'),
+    'has_social': Filter('social_media', 'has_social'),
+    'platform': Filter('social_media', 'json_key'),
+    # The list-members endpoint's name for ``platform``
+    'media': Filter('social_media', 'json_key'),
+}
+
+LIST_FILTERS = {
+    'kind': Filter('kind', 'equals', index='api_list_kind_created_idx'),
+    'folder': Filter('folder', 'contains', OPERATORS, 'api_list_folder_lower_idx'),
+    'name': Filter('name', 'contains'),
+}
+
+# Distinct filter signatures kept per compiler
+PLAN_CACHE_SIZE = 1024
+
+EXPLAIN_VALUES = ('1', 'true')
+
+
+def prefix_range(prefix):
+    """
+    ``(low, high)`` such that ``low <= value < high`` iff value starts with
+    prefix. ``high`` is None when nothing sorts after the prefix (it is all
+    U+10FFFF), then ``low <= value`` alone matches.
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+    code = ord(stem[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        # Surrogates can't be stored, U+E000 is the next character after U+D7FF
+        code = 0xE000
+    return prefix, stem[:-1] + chr(code)
+
+
+def _column_filter(queryset, field, build):
+    """Filter on ``field``, a related field through an id subquery on its table"""
+    relation, _, column = field.rpartition('__')
+    if not relation:
+        return build(queryset, column)
+    # A LEFT JOIN would hide the related index, match the ids instead
+    related = queryset.model._meta.get_field(relation).related_model
+    matching = build(related.objects.all(), column).values('id')
+    return queryset.filter(**{f'{relation}_id__in': matching})
+
+
+def _folded(queryset, column, folded):
+    """Name to compare lowercased values against"""
+    if folded:
+        return queryset, column
+    alias = f'{column}_folded'
+    return queryset.alias(**{alias: Lower(column)}), alias
+
+
+def apply_step(queryset, step, folded=False):
+    operator, value = step.operator, step.value
+
+    if operator in ('search', 'ranked_search'):
+        return client_search.filter(queryset, value, step.field, ranked=operator == 'ranked_search')
+
+    if operator == 'json_key':
+        return queryset.filter(platform_q(value))
+
+    if operator == 'has_social':
+        return queryset.filter(~Q(social_media__isnull=True) & ~Q(social_media={}))
+
+    def build(queryset, column):
+        if operator == 'contains':
+            return queryset.filter(**{f'{column}__icontains': value})
+        if operator == 'equals':
+            return queryset.filter(**{column: value})
+        queryset, name = _folded(queryset, column, folded)
+        if operator == 'exact':
+            return queryset.filter(**{name: value})
+        low, high = prefix_range(value)
+        if high is None:
+            return queryset.filter(**{f'{name}__gte': low})
+        return queryset.filter(**{f'{name}__gte': low, f'{name}__lt': high})
+
+    return _column_filter(queryset, step.field, build)
+
+
+class FilterPlan:
+    """The filter steps compiled from one param signature"""
+
+    def __init__(self, steps, filters):
+        self.steps = steps
+        self.filters = filters
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    def apply(self, queryset):
+        for step in self.steps:
+            queryset = apply_step(queryset, step, folded=self.filters[step.param].folded)
+        return queryset
+
+    def describe(self):
+        """What each step does, for ``?explain=1``"""
+        return [
+            {
+                'param': step.param,
+                'operator': step.operator,
+                'field': step.field,
+                'value': step.value,
+                'index': step.index,
+            }
+            for step in self.steps
+        ]
+
+
+class FilterCompiler:
+    """Compiles query params into FilterPlans for one set of declared filters"""
+
+    def __init__(self, filters, cache_size=PLAN_CACHE_SIZE):
+        self.filters = filters
+        self._compile = functools.lru_cache(maxsize=cache_size)(self._build)
+
+    @property
+    def params(self):
+        """Every query param the filters accept"""
+        names = []
+        for param, definition in self.filters.items():
+            if definition.operator:
+                names.append(param)
+            names.extend(f'{param}__{suffix}' for suffix in definition.suffixes)
+        return tuple(names)
+
+    def signature(self, params):
+        """Canonical ``((param, operator, value), ...)`` of the filters in use"""
+        items = []
+        for param, definition in self.filters.items():
+            if definition.operator and (value := self._value(definition.operator, params.get(param))):
+                items.append((param, definition.operator, value))
+            for suffix in definition.suffixes:
+                if value := self._value(suffix, params.get(f'{param}__{suffix}')):
+                    items.append((param, suffix, value))
+        ranked = params.get('ordering') == 'relevance'
+        return tuple(items), ranked
+
+    def _value(self, operator, value):
+        if not isinstance(value, str):
+            return None
+        if operator == 'has_social':
+            return 'true' if value == 'true' else None
+        value = value.strip()
+        if operator in OPERATORS:
+            value = value.lower()
+        return value or None
+
+    def _build(self, signature):
+        items, ranked = signature
+        # Only the last search ranks, the way ``q`` and ``search`` always did
+        searches = [i for i, (_, operator, _) in enumerate(items) if operator == 'search']
+        steps = []
+        for position, (param, operator, value) in enumerate(items):
+            definition = self.filters[param]
+            if ranked and searches and position == searches[-1]:
+                operator = 'ranked_search'
+            steps.append(Step(param, operator, definition.field, value, self._index(definition, operator, value)))
+        return FilterPlan(tuple(steps), self.filters)
+
+    def _index(self, definition, operator, value):
+        """Index the operator is built to use, if any"""
+        if operator == 'json_key':
+            return f'api_client_sm_{value}_idx' if value in INDEXED_PLATFORMS else None
+        if operator == 'contains':
+            return None
+        return definition.index
+
+    def compile(self, params):
+        return self._compile(self.signature(params))
+
+    def filter(self, queryset, params):
+        return self.compile(params).apply(queryset)
+
+
+client_filters = FilterCompiler(CLIENT_FILTERS)
+list_filters = FilterCompiler(LIST_FILTERS)
+
+
+def wants_explain(params):
+    return getattr(settings, 'API_EXPLAIN', False) and params.get('explain', '').lower() in EXPLAIN_VALUES
+
+
+def explain(queryset, plan):
+    """The compiled filters, the SQL of ``queryset`` and the database's plan for it"""
+    sql, params = queryset.query.sql_with_params()
+    return {
+        'filters': plan.describe(),
+        'sql': sql,
+        'params': [str(param) for param in params],
+        'query_plan': queryset.explain().splitlines(),
+    }
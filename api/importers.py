@@ -0,0 +1,294 @@
+# importers.py
+"""
+Streaming bulk import of clients (and their companies) from CSV or JSONL.
+
+Rows are read lazily, validated in chunks, companies are resolved with one
+lookup per chunk and clients are written with ``bulk_create`` (one INSERT
+per row on backends that cannot return the new ids) inside a transaction
+per chunk, so memory stays bounded by the chunk size.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework import serializers
+
+from .dedup import registrable_domain, set_client_keys, set_company_keys
+from .models import Company, Client
+from .signals import bulk_client_changes, clients_changed
+from .writes import serialized_writes
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+COMPANY_FIELDS = ['company_name', 'domain', 'location', 'industry', 'company_email']
+
+
+class ClientImportRowSerializer(serializers.Serializer):
+    """Validates a single import row without touching the database"""
+    client = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    job_role = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    phone = serializers.CharField(max_length=15, required=False, allow_null=True, allow_blank=True)
+    email = serializers.EmailField(required=False, allow_null=True, allow_blank=True)
+    social_media = serializers.JSONField(required=False, allow_null=True)
+    status = serializers.CharField(max_length=50, required=False, allow_null=True, allow_blank=True)
+    remarks = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    lead_owner = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    nurturing_stage = serializers.ChoiceField(
+        choices=Client.NURTURING_STAGES, required=False, allow_null=True
+    )
+
+    # Company, either an existing id or fields to resolve / create it by
+    company_id = serializers.IntegerField(required=False, allow_null=True)
+    company_name = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    domain = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    location = serializers.CharField(max_length=150, required=False, allow_null=True, allow_blank=True)
+    industry = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    company_email = serializers.EmailField(required=False, allow_null=True, allow_blank=True)
+
+    def to_internal_value(self, data):
+        # CSV cells are strings, empty ones mean "not set"
+        data = {key: value for key, value in data.items() if key and value not in ('', None)}
+        if isinstance(data.get('social_media'), str):
+            try:
+                data['social_media'] = json.loads(data['social_media'])
+            except ValueError:
+                raise serializers.ValidationError({'social_media': ['Must be a JSON object.']})
+        return super().to_internal_value(data)
+
+    def validate_social_media(self, value):
+        if value is not None and not isinstance(value, dict):
+            raise serializers.ValidationError('Must be a JSON object.')
+        return value
+
+
+def read_rows(stream, file_format):
+    """Yield ``(line_number, row_dict)`` from a binary or text stream"""
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported format {file_format!r}')
+
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row
+
+
+def guess_format(filename, default='csv'):
+    """Pick an import format from a file name"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+class ImportResult:
+    """Counters and a bounded sample of row errors"""
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.companies_created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'companies_created': self.companies_created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+class ClientImporter:
+    """Chunked validate / resolve / bulk_create pipeline"""
+
+    def __init__(self, batch_size=None, on_error=None, on_created=None, max_errors=100):
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+        self.on_error = on_error
+        self.on_created = on_created
+        self.result = ImportResult(max_errors=max_errors)
+        self.row_serializer = ClientImportRowSerializer()
+
+    def run(self, rows):
+        """Import an iterable of ``(line_number, row)`` pairs"""
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.batch_size)):
+            self.import_chunk(chunk)
+        return self.result
+
+    def error(self, line_number, errors):
+        self.result.add_error(line_number, errors)
+        if self.on_error:
+            self.on_error(line_number, errors)
+
+    # ----- chunk pipeline -----
+
+    def validate_chunk(self, chunk):
+        valid = []
+        for line_number, row in chunk:
+            self.result.rows += 1
+            if not isinstance(row, dict):
+                self.error(line_number, {'non_field_errors': ['Row must be a JSON object.']})
+                continue
+            try:
+                valid.append((line_number, self.row_serializer.run_validation(row)))
+            except serializers.ValidationError as exc:
+                self.error(line_number, exc.detail)
+        return valid
+
+    def resolve_companies(self, valid):
+        """Map each row to a company id, creating missing companies in bulk"""
+        known_ids = {data['company_id'] for _, data in valid if data.get('company_id')}
+        if known_ids:
+            known_ids = set(Company.objects.filter(id__in=known_ids).values_list('id', flat=True))
+
+        keys = {self._company_key(data) for _, data in valid if not data.get('company_id')}
+        domains = {value for kind, value in filter(None, keys) if kind == 'domain'}
+        names = {value for kind, value in filter(None, keys) if kind == 'name'}
+        by_domain, by_name = self._lookup_companies(domains, names)
+
+        # Create whatever is still missing, once per key
+        missing = {}
+        for _, data in valid:
+            if data.get('company_id'):
+                continue
+            key = self._company_key(data)
+            if key and key not in by_domain and key not in by_name and key not in missing:
+                missing[key] = Company(**{field: data.get(field) for field in COMPANY_FIELDS})
+                if not missing[key].company_name:
+                    missing[key].company_name = data.get('domain')
+                set_company_keys(missing[key])
+        if missing:
+            created = Company.objects.bulk_create(missing.values())
+            if any(company.pk is None for company in created):
+                # Backends without RETURNING (MySQL) need a second lookup
+                new_domains = {k[1] for k in missing if k[0] == 'domain'}
+                new_names = {k[1] for k in missing if k[0] == 'name'}
+                more_domains, more_names = self._lookup_companies(new_domains, new_names)
+                by_domain.update(more_domains)
+                by_name.update(more_names)
+            else:
+                for key, company in missing.items():
+                    (by_domain if key[0] == 'domain' else by_name)[key] = company.pk
+
+        resolved = []
+        for line_number, data in valid:
+            company_id = data.get('company_id')
+            if company_id:
+                if company_id not in known_ids:
+                    self.error(line_number, {'company_id': [f'Invalid pk "{company_id}" - object does not exist.']})
+                    continue
+            elif key := self._company_key(data):
+                company_id = by_domain.get(key) or by_name.get(key)
+            resolved.append((line_number, data, company_id))
+        return resolved, len(missing)
+
+    def _company_key(self, data):
+        # Same registrable domain as Company.domain_key (see api/dedup.py)
+        if domain := registrable_domain(data.get('domain')):
+            return ('domain', domain)
+        if data.get('company_name'):
+            return ('name', data['company_name'].lower())
+        return None
+
+    def _lookup_companies(self, domains, names):
+        by_domain, by_name = {}, {}
+        if not domains and not names:
+            return by_domain, by_name
+        companies = (
+            Company.objects
+            .annotate(name_key=Lower('company_name'))
+            .filter(Q(domain_key__in=domains) | Q(name_key__in=names))
+            .order_by('id')
+            .values_list('id', 'domain_key', 'name_key')
+        )
+        for company_id, domain_key, name_key in companies:
+            if domain_key in domains:
+                by_domain.setdefault(('domain', domain_key), company_id)
+            if name_key in names:
+                by_name.setdefault(('name', name_key), company_id)
+        return by_domain, by_name
+
+    def build_client(self, data, company_id):
+        fields = {key: value for key, value in data.items()
+                  if key not in COMPANY_FIELDS and key != 'company_id'}
+        if fields.get('social_media') is None:
+            fields['social_media'] = {}
+        fields.setdefault('nurturing_stage', 'warm')
+        client = Client(company_id=company_id, **fields)
+        # bulk_create skips pre_save, which keeps the dedup keys
+        set_client_keys(client)
+        return client
+
+    def insert_clients(self, clients):
+        """
+        ``bulk_create`` where the backend returns the new pks (RETURNING),
+        one INSERT per row elsewhere (MySQL): rows of a multi-row INSERT
+        cannot be told apart from rows other writers insert meanwhile.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            Client.objects.bulk_create(clients, batch_size=self.batch_size)
+            return
+        # clients_changed covers what the per-instance receivers would do
+        with bulk_client_changes():
+            for client in clients:
+                client.save(force_insert=True)
+
+    def import_chunk(self, chunk):
+        valid = self.validate_chunk(chunk)
+        if not valid:
+            return
+        try:
+            # One chunk per turn, other writers get in between chunks
+            with serialized_writes(), transaction.atomic():
+                resolved, companies_created = self.resolve_companies(valid)
+                line_numbers = [line_number for line_number, _, _ in resolved]
+                clients = [self.build_client(data, company_id) for _, data, company_id in resolved]
+                self.insert_clients(clients)
+                clients_changed.send(
+                    sender=Client,
+                    client_ids=[client.pk for client in clients],
+                    company_ids={client.company_id for client in clients if client.company_id},
+                )
+        except DatabaseError as exc:
+            for line_number, _ in valid:
+                self.error(line_number, {'non_field_errors': [str(exc)]})
+            return
+        self.result.created += len(clients)
+        self.result.companies_created += companies_created
+        if self.on_created:
+            for line_number, client in zip(line_numbers, clients):
+                self.on_created(line_number, client)
+
+
+def import_clients(stream, file_format='csv', **kwargs):
+    """Import clients from ``stream`` and return an ``ImportResult``"""
+    return ClientImporter(**kwargs).run(read_rows(stream, file_format))
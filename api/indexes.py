@@ -0,0 +1,86 @@
+# indexes.py
+"""
+Vendor-specific indexes Django can't declare in Meta.indexes.
+
+``social_media__has_key`` compiles to ``JSON_TYPE(col, %s)`` with the path
+as a parameter, which no index can serve. For the platforms below the
+``platform`` filter renders the path literally instead, matching one
+partial index per platform on SQLite and one functional index per platform
+on MySQL. Other platforms keep the plain ``has_key`` lookup.
+"""
+from django.db.models import BooleanField, F, Func, Q
+from django.db.models.fields.json import HasKey
+
+from .models import Client
+
+INDEXED_PLATFORMS = ('linkedin', 'twitter', 'facebook', 'instagram', 'github', 'youtube')
+
+_TABLE = Client._meta.db_table
+
+
+def _sqlite_condition(platform, column='social_media'):
+    return f"""JSON_TYPE({column}, '$."{platform}"') IS NOT NULL"""
+
+
+def _mysql_condition(platform, column='social_media'):
+    return f"""JSON_CONTAINS_PATH({column}, 'one', '$."{platform}"')"""
+
+
+class HasPlatform(Func):
+    """
+    ``social_media`` has ``platform``, with the path inlined. The column is
+    compiled by the query, so the condition also works inside subqueries
+    where the table is aliased.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, platform):
+        super().__init__(F('social_media'))
+        self.platform = platform
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # Vendors without a platform index
+        return compiler.compile(HasKey(self.source_expressions[0], self.platform))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        return _sqlite_condition(self.platform, column), params
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        column, params = compiler.compile(self.source_expressions[0])
+        return f'{_mysql_condition(self.platform, column)} = 1', params
+
+
+def platform_q(platform):
+    """Clients having ``platform`` in social_media, index-friendly when possible"""
+    if platform in INDEXED_PLATFORMS:
+        return Q(HasPlatform(platform))
+    return Q(social_media__has_key=platform)
+
+
+def _statements(vendor):
+    create, drop = [], []
+    for platform in INDEXED_PLATFORMS:
+        name = f'api_client_sm_{platform}_idx'
+        if vendor == 'sqlite':
+            # Serves the filter and the default (-created_at, id) ordering
+            create.append(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {_TABLE} (created_at DESC, id) '
+                f'WHERE {_sqlite_condition(platform)}'
+            )
+            drop.append(f'DROP INDEX IF EXISTS {name}')
+        elif vendor == 'mysql':
+            create.append(f'CREATE INDEX {name} ON {_TABLE} (({_mysql_condition(platform)}))')
+            drop.append(f'DROP INDEX {name} ON {_TABLE}')
+    return create, drop
+
+
+def create_platform_indexes(apps, schema_editor):
+    """Migration hook: one social_media index per indexed platform"""
+    for statement in _statements(schema_editor.connection.vendor)[0]:
+        schema_editor.execute(statement)
+
+
+def drop_platform_indexes(apps, schema_editor):
+    for statement in _statements(schema_editor.connection.vendor)[1]:
+        schema_editor.execute(statement)
@@ -0,0 +1,266 @@
+# jobs.py
+"""
+Background jobs backed by the ``Job`` table, no broker needed.
+
+``enqueue()`` stores a job, ``run_jobs`` workers claim queued jobs with a
+conditional ``UPDATE`` (the row only flips to running for one worker),
+hold them under a lease that a heartbeat keeps extending, and record the
+outcome. A job whose worker died is taken over once its lease expires.
+Failures are retried with exponential backoff up to ``max_attempts``.
+
+Handlers must be safe to run again: each commits its state changes
+together with a checkpoint in ``Job.result``, and on retry picks up from
+the last checkpoint instead of redoing finished steps.
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .list_ops import ListOperations
+from .models import Client, Job, List
+from .writes import serialized_writes
+
+logger = logging.getLogger('api.jobs')
+
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """Fail the job at once, retrying can't help"""
+
+
+def job_handler(kind):
+    def register(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def enqueue(kind, params, idempotency_key=None):
+    """Store a job, returns ``(job, created)``; an existing key returns its job"""
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    if idempotency_key:
+        if existing := Job.objects.filter(idempotency_key=idempotency_key).first():
+            return existing, False
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                kind=kind, params=params, idempotency_key=idempotency_key or None,
+                max_attempts=getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+            )
+    except IntegrityError:
+        # Lost a race with the same key
+        return Job.objects.get(idempotency_key=idempotency_key), False
+    return job, True
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 300))
+
+
+class JobContext:
+    """What a handler gets to report progress and save checkpoints"""
+
+    def __init__(self, job):
+        self.job = job
+        self.state = dict(job.result)
+
+    def _update(self, **values):
+        Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+            **values, locked_until=timezone.now() + _lease(), updated_at=timezone.now()
+        )
+
+    def report(self, done, total=None):
+        values = {'progress_done': done}
+        if total is not None:
+            values['progress_total'] = total
+        self._update(**values)
+
+    def checkpoint(self, **values):
+        """Save state to resume from, call inside the transaction it describes"""
+        self.state.update(values)
+        self._update(result=self.state)
+
+
+class Worker:
+    """Claims and runs jobs one at a time"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def claim(self):
+        now = timezone.now()
+        claimable = Q(status='queued', run_after__lte=now) | Q(status='running', locked_until__lt=now)
+        candidates = Job.objects.filter(claimable).order_by('run_after', 'id').values_list('id', flat=True)[:10]
+        for pk in list(candidates):
+            claimed = Job.objects.filter(claimable, pk=pk).update(
+                status='running', locked_by=self.name, locked_until=now + _lease(),
+                attempts=F('attempts') + 1, started_at=now, updated_at=now,
+            )
+            if claimed:
+                return Job.objects.get(pk=pk)
+        return None
+
+    def finish(self, job, **values):
+        # Only while still holding the lease, another worker may have taken over
+        Job.objects.filter(pk=job.pk, locked_by=self.name).update(
+            **values, locked_by=None, locked_until=None, updated_at=timezone.now()
+        )
+
+    def execute(self, job):
+        handler = HANDLERS.get(job.kind)
+        context = JobContext(job)
+        try:
+            if handler is None:
+                raise PermanentJobError(f'Unknown job kind {job.kind!r}')
+            if job.attempts > job.max_attempts:
+                raise PermanentJobError(f'Gave up after {job.max_attempts} attempts, the last worker was lost')
+            result = handler(context, **job.params)
+        except PermanentJobError as exc:
+            self.finish(job, status='failed', error=str(exc), finished_at=timezone.now())
+        except Exception as exc:
+            logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+            if job.attempts < job.max_attempts:
+                delay = getattr(settings, 'JOB_RETRY_DELAY', 5) * 2 ** (job.attempts - 1)
+                self.finish(job, status='queued', error=repr(exc), run_after=timezone.now() + timedelta(seconds=delay))
+            else:
+                self.finish(job, status='failed', error=repr(exc), finished_at=timezone.now())
+        else:
+            self.finish(
+                job, status='succeeded', result={**context.state, **(result or {})}, error='',
+                finished_at=timezone.now(),
+            )
+
+    def run_once(self):
+        """Run one job if any is due, returns whether one ran"""
+        close_old_connections()
+        job = self.claim()
+        if job is None:
+            return False
+        self.execute(job)
+        close_old_connections()
+        return True
+
+    def run(self, stop, burst=False, poll_interval=1.0):
+        try:
+            while not stop.is_set():
+                if not self.run_once():
+                    if burst:
+                        return
+                    stop.wait(poll_interval)
+        finally:
+            connections.close_all()
+
+
+def heartbeat(prefix, stop, interval):
+    """Keep extending the leases of this process's running jobs"""
+    while not stop.wait(interval):
+        try:
+            Job.objects.filter(status='running', locked_by__startswith=prefix).update(
+                locked_until=timezone.now() + _lease()
+            )
+        except Exception:
+            # A busy database only delays the next beat
+            logger.warning('Job heartbeat failed', exc_info=True)
+        finally:
+            close_old_connections()
+    connections.close_all()
+
+
+def serve(threads=1, burst=False, poll_interval=None):
+    """Run ``threads`` workers in this process until SIGINT / SIGTERM (or idle, with ``burst``)"""
+    poll_interval = poll_interval or getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+
+    prefix = f'{socket.gethostname()}:{os.getpid()}:'
+    beat_stop = threading.Event()
+    beat = threading.Thread(
+        target=heartbeat, args=(prefix, beat_stop, _lease().total_seconds() / 3), daemon=True
+    )
+    beat.start()
+    workers = [
+        threading.Thread(target=Worker(f'{prefix}{n}').run, args=(stop, burst, poll_interval))
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    beat_stop.set()
+
+
+def serve_process(threads, burst, poll_interval):
+    """Entry point of a worker process"""
+    import django
+    django.setup()
+    serve(threads, burst, poll_interval)
+
+
+# ----- handlers -----
+
+def _get_list(list_id):
+    try:
+        return List.objects.get(pk=list_id)
+    except List.DoesNotExist:
+        raise PermanentJobError(f'List {list_id} not found')
+
+
+@job_handler('list.move')
+def move_list(context, source_id, target_id, remove_from_source=False):
+    if 'added_count' not in context.state:
+        source, target = _get_list(source_id), _get_list(target_id)
+        if target.kind == 'segment' or (remove_from_source and source.kind == 'segment'):
+            raise PermanentJobError('Segment members come from their filters, they cannot be moved')
+        context.report(0, 1)
+        with serialized_writes(), transaction.atomic():
+            result = ListOperations().move(source_id, target_id, remove_from_source=remove_from_source)
+            context.checkpoint(added_count=result['added'], removed_count=result['removed'])
+        context.report(1)
+    return {'source_list_id': source_id, 'target_list_id': target_id}
+
+
+@job_handler('list.duplicate')
+def duplicate_list(context, source_id, name):
+    if 'list_id' not in context.state:
+        original = _get_list(source_id)
+        context.report(0, 1)
+        with serialized_writes(), transaction.atomic():
+            duplicate = ListOperations().duplicate(original, name)
+            context.checkpoint(list_id=duplicate.pk)
+        context.report(1)
+    duplicate = List.objects.get(pk=context.state['list_id'])
+    return {'name': duplicate.name, 'count': duplicate.client_count}
+
+
+@job_handler('list.add_clients')
+def add_clients(context, list_id, client_ids):
+    list_obj = _get_list(list_id)
+    if list_obj.kind == 'segment':
+        raise PermanentJobError(f'List {list_id} is a segment, its members come from its filters')
+    client_ids = list(dict.fromkeys(client_ids))
+    chunk_size = getattr(settings, 'BATCH_CHUNK_SIZE', 500)
+    offset = context.state.get('offset', 0)
+    added = context.state.get('added_count', 0)
+    context.report(offset, len(client_ids))
+    while offset < len(client_ids):
+        chunk = client_ids[offset:offset + chunk_size]
+        with serialized_writes(), transaction.atomic():
+            existing = Client.objects.filter(id__in=chunk).values_list('id', flat=True)
+            result = ListOperations().add_clients(list_id, existing)
+            offset += len(chunk)
+            added += result['added']
+            context.checkpoint(offset=offset, added_count=added)
+        context.report(offset)
+    return {'list_id': list_id, 'added_count': added}
@@ -0,0 +1,222 @@
+# list_ops.py
+"""
+Set-based list operations executed in SQL against the List.clients table.
+
+Memberships never leave the database: copies are ``INSERT ... SELECT`` and
+removals are ``DELETE ... WHERE``, and the counts come from the affected
+row counts rather than re-counting; they are sent as per-list deltas with
+``memberships_changed``, which adjusts ``List.client_count``. The same SELECTs feed the change feed's
+membership events (see api/changes.py). Explicit client id lists are
+written in chunks with ``bulk_create(ignore_conflicts=True)`` and
+``DELETE ... IN (...)``.
+"""
+from django.db import connections, router, transaction
+
+from .changes import log_memberships, record_membership_events
+from .models import List
+from .signals import memberships_changed
+
+OPERATIONS = ('union', 'intersect', 'difference')
+
+Membership = List.clients.through
+
+# Keep IN (...) lists under SQLite's variable limit
+CHUNK_SIZE = 500
+
+
+class ListOperations:
+    """Run list algebra on one database inside a transaction"""
+
+    def __init__(self, using=None):
+        self.using = using or router.db_for_write(Membership)
+        self.connection = connections[self.using]
+        qn = self.connection.ops.quote_name
+        self.table = qn(Membership._meta.db_table)
+
+    def _execute(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def _placeholders(self, values):
+        return ', '.join(['%s'] * len(values))
+
+    def _changed(self, deltas):
+        """``deltas`` is ``{list_id: added - removed}``"""
+        memberships_changed.send(sender=List, deltas=deltas, using=self.using)
+
+    def _chunks(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            yield ids[start:start + CHUNK_SIZE]
+
+    # ----- primitives -----
+
+    def _log_removals(self, where, params):
+        log_memberships(
+            self.using, 'remove', f"SELECT t.list_id, t.client_id FROM {self.table} t WHERE {where}", params
+        )
+
+    def copy(self, source_ids, target_id):
+        """Add every member of ``source_ids`` to ``target_id``, returns added count"""
+        source_ids = [i for i in source_ids if i != target_id]
+        if not source_ids:
+            return 0
+        select = (
+            f"SELECT DISTINCT %s AS list_id, s.client_id AS client_id FROM {self.table} s "
+            f"WHERE s.list_id IN ({self._placeholders(source_ids)}) "
+            f"AND NOT EXISTS (SELECT 1 FROM {self.table} x WHERE x.list_id = %s AND x.client_id = s.client_id)"
+        )
+        params = [target_id, *source_ids, target_id]
+        log_memberships(self.using, 'add', select, params)
+        return self._execute(f"INSERT INTO {self.table} (list_id, client_id) {select}", params)
+
+    def remove_common(self, target_id, source_ids):
+        """Remove members of ``target_id`` found in any of ``source_ids``"""
+        if not source_ids:
+            return 0
+        self._log_removals(
+            f"t.list_id = %s AND t.client_id IN "
+            f"(SELECT client_id FROM {self.table} WHERE list_id IN ({self._placeholders(source_ids)}))",
+            [target_id, *source_ids]
+        )
+        if self.connection.vendor == 'mysql':
+            # MySQL can't DELETE from a table it also reads in a subquery
+            sql = (
+                f"DELETE t FROM {self.table} t JOIN {self.table} s "
+                f"ON s.client_id = t.client_id AND s.list_id IN ({self._placeholders(source_ids)}) "
+                f"WHERE t.list_id = %s"
+            )
+            return self._execute(sql, [*source_ids, target_id])
+        sql = (
+            f"DELETE FROM {self.table} WHERE list_id = %s AND client_id IN "
+            f"(SELECT client_id FROM {self.table} WHERE list_id IN ({self._placeholders(source_ids)}))"
+        )
+        return self._execute(sql, [target_id, *source_ids])
+
+    def remove_missing(self, target_id, source_id):
+        """Remove members of ``target_id`` that are not in ``source_id``"""
+        self._log_removals(
+            f"t.list_id = %s AND t.client_id NOT IN (SELECT client_id FROM {self.table} WHERE list_id = %s)",
+            [target_id, source_id]
+        )
+        if self.connection.vendor == 'mysql':
+            sql = (
+                f"DELETE t FROM {self.table} t LEFT JOIN {self.table} s "
+                f"ON s.client_id = t.client_id AND s.list_id = %s "
+                f"WHERE t.list_id = %s AND s.id IS NULL"
+            )
+            return self._execute(sql, [source_id, target_id])
+        sql = (
+            f"DELETE FROM {self.table} WHERE list_id = %s AND client_id NOT IN "
+            f"(SELECT client_id FROM {self.table} WHERE list_id = %s)"
+        )
+        return self._execute(sql, [target_id, source_id])
+
+    def members(self, list_id, client_ids):
+        """Which of ``client_ids`` are members of ``list_id``"""
+        members = set()
+        for chunk in self._chunks(client_ids):
+            members.update(
+                Membership.objects.using(self.using)
+                .filter(list_id=list_id, client_id__in=chunk).values_list('client_id', flat=True)
+            )
+        return members
+
+    def insert(self, list_id, client_ids):
+        """Add ``client_ids`` (existing clients) to ``list_id``, returns the count actually added"""
+        added = []
+        for chunk in self._chunks(dict.fromkeys(client_ids)):
+            before = self.members(list_id, chunk)
+            Membership.objects.using(self.using).bulk_create(
+                [Membership(list_id=list_id, client_id=client_id) for client_id in chunk if client_id not in before],
+                ignore_conflicts=True,
+            )
+            # ignore_conflicts skips rows without saying which, read back what is new
+            added.extend(sorted(self.members(list_id, chunk) - before))
+        record_membership_events('add', [(list_id, client_id) for client_id in added])
+        return len(added)
+
+    def delete(self, list_id, client_ids):
+        """Remove ``client_ids`` from ``list_id``, returns removed count"""
+        removed = 0
+        for chunk in self._chunks(client_ids):
+            where = f"list_id = %s AND client_id IN ({self._placeholders(chunk)})"
+            self._log_removals(f"t.{where}", [list_id, *chunk])
+            removed += self._execute(f"DELETE FROM {self.table} WHERE {where}", [list_id, *chunk])
+        return removed
+
+    def clear(self, list_id):
+        self._log_removals("t.list_id = %s", [list_id])
+        return self._execute(f"DELETE FROM {self.table} WHERE list_id = %s", [list_id])
+
+    # ----- operations -----
+
+    def union(self, target_id, source_ids):
+        with transaction.atomic(using=self.using):
+            added = self.copy(source_ids, target_id)
+            self._changed({target_id: added})
+        return {'added': added, 'removed': 0}
+
+    def intersect(self, target_id, source_ids):
+        with transaction.atomic(using=self.using):
+            removed = sum(self.remove_missing(target_id, source_id)
+                          for source_id in source_ids if source_id != target_id)
+            self._changed({target_id: -removed})
+        return {'added': 0, 'removed': removed}
+
+    def difference(self, target_id, source_ids):
+        with transaction.atomic(using=self.using):
+            removed = self.remove_common(target_id, [i for i in source_ids if i != target_id])
+            self._changed({target_id: -removed})
+        return {'added': 0, 'removed': removed}
+
+    def move(self, source_id, target_id, remove_from_source=True):
+        """Copy ``source_id`` into ``target_id``, optionally emptying the source"""
+        with transaction.atomic(using=self.using):
+            added = self.copy([source_id], target_id)
+            removed = self.clear(source_id) if remove_from_source else 0
+            self._changed({source_id: -removed, target_id: added})
+        return {'added': added, 'removed': removed}
+
+    def add_clients(self, target_id, client_ids):
+        """Add existing ``client_ids`` to ``target_id``, members already there are skipped"""
+        with transaction.atomic(using=self.using):
+            added = self.insert(target_id, client_ids)
+            self._changed({target_id: added})
+        return {'added': added, 'removed': 0}
+
+    def remove_clients(self, target_id, client_ids):
+        with transaction.atomic(using=self.using):
+            removed = self.delete(target_id, list(dict.fromkeys(client_ids)))
+            self._changed({target_id: -removed})
+        return {'added': 0, 'removed': removed}
+
+    def set_clients(self, target_id, client_ids):
+        """Make existing ``client_ids`` the members of ``target_id``"""
+        client_ids = list(dict.fromkeys(client_ids))
+        with transaction.atomic(using=self.using):
+            current = set(
+                Membership.objects.using(self.using).filter(list_id=target_id).values_list('client_id', flat=True)
+            )
+            removed = self.delete(target_id, current.difference(client_ids))
+            added = self.insert(target_id, [pk for pk in client_ids if pk not in current])
+            self._changed({target_id: added - removed})
+        return {'added': added, 'removed': removed}
+
+    def duplicate(self, original, name):
+        """New list with ``original``'s settings and members"""
+        with transaction.atomic(using=self.using):
+            duplicate = List.objects.using(self.using).create(
+                name=name,
+                folder=original.folder,
+                kind=original.kind,
+                filters=original.filters,
+            )
+            self.union(duplicate.id, [original.id])
+        return duplicate
+
+    def apply(self, operation, target_id, source_ids):
+        if operation not in OPERATIONS:
+            raise ValueError(f'Unknown operation {operation!r}')
+        return getattr(self, operation)(target_id, source_ids)
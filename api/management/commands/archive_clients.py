@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import ClientArchive
+
+
+class Command(BaseCommand):
+    help = 'Move long-cold clients to the archive table, memberships and company links included'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stage', action='append', dest='stages',
+                            help='Nurturing stage to archive, repeatable (ARCHIVE_STAGES)')
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive clients not updated for this many days (ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=settings.ARCHIVE_CHUNK_SIZE,
+                            help='Clients moved per transaction (ARCHIVE_CHUNK_SIZE)')
+        parser.add_argument('--limit', type=int, help='Archive at most this many clients')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the matching clients')
+
+    def handle(self, *args, **options):
+        archive = ClientArchive(chunk_size=options['chunk_size'])
+        queryset = archive.policy(stages=options['stages'], days=options['days'])
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{queryset.count()} clients match the archive policy'))
+            return
+
+        moved = 0
+        for count in archive.run(queryset, limit=options['limit']):
+            moved += count
+            self.stdout.write(f'Archived {moved} clients')
+        self.stdout.write(self.style.SUCCESS(f'Done, archived {moved} clients'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.membership_index import membership_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the list membership bitmaps from the database and write their snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Snapshot file (MEMBERSHIP_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        membership_index.build()
+        path = membership_index.save(options['path'])
+        if path is None:
+            raise CommandError('Could not write the snapshot, check MEMBERSHIP_INDEX_PATH or --path')
+        lists = len(membership_index.lists)
+        members = sum(membership_index.count(list_id) for list_id in membership_index.lists)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {members} memberships of {lists} lists into {path}'))
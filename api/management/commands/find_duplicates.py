@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.dedup import DEDUPLICATORS
+
+
+class Command(BaseCommand):
+    help = 'Find duplicate clients / companies by blocking key, optionally merging the best matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=[*DEDUPLICATORS, 'all'], default='all')
+        parser.add_argument('--min-score', type=float, default=None,
+                            help='Lowest score recorded as a candidate (DEDUP_MIN_SCORE)')
+        parser.add_argument('--merge-above', type=float, default=None,
+                            help='Merge open candidates scoring at least this much into the older row')
+
+    def handle(self, *args, **options):
+        kinds = list(DEDUPLICATORS) if options['kind'] == 'all' else [options['kind']]
+        # Companies first, merging them can turn clients into duplicates
+        for kind in sorted(kinds, key=lambda k: k != 'company'):
+            deduplicator = DEDUPLICATORS[kind](min_score=options['min_score'])
+            found = deduplicator.find()
+            self.stdout.write(self.style.SUCCESS(f'Found {found} {kind} candidate pairs'))
+            if options['merge_above'] is not None:
+                merged = deduplicator.merge_candidates(options['merge_above'])
+                self.stdout.write(self.style.SUCCESS(f'Merged {merged} {kind} pairs'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.datasets import SCALES, DatasetGenerator
+from api.models import Client
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset of companies, clients and lists for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='10k', help='Number of clients')
+        parser.add_argument('--clients', type=int, help='Exact number of clients, overrides --scale')
+        parser.add_argument('--companies', type=int, help='Defaults to one company per 20 clients')
+        parser.add_argument('--lists', type=int, default=20, help='Static lists to create')
+        parser.add_argument('--max-list-size', type=int, default=500_000, help='Members of the largest list')
+        parser.add_argument('--segments', type=int, default=2, help='Segment lists to create')
+        parser.add_argument('--duplicate-rate', type=float, default=0.02, help='Share of near-duplicate clients')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--force', action='store_true', help='Add to a database that already has clients')
+
+    def handle(self, *args, **options):
+        if Client.objects.exists() and not options['force']:
+            raise CommandError('The database already has clients, use --force to add to them')
+
+        generator = DatasetGenerator(
+            clients=options['clients'] or SCALES[options['scale']],
+            companies=options['companies'],
+            lists=options['lists'],
+            max_list_size=options['max_list_size'],
+            segments=options['segments'],
+            duplicate_rate=options['duplicate_rate'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        counts = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['companies']} companies, {counts['clients']} clients, "
+            f"{counts['lists']} lists and {counts['memberships']} memberships"
+        ))
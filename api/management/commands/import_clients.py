@@ -0,0 +1,48 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import IMPORT_FORMATS, ClientImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import clients and their companies from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' reads stdin")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per chunk / transaction')
+        parser.add_argument('--errors-file', help='Write every row error to this JSONL file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or guess_format(path)
+
+        errors_file = open(options['errors_file'], 'w') if options['errors_file'] else None
+
+        def on_error(line_number, errors):
+            if errors_file:
+                errors_file.write(json.dumps({'row': line_number, 'errors': errors}) + '\n')
+
+        importer = ClientImporter(batch_size=options['batch_size'], on_error=on_error)
+        try:
+            if path == '-':
+                result = importer.run(read_rows(sys.stdin, file_format))
+            else:
+                try:
+                    stream = open(path, 'rb')
+                except OSError as exc:
+                    raise CommandError(exc)
+                with stream:
+                    result = importer.run(read_rows(stream, file_format))
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows: {result.created} clients created, '
+            f'{result.companies_created} companies created, {result.failed} failed'
+        ))
+        for error in result.errors[:10]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import MembershipEvent, Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed tombstones and membership events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGE_FEED_RETENTION_DAYS,
+                            help='Keep this many days (CHANGE_FEED_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        tombstones, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        events, _ = MembershipEvent.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {tombstones} tombstones and {events} membership events older than {cutoff:%Y-%m-%d %H:%M}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.search import ClientSearch
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the client full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+
+    def handle(self, *args, **options):
+        count = ClientSearch(using=options['database']).rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} clients'))
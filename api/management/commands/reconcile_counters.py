@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import drifted_companies, drifted_lists, refresh_company_counts, refresh_list_counts
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in the stored List / Company client counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+        parser.add_argument('--all', action='store_true', help='Recompute every row, not only drifted ones')
+
+    def handle(self, *args, **options):
+        if options['all'] and not options['dry_run']:
+            lists = refresh_list_counts()
+            companies = refresh_company_counts()
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {lists} lists and {companies} companies'))
+            return
+
+        for label, drifted, refresh in (
+            ('list', drifted_lists, refresh_list_counts),
+            ('company', drifted_companies, refresh_company_counts),
+        ):
+            rows = list(drifted())
+            for pk, stored, actual in rows:
+                self.stdout.write(f'{label} {pk}: stored {stored}, actual {actual}')
+            if rows and not options['dry_run']:
+                refresh([pk for pk, _, _ in rows])
+            verb = 'Found' if options['dry_run'] else 'Repaired'
+            self.stdout.write(self.style.SUCCESS(f'{verb} {len(rows)} drifted {label} counters'))
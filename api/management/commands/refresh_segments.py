@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from api.models import List
+from api.segments import Segments
+from api.writes import serialized_writes
+
+
+class Command(BaseCommand):
+    help = 'Re-run segment list filters over every client and fix their members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('list_ids', nargs='*', type=int, help='Segments to refresh, all by default')
+
+    def handle(self, *args, **options):
+        segments = List.objects.filter(kind='segment')
+        if options['list_ids']:
+            segments = segments.filter(id__in=options['list_ids'])
+        refresher = Segments()
+        for segment in segments:
+            with serialized_writes():
+                result = refresher.refresh(segment)
+            self.stdout.write(f'{segment.id} {segment.name}: +{result["added"]} -{result["removed"]}')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {len(segments)} segments'))
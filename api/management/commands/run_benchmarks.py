@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import Benchmark, compare, default_scenarios
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API endpoints: latency percentiles, query counts and peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before timing')
+        parser.add_argument('--only', action='append', default=[], help='Only scenarios containing this text')
+        parser.add_argument('--exclude', action='append', default=[], help='Skip scenarios containing this text')
+        parser.add_argument('--cached', action='store_true', help='Keep the API response caches enabled')
+        parser.add_argument('--save', help='Write the results as JSON, e.g. to use as a baseline')
+        parser.add_argument('--compare', help='Baseline JSON file from an earlier --save')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error on regressions')
+        parser.add_argument('--database', default='default', help='Database alias to benchmark')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as stream:
+                    baseline = json.load(stream)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Can't read baseline: {exc}")
+
+        scenarios = default_scenarios(using=options['database'])
+        if not scenarios:
+            raise CommandError('Nothing to benchmark, generate data first (see generate_dataset)')
+        if options['only']:
+            scenarios = [s for s in scenarios if any(text in s.name for text in options['only'])]
+        scenarios = [s for s in scenarios if not any(text in s.name for text in options['exclude'])]
+
+        self.stdout.write(f"{'scenario':<40} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'queries':>7} {'peak KB':>9}")
+
+        def report(name, result):
+            self.stdout.write(
+                f"{name:<40} {result['status']:>6} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['queries']:>7} {result['peak_kb']:>9.1f}"
+            )
+
+        benchmark = Benchmark(
+            repeat=options['repeat'], warmup=options['warmup'],
+            cached=options['cached'], using=options['database'],
+        )
+        results = benchmark.run(scenarios, on_result=report)
+
+        if options['save']:
+            with open(options['save'], 'w') as stream:
+                json.dump(results, stream, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
+
+        if baseline is None:
+            return
+        if baseline.get('dataset') != results['dataset']:
+            self.stdout.write(self.style.WARNING('The baseline was recorded on a different dataset'))
+
+        regressions = 0
+        for row in compare(baseline, results, tolerance=options['tolerance']):
+            if row['new']:
+                self.stdout.write(f"{row['name']:<40} new, not in the baseline")
+                continue
+            changes = ' '.join(
+                f"{key}={row[f'{key}_change']:+.0%}" for key in ('p50_ms', 'p95_ms', 'queries', 'peak_kb')
+                if row[f'{key}_change'] is not None
+            )
+            if row['regressions']:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(
+                    f"{row['name']:<40} REGRESSED ({', '.join(row['regressions'])}) {changes}"
+                ))
+            elif options['verbosity'] > 1:
+                self.stdout.write(f"{row['name']:<40} ok {changes}")
+
+        if regressions:
+            message = f'{regressions} scenarios regressed against {options["compare"]}'
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
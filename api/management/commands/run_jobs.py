@@ -0,0 +1,43 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.jobs import serve, serve_process
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (list moves, duplicates, bulk adds) from the job table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Jobs run at the same time')
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread',
+                            help='Run the workers as threads of this process or as separate processes')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        self.stdout.write(f"Running {workers} {options['pool']} workers")
+
+        if options['pool'] == 'thread':
+            serve(threads=workers, burst=options['burst'], poll_interval=options['poll_interval'])
+        else:
+            # Children must not share the parent's database connections
+            connections.close_all()
+            processes = [
+                multiprocessing.Process(target=serve_process, args=(1, options['burst'], options['poll_interval']))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            try:
+                for process in processes:
+                    process.join()
+            except KeyboardInterrupt:
+                # The children got the same SIGINT and finish their current job
+                for process in processes:
+                    process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
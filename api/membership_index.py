@@ -0,0 +1,558 @@
+# membership_index.py
+"""
+In-memory index of list memberships, one compressed bitmap per list.
+
+Bitmaps are roaring-style: client ids are split on their high 16 bits and
+each 65536-id chunk is kept as a sorted ``array('H')`` while it holds at
+most ARRAY_MAX ids, and as a Python int used as a bitmap once denser. Set
+operations and counts then run in C (``&``, ``|``, ``int.bit_count()``)
+instead of joins on the List.clients table.
+
+The index loads on first use from the snapshot at MEMBERSHIP_INDEX_PATH
+(memory-mapped, each list is decoded when first read), which the
+``build_membership_index`` command writes at deploy time. Without one,
+the List.clients table is read in a background thread and reads get a
+503 until it is done. The index then catches up from the change feed:
+MembershipEvent rows and client / list Tombstones after its watermarks
+(see api/changes.py), at most every MEMBERSHIP_INDEX_SYNC_SECONDS.
+m2m_changed applies this process's own writes in between (see
+api/signals.py).
+
+Feed ids are taken at insert time, so a transaction that commits late
+shows up below a watermark that has already passed it. The ids skipped
+over are kept as gaps and read again on every sync, until they show up or
+MEMBERSHIP_INDEX_LAG_SECONDS have passed (a rolled back write never will).
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min, Q
+from rest_framework.exceptions import APIException
+
+from .models import List, MembershipEvent, Tombstone
+
+Membership = List.clients.through
+
+# Ids in a sparse container, above it a container becomes a bitmap
+ARRAY_MAX = 4096
+CONTAINER_BYTES = 8192
+
+ARRAY, BITMAP = 0, 1
+
+SNAPSHOT_MAGIC = b'LMIDX001'
+_HEADER = struct.Struct('<8sQQQ')      # magic, event id, tombstone id, list count
+_ENTRY = struct.Struct('<QQQ')         # list id, offset, length
+_CONTAINER = struct.Struct('<IBI')     # high bits, kind, byte length
+
+# Change feed rows read per query while catching up
+SYNC_BATCH_SIZE = 5000
+
+# Id ranges re-read per feed, the oldest are dropped beyond it
+MAX_GAPS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class IndexLoading(APIException):
+    status_code = 503
+    default_detail = 'The membership index is loading, retry shortly.'
+    default_code = 'index_loading'
+
+
+# ----- containers -----
+
+def _bitmap(values):
+    data = bytearray(CONTAINER_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _values(bits):
+    data = bits.to_bytes(CONTAINER_BYTES, 'little')
+    return array('H', [
+        (index << 3) + bit for index, byte in enumerate(data) if byte for bit in range(8) if byte >> bit & 1
+    ])
+
+
+def _normalize(container):
+    """The compact form of ``container``, None when empty"""
+    if isinstance(container, int):
+        count = container.bit_count()
+        if not count:
+            return None
+        return _values(container) if count <= ARRAY_MAX else container
+    if not container:
+        return None
+    return _bitmap(container) if len(container) > ARRAY_MAX else container
+
+
+def _count(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalize(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        data = b.to_bytes(CONTAINER_BYTES, 'little')
+        return _normalize(array('H', [value for value in a if data[value >> 3] >> (value & 7) & 1]))
+    return _normalize(array('H', sorted(set(a).intersection(b))))
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        bits = (a if isinstance(a, int) else _bitmap(a)) | (b if isinstance(b, int) else _bitmap(b))
+        return _normalize(bits)
+    return _normalize(array('H', sorted(set(a).union(b))))
+
+
+def _add(container, values):
+    if container is None:
+        return _normalize(array('H', sorted(set(values))))
+    if isinstance(container, int):
+        return container | _bitmap(values)
+    return _normalize(array('H', sorted(set(container).union(values))))
+
+
+def _discard(container, values):
+    if isinstance(container, int):
+        return _normalize(container & ~_bitmap(values))
+    values = set(values)
+    return _normalize(array('H', [value for value in container if value not in values]))
+
+
+def _split(ids):
+    """``{high: [low, ...]}`` of ``ids``"""
+    chunks = {}
+    for pk in ids:
+        chunks.setdefault(pk >> 16, []).append(pk & 0xFFFF)
+    return chunks
+
+
+class Bitmap:
+    """A set of non-negative ids stored as roaring-style containers"""
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        bitmap = cls()
+        bitmap.add(ids)
+        return bitmap
+
+    def add(self, ids):
+        for high, values in _split(ids).items():
+            self.containers[high] = _add(self.containers.get(high), values)
+
+    def discard(self, ids):
+        for high, values in _split(ids).items():
+            if high in self.containers:
+                if (container := _discard(self.containers[high], values)) is None:
+                    del self.containers[high]
+                else:
+                    self.containers[high] = container
+
+    def __len__(self):
+        return sum(_count(container) for container in self.containers.values())
+
+    def __contains__(self, pk):
+        container = self.containers.get(pk >> 16)
+        if container is None:
+            return False
+        low = pk & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            values = _values(container) if isinstance(container, int) else container
+            base = high << 16
+            for value in values:
+                yield base + value
+
+    def __and__(self, other):
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            if (container := _and(self.containers[high], other.containers[high])) is not None:
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            containers[high] = _or(containers[high], container) if high in containers else container
+        return Bitmap(containers)
+
+    def intersection_count(self, other):
+        return len(self & other)
+
+    def to_bytes(self):
+        parts = [struct.pack('<I', len(self.containers))]
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            if isinstance(container, int):
+                kind, payload = BITMAP, container.to_bytes(CONTAINER_BYTES, 'little')
+            else:
+                values = array('H', container)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                kind, payload = ARRAY, values.tobytes()
+            parts += [_CONTAINER.pack(high, kind, len(payload)), payload]
+        return b''.join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        (count,), offset = struct.unpack_from('<I', buffer), 4
+        containers = {}
+        for _ in range(count):
+            high, kind, length = _CONTAINER.unpack_from(buffer, offset)
+            offset += _CONTAINER.size
+            payload = buffer[offset:offset + length]
+            offset += length
+            if kind == BITMAP:
+                containers[high] = int.from_bytes(payload, 'little')
+            else:
+                values = array('H')
+                values.frombytes(payload)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                containers[high] = values
+        return cls(containers)
+
+
+# ----- index -----
+
+class FeedGaps:
+    """Ids a change feed reader passed without seeing, as ``[first, last, noticed at]`` ranges"""
+
+    def __init__(self):
+        self.ranges = []
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def note(self, watermark, ids):
+        """Record the ids between ``watermark`` and the sorted ``ids`` just read"""
+        now = time.monotonic()
+        expected = watermark + 1
+        for pk in ids:
+            if pk > expected:
+                self.ranges.append([expected, pk - 1, now])
+            expected = pk + 1
+        del self.ranges[:-MAX_GAPS]
+
+    def condition(self):
+        query = Q()
+        for first, last, _ in self.ranges:
+            query |= Q(id__range=(first, last))
+        return query
+
+    def fill(self, ids):
+        """Drop ``ids`` that showed up, splitting the ranges around them"""
+        for pk in ids:
+            for position, (first, last, noticed) in enumerate(self.ranges):
+                if first <= pk <= last:
+                    self.ranges[position:position + 1] = [
+                        [start, end, noticed] for start, end in ((first, pk - 1), (pk + 1, last)) if start <= end
+                    ]
+                    break
+
+    def expire(self, seconds):
+        cutoff = time.monotonic() - seconds
+        self.ranges = [gap for gap in self.ranges if gap[2] >= cutoff]
+
+    def floor(self, watermark):
+        """A watermark below every gap, for a snapshot to replay them from"""
+        return min([first - 1 for first, _, _ in self.ranges] + [watermark])
+
+
+class MembershipIndex:
+    """List id -> Bitmap of its client ids, kept in step with the change feed"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Bitmap, or (offset, length) in the snapshot until first read
+        self.lists = None
+        self.snapshot = None
+        self.event_id = 0
+        self.tombstone_id = 0
+        self.event_gaps = FeedGaps()
+        self.tombstone_gaps = FeedGaps()
+        self.synced_at = 0.0
+        self.building = False
+
+    @property
+    def path(self):
+        return getattr(settings, 'MEMBERSHIP_INDEX_PATH', '')
+
+    def ensure(self):
+        """Load the index if needed and catch up when the sync interval is up"""
+        with self.lock:
+            if self.lists is None and not self.load():
+                self.build_in_background()
+                raise IndexLoading()
+            if time.monotonic() - self.synced_at >= getattr(settings, 'MEMBERSHIP_INDEX_SYNC_SECONDS', 2):
+                self.catch_up()
+        return self
+
+    def expire(self):
+        """Catch up on the next read, e.g. after bulk membership writes"""
+        self.synced_at = 0.0
+
+    # ----- loading -----
+
+    def build(self):
+        """Read every membership from the database"""
+        # Watermarks first: anything written meanwhile is replayed, replays are idempotent
+        event_id = MembershipEvent.objects.aggregate(id=Max('id'))['id'] or 0
+        tombstone_id = Tombstone.objects.aggregate(id=Max('id'))['id'] or 0
+        lists = {pk: Bitmap() for pk in List.objects.values_list('id', flat=True)}
+        rows = (
+            Membership.objects.order_by('list_id', 'client_id')
+            .values_list('list_id', 'client_id').iterator(chunk_size=SYNC_BATCH_SIZE)
+        )
+        for list_id, group in groupby(rows, key=lambda row: row[0]):
+            lists.setdefault(list_id, Bitmap()).add(client_id for _, client_id in group)
+        # Readers keep the previous index until here
+        with self.lock:
+            self._close()
+            self.lists = lists
+            self.event_id, self.tombstone_id = event_id, tombstone_id
+            self.event_gaps, self.tombstone_gaps = FeedGaps(), FeedGaps()
+            self.synced_at = 0.0
+        return self
+
+    def build_in_background(self):
+        """Start a build and snapshot in a thread, unless one is running"""
+        with self.lock:
+            if self.building:
+                return
+            self.building = True
+        threading.Thread(target=self._build_and_save, name='membership-index-build', daemon=True).start()
+
+    def _build_and_save(self):
+        try:
+            self.build()
+            self.save()
+        except Exception:
+            logger.exception('Building the membership index failed')
+        finally:
+            self.building = False
+            connections.close_all()
+
+    def load(self, path=None):
+        """Map the snapshot file, False when there is none or it is unreadable"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, 'rb') as file:
+            try:
+                snapshot = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return False
+        try:
+            magic, event_id, tombstone_id, count = _HEADER.unpack_from(snapshot)
+        except struct.error:
+            magic = None
+        if magic != SNAPSHOT_MAGIC:
+            snapshot.close()
+            return False
+        lists = {}
+        for position in range(count):
+            list_id, offset, length = _ENTRY.unpack_from(snapshot, _HEADER.size + position * _ENTRY.size)
+            lists[list_id] = (offset, length)
+        with self.lock:
+            self._close()
+            self.snapshot, self.lists = snapshot, lists
+            self.event_id, self.tombstone_id = event_id, tombstone_id
+            self.event_gaps, self.tombstone_gaps = FeedGaps(), FeedGaps()
+        return True
+
+    def save(self, path=None):
+        """Write a snapshot atomically, returns its path or None"""
+        path = path or self.path
+        if not path:
+            return None
+        with self.lock:
+            list_ids = sorted(self.lists)
+            payloads = [self._payload(list_id) for list_id in list_ids]
+            header = _HEADER.pack(
+                SNAPSHOT_MAGIC, self.event_gaps.floor(self.event_id),
+                self.tombstone_gaps.floor(self.tombstone_id), len(list_ids)
+            )
+        offset = _HEADER.size + len(list_ids) * _ENTRY.size
+        directory = []
+        for list_id, payload in zip(list_ids, payloads):
+            directory.append(_ENTRY.pack(list_id, offset, len(payload)))
+            offset += len(payload)
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(header)
+                file.writelines(directory)
+                file.writelines(payloads)
+            os.replace(temporary, path)
+        except OSError:
+            return None
+        return path
+
+    def _payload(self, list_id):
+        entry = self.lists[list_id]
+        if isinstance(entry, tuple):
+            offset, length = entry
+            return self.snapshot[offset:offset + length]
+        return entry.to_bytes()
+
+    def _close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    # ----- change feed -----
+
+    def catch_up(self):
+        """Apply membership events and tombstones written after the watermarks, or late"""
+        with self.lock:
+            if self._missed_events():
+                # Serve the current index meanwhile
+                self.build_in_background()
+                self.synced_at = time.monotonic()
+                return
+            lag = getattr(settings, 'MEMBERSHIP_INDEX_LAG_SECONDS', 60)
+            self.event_gaps.expire(lag)
+            self.tombstone_gaps.expire(lag)
+
+            if self.event_gaps:
+                late = list(
+                    MembershipEvent.objects.filter(self.event_gaps.condition()).order_by('id')
+                    .values_list('id', 'action', 'list_id', 'client_id')
+                )
+                self._apply_events(late)
+                self.event_gaps.fill(row[0] for row in late)
+            while True:
+                batch = list(
+                    MembershipEvent.objects.filter(id__gt=self.event_id).order_by('id')
+                    .values_list('id', 'action', 'list_id', 'client_id')[:SYNC_BATCH_SIZE]
+                )
+                self._apply_events(batch)
+                if batch:
+                    self.event_gaps.note(self.event_id, [row[0] for row in batch])
+                    self.event_id = batch[-1][0]
+                if len(batch) < SYNC_BATCH_SIZE:
+                    break
+
+            # Every model is read, so company tombstones don't look like gaps
+            tombstones = []
+            if self.tombstone_gaps:
+                tombstones = list(
+                    Tombstone.objects.filter(self.tombstone_gaps.condition())
+                    .order_by('id').values_list('id', 'model', 'object_id')
+                )
+                self.tombstone_gaps.fill(row[0] for row in tombstones)
+            recent = list(
+                Tombstone.objects.filter(id__gt=self.tombstone_id)
+                .order_by('id').values_list('id', 'model', 'object_id')
+            )
+            if recent:
+                self.tombstone_gaps.note(self.tombstone_id, [row[0] for row in recent])
+                self.tombstone_id = recent[-1][0]
+            self._apply_tombstones(tombstones + recent)
+            self.synced_at = time.monotonic()
+
+    def _apply_events(self, rows):
+        for (action, list_id), group in groupby(rows, key=lambda row: (row[1], row[2])):
+            self._apply(action, list_id, [row[3] for row in group])
+
+    def _apply_tombstones(self, rows):
+        if deleted := [pk for _, model, pk in rows if model == 'client']:
+            for list_id in list(self.lists):
+                self.get(list_id).discard(deleted)
+        for _, model, pk in rows:
+            if model == 'list':
+                self.lists.pop(pk, None)
+
+    def _missed_events(self):
+        """Whether events after the watermark are gone (pruned, or another database)"""
+        bounds = MembershipEvent.objects.aggregate(first=Min('id'), last=Max('id'))
+        if self.event_id > (bounds['last'] or 0):
+            return True
+        return (
+            bounds['first'] is not None and bounds['first'] > self.event_id + 1
+            and self.event_id > 0
+        )
+
+    def _apply(self, action, list_id, client_ids):
+        if action == 'add':
+            self.get(list_id).add(client_ids)
+        elif list_id in self.lists:
+            self.get(list_id).discard(client_ids)
+
+    def apply(self, action, pairs):
+        """Apply ``(list_id, client_id)`` pairs added / removed in this process"""
+        with self.lock:
+            if self.lists is None:
+                return
+            for list_id, group in groupby(sorted(pairs), key=lambda pair: pair[0]):
+                self._apply(action, list_id, [client_id for _, client_id in group])
+
+    # ----- reads -----
+
+    def get(self, list_id):
+        """The Bitmap of ``list_id``, decoded from the snapshot on first read"""
+        with self.lock:
+            entry = self.lists.get(list_id)
+            if entry is None:
+                entry = self.lists[list_id] = Bitmap()
+            elif isinstance(entry, tuple):
+                offset, length = entry
+                with memoryview(self.snapshot) as view:
+                    entry = self.lists[list_id] = Bitmap.from_buffer(view[offset:offset + length])
+            return entry
+
+    def count(self, list_id):
+        return len(self.get(list_id))
+
+    def overlap(self, list_ids):
+        """Member counts, the pairwise overlap matrix and the intersection / union sizes"""
+        with self.lock:
+            bitmaps = [self.get(list_id) for list_id in list_ids]
+            counts = [len(bitmap) for bitmap in bitmaps]
+            matrix = [[0] * len(bitmaps) for _ in bitmaps]
+            for i, first in enumerate(bitmaps):
+                matrix[i][i] = counts[i]
+                for j in range(i + 1, len(bitmaps)):
+                    matrix[i][j] = matrix[j][i] = first.intersection_count(bitmaps[j])
+            intersection = union = Bitmap()
+            if bitmaps:
+                intersection = union = bitmaps[0]
+                for bitmap in bitmaps[1:]:
+                    intersection, union = intersection & bitmap, union | bitmap
+        return {
+            'counts': counts,
+            'matrix': matrix,
+            'intersection': len(intersection),
+            'union': len(union),
+        }
+
+
+membership_index = MembershipIndex()
@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# The DDL is frozen here, api/search.py may change after this migration
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_client_search USING fts5(
+        client, email, phone, job_role, status, remarks, lead_owner, company_name,
+        tokenize='trigram'
+    )""",
+    """INSERT INTO api_client_search(rowid, client, email, phone, job_role, status, remarks, lead_owner, company_name)
+    SELECT c.id, c.client, c.email, c.phone, c.job_role, c.status, c.remarks, c.lead_owner, co.company_name
+    FROM api_client c LEFT JOIN api_company co ON co.id = c.company_id""",
+]
+
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS api_client_search",
+]
+
+MYSQL_CREATE = [
+    "CREATE FULLTEXT INDEX api_client_q_ft ON api_client (client, email, phone, job_role) WITH PARSER ngram",
+    "CREATE FULLTEXT INDEX api_client_search_ft ON api_client "
+    "(client, email, phone, job_role, status, remarks, lead_owner) WITH PARSER ngram",
+    "CREATE FULLTEXT INDEX api_company_name_ft ON api_company (company_name) WITH PARSER ngram",
+]
+
+MYSQL_DROP = [
+    "DROP INDEX api_client_q_ft ON api_client",
+    "DROP INDEX api_client_search_ft ON api_client",
+    "DROP INDEX api_company_name_ft ON api_company",
+]
+
+
+def _fts5_enabled(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and _fts5_enabled(schema_editor.connection):
+        statements = SQLITE_CREATE
+    elif vendor == 'mysql':
+        statements = MYSQL_CREATE
+    else:
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_DROP
+    elif vendor == 'mysql':
+        statements = MYSQL_DROP
+    else:
+        statements = []
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_remove_client_media_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    Company = apps.get_model('api', 'Company')
+    Client = apps.get_model('api', 'Client')
+    List = apps.get_model('api', 'List')
+    Membership = List.clients.through
+
+    Company.objects.update(client_count=Coalesce(Subquery(
+        Client.objects.filter(company_id=OuterRef('pk'))
+        .order_by().values('company_id').annotate(n=Count('*')).values('n')
+    ), 0))
+    List.objects.update(client_count=Coalesce(Subquery(
+        Membership.objects.filter(list_id=OuterRef('pk'))
+        .order_by().values('list_id').annotate(n=Count('*')).values('n')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_client_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='client_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='client_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.dedup import company_domain_key, email_key, phone_key
+
+
+def populate_keys(apps, schema_editor):
+    Company = apps.get_model('api', 'Company')
+    Client = apps.get_model('api', 'Client')
+
+    batch = []
+    for company in Company.objects.only('id', 'domain', 'company_email').iterator(chunk_size=2000):
+        company.domain_key = company_domain_key(company.domain, company.company_email)
+        if company.domain_key:
+            batch.append(company)
+        if len(batch) >= 2000:
+            Company.objects.bulk_update(batch, ['domain_key'], batch_size=500)
+            batch = []
+    Company.objects.bulk_update(batch, ['domain_key'], batch_size=500)
+
+    batch = []
+    for client in Client.objects.only('id', 'email', 'phone').iterator(chunk_size=2000):
+        client.email_key = email_key(client.email)
+        client.phone_key = phone_key(client.phone)
+        if client.email_key or client.phone_key:
+            batch.append(client)
+        if len(batch) >= 2000:
+            Client.objects.bulk_update(batch, ['email_key', 'phone_key'], batch_size=500)
+            batch = []
+    Client.objects.bulk_update(batch, ['email_key', 'phone_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_membership_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='domain_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='ClientDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('dismissed', 'Dismissed')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('first', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.client')),
+                ('second', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.client')),
+            ],
+            options={
+                'ordering': ['-score', 'id'],
+                'abstract': False,
+                'unique_together': {('first', 'second')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CompanyDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('dismissed', 'Dismissed')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('first', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.company')),
+                ('second', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.company')),
+            ],
+            options={
+                'ordering': ['-score', 'id'],
+                'abstract': False,
+                'unique_together': {('first', 'second')},
+            },
+        ),
+        migrations.RunPython(populate_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='list',
+            name='filters',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='kind',
+            field=models.CharField(choices=[('static', 'Static - Members added by hand'), ('segment', 'Segment - Members matching filters')], default='static', max_length=10),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_list_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('list_id', models.BigIntegerField()),
+                ('client_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('add', 'Added'), ('remove', 'Removed')], max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('client', 'Client'), ('company', 'Company'), ('list', 'List')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['updated_at', 'id'], name='api_client_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['updated_at', 'id'], name='api_company_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipevent',
+            index=models.Index(fields=['created_at', 'id'], name='api_membership_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershipevent',
+            index=models.Index(fields=['list_id', 'created_at', 'id'], name='api_membership_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'deleted_at', 'id'], name='api_tombstone_feed_idx'),
+        ),
+    ]
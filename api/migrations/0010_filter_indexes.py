@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:52
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from api.indexes import create_platform_indexes, drop_platform_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['-created_at', 'id'], name='api_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['nurturing_stage', '-created_at'], name='api_client_stage_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('lead_owner'), models.OrderBy(models.F('created_at'), descending=True), name='api_client_owner_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('status'), models.OrderBy(models.F('created_at'), descending=True), name='api_client_status_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(django.db.models.functions.text.Lower('job_role'), models.OrderBy(models.F('created_at'), descending=True), name='api_client_role_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(django.db.models.functions.text.Lower('company_name'), name='api_company_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(django.db.models.functions.text.Lower('location'), name='api_company_location_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(django.db.models.functions.text.Lower('industry'), name='api_company_industry_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['kind', '-created_at'], name='api_list_kind_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(django.db.models.functions.text.Lower('folder'), models.OrderBy(models.F('created_at'), descending=True), name='api_list_folder_lower_idx'),
+        ),
+        migrations.RunPython(create_platform_indexes, drop_platform_indexes),
+    ]
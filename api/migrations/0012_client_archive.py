@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedClient',
+            fields=[
+                ('client', models.CharField(blank=True, max_length=100, null=True)),
+                ('job_role', models.CharField(blank=True, max_length=100, null=True)),
+                ('phone', models.CharField(blank=True, max_length=15, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('social_media', models.JSONField(blank=True, default=dict, null=True)),
+                ('status', models.CharField(blank=True, max_length=50, null=True)),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('lead_owner', models.CharField(blank=True, max_length=100, null=True)),
+                ('nurturing_stage', models.CharField(blank=True, choices=[('hot', 'Hot - Highly Interested'), ('warm', 'Warm - Moderately Interested'), ('cold', 'Cold - Not Interested')], default='warm', max_length=10, null=True)),
+                ('email_key', models.CharField(blank=True, db_index=True, editable=False, max_length=254, null=True)),
+                ('phone_key', models.CharField(blank=True, db_index=True, editable=False, max_length=20, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_clients', to='api.company')),
+                ('lists', models.ManyToManyField(blank=True, related_name='archived_clients', to='api.list')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at', 'id'], name='api_archived_created_idx')],
+            },
+        ),
+    ]
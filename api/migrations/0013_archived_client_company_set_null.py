@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_client_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedclient',
+            name='company',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_clients', to='api.company'),
+        ),
+    ]
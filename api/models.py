@@ -1,5 +1,8 @@
 # models.py
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 class Company(models.Model):
     # Company Information
@@ -8,17 +11,30 @@ class Company(models.Model):
     location = models.CharField(max_length=150, null=True, blank=True)
     industry = models.CharField(max_length=100, null=True, blank=True)
     company_email = models.EmailField(null=True, blank=True)
+    # Maintained by api/counters.py
+    client_count = models.PositiveIntegerField(default=0, editable=False)
+    # Registrable domain, maintained by api/dedup.py
+    domain_key = models.CharField(max_length=100, null=True, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Companies"
+        indexes = [
+            # Change feed (?updated_since=)
+            models.Index(fields=['updated_at', 'id'], name='api_company_updated_idx'),
+            # Case-folded ?company__exact= / ?location__prefix= style filters
+            models.Index(Lower('company_name'), name='api_company_name_lower_idx'),
+            models.Index(Lower('location'), name='api_company_location_lower_idx'),
+            models.Index(Lower('industry'), name='api_company_industry_lower_idx'),
+        ]
     
     def __str__(self):
         return self.company_name
 
-class Client(models.Model):
+class ClientFields(models.Model):
+    """Client columns, shared with ArchivedClient so archiving copies rows as they are"""
     NURTURING_STAGES = [
         ('hot', 'Hot - Highly Interested'),
         ('warm', 'Warm - Moderately Interested'),
@@ -51,30 +67,205 @@ class Client(models.Model):
         blank=True
     )
     
+    # Dedup blocking keys, maintained by api/dedup.py
+    email_key = models.CharField(max_length=254, null=True, blank=True, editable=False, db_index=True)
+    phone_key = models.CharField(max_length=20, null=True, blank=True, editable=False, db_index=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        abstract = True
+
+class Client(ClientFields):
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Change feed (?updated_since=)
+            models.Index(fields=['updated_at', 'id'], name='api_client_updated_idx'),
+            # Default list / keyset order
+            models.Index(fields=['-created_at', 'id'], name='api_client_created_idx'),
+            # Filters, each followed by the list order
+            models.Index(fields=['nurturing_stage', '-created_at'], name='api_client_stage_created_idx'),
+            models.Index(Lower('lead_owner'), F('created_at').desc(), name='api_client_owner_lower_idx'),
+            models.Index(Lower('status'), F('created_at').desc(), name='api_client_status_lower_idx'),
+            models.Index(Lower('job_role'), F('created_at').desc(), name='api_client_role_lower_idx'),
+            # social_media platform indexes are vendor-specific, see api/indexes.py
+        ]
     
     def __str__(self):
         return self.client or f"Client {self.id}"
 
 class List(models.Model):
+    KINDS = [
+        ('static', 'Static - Members added by hand'),
+        ('segment', 'Segment - Members matching filters'),
+    ]
+    
     name = models.CharField(max_length=100)
     folder = models.CharField(max_length=100, null=True, blank=True)
     clients = models.ManyToManyField(Client, related_name='lists', blank=True)
+    kind = models.CharField(max_length=10, choices=KINDS, default='static')
+    # Segment definition, the GET /api/clients/ params (see api/segments.py)
+    filters = models.JSONField(default=dict, blank=True)
+    # Maintained by api/counters.py
+    client_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['kind', '-created_at'], name='api_list_kind_created_idx'),
+            models.Index(Lower('folder'), F('created_at').desc(), name='api_list_folder_lower_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
     @property
     def count(self):
-        """Dynamic count of clients in the list"""
-        return self.clients.count()
+        """Stored count of clients in the list"""
+        return self.client_count
+
+class ArchivedClient(ClientFields):
+    """A long-cold client moved out of the active table (see api/archive.py)"""
+    # The client's own id, kept so a restore puts the row back as it was
+    id = models.BigIntegerField(primary_key=True)
+    # Own reverse names, Company.clients stays the active set. Deleting a
+    # company keeps its archived clients, as a restore may still want them
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.SET_NULL,
+        related_name='archived_clients',
+        null=True,
+        blank=True
+    )
+    # The client's List memberships while archived
+    lists = models.ManyToManyField(List, related_name='archived_clients', blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Merged into the client list order (?include_archived=true)
+            models.Index(fields=['-created_at', 'id'], name='api_archived_created_idx'),
+        ]
+    
+    def __str__(self):
+        return self.client or f"Archived client {self.id}"
+
+class DuplicateCandidate(models.Model):
+    """A pair of rows that share a blocking key, ``first_id < second_id``"""
+    STATUSES = [
+        ('open', 'Open'),
+        ('dismissed', 'Dismissed'),
+    ]
+    
+    score = models.FloatField()
+    reasons = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUSES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        abstract = True
+        ordering = ['-score', 'id']
+
+class ClientDuplicate(DuplicateCandidate):
+    first = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='+')
+    second = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta(DuplicateCandidate.Meta):
+        unique_together = [('first', 'second')]
+
+class CompanyDuplicate(DuplicateCandidate):
+    first = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='+')
+    second = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta(DuplicateCandidate.Meta):
+        unique_together = [('first', 'second')]
+
+class Tombstone(models.Model):
+    """A deleted row, kept for the change feed (see api/changes.py)"""
+    MODELS = [
+        ('client', 'Client'),
+        ('company', 'Company'),
+        ('list', 'List'),
+    ]
+    
+    model = models.CharField(max_length=10, choices=MODELS)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['model', 'deleted_at', 'id'], name='api_tombstone_feed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+class MembershipEvent(models.Model):
+    """A client added to / removed from a list, for the change feed"""
+    ACTIONS = [
+        ('add', 'Added'),
+        ('remove', 'Removed'),
+    ]
+    
+    # Plain ids, events outlive the rows they mention
+    list_id = models.BigIntegerField()
+    client_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='api_membership_event_idx'),
+            models.Index(fields=['list_id', 'created_at', 'id'], name='api_membership_list_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} client {self.client_id} list {self.list_id}"
+
+class Job(models.Model):
+    """A background operation, run by the ``run_jobs`` worker (see api/jobs.py)"""
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    progress_done = models.PositiveBigIntegerField(default=0)
+    progress_total = models.PositiveBigIntegerField(null=True, blank=True)
+    # Checkpoints while running, the handler's result once succeeded
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Resubmitting with the same Idempotency-Key returns the existing job
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Lease of the worker running the job, an expired lease is taken over
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'run_after', 'id'], name='api_job_queue_idx'),
+            models.Index(fields=['-created_at', 'id'], name='api_job_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
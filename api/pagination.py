@@ -0,0 +1,235 @@
+# pagination.py
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique ordering, ``(-created_at, id)`` by default.
+
+    Each page is fetched with a ``WHERE (created_at, id) < cursor`` style
+    predicate, so deep pages cost the same as the first one. The total is
+    controlled by ``?count=exact|approx|none``.
+    """
+    ordering = ('-created_at', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    default_count = 'exact'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 100)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+        self.approx_count_limit = getattr(settings, 'API_APPROX_COUNT_LIMIT', 10000)
+
+    # ----- cursor encoding -----
+
+    def encode_cursor(self, values, reverse=False):
+        payload = {'v': [self._dump(value) for value in values]}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = self.get_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            payload = json.loads(raw)
+            values = payload['v']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            values = [self._load(field, value) for field, value in zip(self.ordering, values)]
+        except (TypeError, KeyError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return values, bool(payload.get('r'))
+
+    def _dump(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def _load(self, field, value):
+        name = field.lstrip('-')
+        try:
+            model_field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return model_field.to_python(value)
+
+    # ----- paging -----
+
+    def get_params(self, request):
+        # DRF requests and plain Django ones (the async views)
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            size = int(self.get_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_count(self, queryset, request):
+        """Total for the filtered queryset according to ``?count=``"""
+        mode = self.get_params(request).get(self.count_query_param, self.default_count)
+        self.count_approximate = False
+        if mode == 'none':
+            return None
+        if mode == 'approx':
+            limit = self.approx_count_limit
+            count = queryset.order_by()[:limit + 1].count()
+            if count > limit:
+                self.count_approximate = True
+                return limit
+            return count
+        return queryset.order_by().count()
+
+    def _keyset_q(self, values, reverse):
+        """``(f1, f2, ...) > (v1, v2, ...)`` honouring each field's direction"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_total(self, querysets, request):
+        """``get_count()`` of several querysets added up"""
+        total, approximate = 0, False
+        for queryset in querysets:
+            count = self.get_count(queryset, request)
+            if count is None:
+                return None
+            total += count
+            approximate = approximate or self.count_approximate
+        self.count_approximate = approximate
+        return total
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.prepare(queryset, request)
+        self.count = self.get_count(queryset, request)
+        return self.finish(list(page_queryset))
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        ``paginate_queryset()`` over querysets with the same ordering fields,
+        e.g. active and archived clients: each fetches its own page with the
+        cursor, the pages are merged and the counts added up.
+        """
+        if len(querysets) == 1:
+            return self.paginate_queryset(querysets[0], request, view)
+        pages = [self.prepare(queryset, request) for queryset in querysets]
+        self.count = self.get_total(querysets, request)
+        return self.finish(self.merge([list(page) for page in pages]))
+
+    def prepare(self, queryset, request):
+        """
+        The queryset fetching the page, ``page_size + 1`` rows to tell if
+        there is more. ``get_count()`` and the fetch don't depend on each
+        other, so the async views run them concurrently.
+        """
+        self.request = request
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        self.count_approximate = False
+
+        values, self.reverse = self.decode_cursor(request)
+        self.has_cursor = values is not None
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(f[1:] if f.startswith('-') else f'-{f}' for f in ordering)
+        self.fetch_ordering = ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._keyset_q(values, self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def merge(self, pages):
+        """Rows of several ``prepare()`` fetches as one fetch, in the same order"""
+        rows = [row for page in pages for row in page]
+        # Stable sorts, least significant field first
+        for field in reversed(self.fetch_ordering):
+            name = field.lstrip('-')
+            rows.sort(key=lambda row: self._value(row, name), reverse=field.startswith('-'))
+        return rows[:self.page_size + 1]
+
+    def finish(self, rows):
+        """Turn the fetched rows into the page"""
+        reverse = self.reverse
+        has_more = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        # Moving backwards there is always a next page, and vice versa
+        self.has_next = has_more if not reverse else True
+        self.has_previous = (has_more if reverse else self.has_cursor) and bool(page)
+        if reverse and not page:
+            self.has_next = False
+        self.page = page
+        return page
+
+    def ordering_fields(self):
+        """Names a ``.values()`` queryset must include to build cursors"""
+        return [field.lstrip('-') for field in self.ordering]
+
+    def _value(self, row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def _row_values(self, row):
+        return [self._value(row, name) for name in self.ordering_fields()]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self._row_values(self.page[-1]))
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self._row_values(self.page[0]), reverse=True)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_resume_cursor(self):
+        """Cursor after the last row of the page, to poll a feed from later on"""
+        if not self.page:
+            return self.get_params(self.request).get(self.cursor_query_param)
+        return self.encode_cursor(self._row_values(self.page[-1]))
+
+    def get_paginated_data(self):
+        """Pagination metadata to merge into a custom response body"""
+        data = OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count_approximate:
+            data['count_approximate'] = True
+        return data
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([*self.get_paginated_data().items(), ('results', data)]))
@@ -0,0 +1,308 @@
+# profiling.py
+"""
+Per-request performance instrumentation.
+
+``ProfilingMiddleware`` times every request into an in-process rolling
+histogram per endpoint (served by ``GET /api/metrics/``). A sample of
+requests, ``PROFILING_SAMPLE_RATE``, is profiled in depth: every SQL query
+is timed through ``connection.execute_wrapper``, row serialization (code
+wrapped in ``serializing()``, the FastClientSerializer pages) and response
+rendering are timed apart from the view, the body size is measured, and
+the same statement running
+``PROFILING_DUPLICATE_THRESHOLD`` times or more is flagged as a likely N+1.
+Profiled requests get a ``Server-Timing`` header and one JSON log line on
+the ``api.profiling`` logger; slow queries are logged on their own.
+
+The middleware runs sync or async. Queries are attributed to the request
+through a context variable checked by a hook installed once on every
+connection, so the queries async views run in worker threads are counted
+too (``sync_to_async`` carries the context over).
+"""
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('api.profiling')
+
+# Upper bounds of the latency buckets in milliseconds, the last one is open
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook counting and timing the queries of one request"""
+
+    def __init__(self, slow_ms):
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statements = Counter()
+        self.slow = []
+        # Async views run independent queries in parallel threads
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.count += 1
+                self.seconds += elapsed
+                # Placeholders keep the parameters out, so N+1 lookups share a key
+                self.statements[sql] += 1
+                if elapsed * 1000 >= self.slow_ms:
+                    self.slow.append((sql, elapsed, context['connection'].alias))
+
+    def duplicates(self, threshold):
+        """``[(sql, times)]`` of statements run at least ``threshold`` times"""
+        return [(sql, times) for sql, times in self.statements.most_common() if times >= threshold]
+
+
+class RollingHistogram:
+    """
+    Latency buckets per endpoint over the last ``window`` seconds, kept as
+    ``slices`` time slices that are dropped as they age out.
+    """
+
+    def __init__(self, window=300, slices=10):
+        self.window = window
+        self.slice_seconds = max(1, window // slices)
+        self.slices = {}
+        self.lock = threading.Lock()
+
+    def _slice(self, now):
+        key = int(now // self.slice_seconds)
+        if key not in self.slices:
+            oldest = key - self.window // self.slice_seconds
+            for stale in [k for k in self.slices if k <= oldest]:
+                del self.slices[stale]
+            self.slices[key] = {}
+        return self.slices[key]
+
+    def record(self, route, wall_ms, status, profile=None):
+        with self.lock:
+            routes = self._slice(time.time())
+            stats = routes.get(route)
+            if stats is None:
+                stats = routes[route] = {
+                    'count': 0, 'errors': 0, 'total_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1),
+                    'profiled': 0, 'queries': 0, 'sql_ms': 0.0, 'serialize_ms': 0.0, 'render_ms': 0.0,
+                    'duplicate_queries': 0,
+                }
+            stats['count'] += 1
+            stats['errors'] += status >= 500
+            stats['total_ms'] += wall_ms
+            stats['buckets'][bisect.bisect_left(BUCKETS_MS, wall_ms)] += 1
+            if profile:
+                stats['profiled'] += 1
+                stats['queries'] += profile['queries']
+                stats['sql_ms'] += profile['sql_ms']
+                stats['serialize_ms'] += profile['serialize_ms']
+                stats['render_ms'] += profile['render_ms']
+                stats['duplicate_queries'] += bool(profile['duplicate_queries'])
+
+    def snapshot(self):
+        """Merged stats per endpoint with estimated percentiles"""
+        with self.lock:
+            self._slice(time.time())
+            merged = {}
+            for routes in self.slices.values():
+                for route, stats in routes.items():
+                    into = merged.get(route)
+                    if into is None:
+                        merged[route] = {**stats, 'buckets': list(stats['buckets'])}
+                        continue
+                    for key, value in stats.items():
+                        if key == 'buckets':
+                            into['buckets'] = [a + b for a, b in zip(into['buckets'], value)]
+                        else:
+                            into[key] += value
+        return {route: self._summary(stats) for route, stats in sorted(merged.items())}
+
+    def _summary(self, stats):
+        count, profiled = stats['count'], stats['profiled']
+        labels = [f'{bound}' for bound in BUCKETS_MS] + ['+Inf']
+        return {
+            'count': count,
+            'errors': stats['errors'],
+            'mean_ms': round(stats['total_ms'] / count, 2),
+            'p50_ms': self._percentile(stats['buckets'], count, 0.50),
+            'p95_ms': self._percentile(stats['buckets'], count, 0.95),
+            'p99_ms': self._percentile(stats['buckets'], count, 0.99),
+            'buckets_ms': dict(zip(labels, stats['buckets'])),
+            'profiled': profiled,
+            'queries_mean': round(stats['queries'] / profiled, 1) if profiled else None,
+            'sql_ms_mean': round(stats['sql_ms'] / profiled, 2) if profiled else None,
+            'serialize_ms_mean': round(stats['serialize_ms'] / profiled, 2) if profiled else None,
+            'render_ms_mean': round(stats['render_ms'] / profiled, 2) if profiled else None,
+            'duplicate_query_requests': stats['duplicate_queries'],
+        }
+
+    def _percentile(self, buckets, count, fraction):
+        """Upper bound of the bucket holding the percentile, None past the last bound"""
+        rank = fraction * count
+        seen = 0
+        for bound, hits in zip(BUCKETS_MS, buckets):
+            seen += hits
+            if seen >= rank:
+                return bound
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.slices.clear()
+
+
+histogram = RollingHistogram(window=_setting('PROFILING_WINDOW_SECONDS', 300))
+
+# The recorder of the request being profiled, if any
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@contextmanager
+def serializing():
+    """Count the block as serialization of the request being profiled, if any"""
+    recorder = current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with recorder.lock:
+            recorder.serialize_seconds += elapsed
+
+
+def install_hook(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_hook)
+
+
+class ProfilingMiddleware:
+    """Times every request, profiles a sample of them (see module docstring)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install_hook(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        recorder, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                current_recorder.reset(token)
+        return self.finish(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        recorder, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                current_recorder.reset(token)
+        return self.finish(request, response, start, recorder)
+
+    def start(self, request):
+        """``(recorder, token)`` for a sampled request, ``(None, None)`` otherwise"""
+        if random.random() >= _setting('PROFILING_SAMPLE_RATE', 0.01):
+            return None, None
+        recorder = QueryRecorder(_setting('PROFILING_SLOW_QUERY_MS', 200))
+        request._profiling_render_start = None
+        return recorder, current_recorder.set(recorder)
+
+    def finish(self, request, response, start, recorder):
+        end = time.perf_counter()
+        if recorder is None:
+            histogram.record(self.route(request), (end - start) * 1000, response.status_code)
+            return response
+
+        render_start = request._profiling_render_start
+        profile = {
+            'method': request.method,
+            'path': request.path,
+            'route': self.route(request),
+            'status': response.status_code,
+            'wall_ms': round((end - start) * 1000, 2),
+            'queries': recorder.count,
+            'sql_ms': round(recorder.seconds * 1000, 2),
+            'serialize_ms': round(recorder.serialize_seconds * 1000, 2),
+            'render_ms': round((end - render_start) * 1000, 2) if render_start else 0.0,
+            # Streamed bodies are produced after the middleware returns
+            'bytes': None if response.streaming else len(response.content),
+            'duplicate_queries': [
+                {'sql': sql, 'count': times}
+                for sql, times in recorder.duplicates(_setting('PROFILING_DUPLICATE_THRESHOLD', 5))
+            ],
+        }
+        histogram.record(profile['route'], profile['wall_ms'], response.status_code, profile)
+        response['Server-Timing'] = self.server_timing(profile)
+        self.log(profile, recorder.slow)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF renders the response data
+        if hasattr(request, '_profiling_render_start'):
+            request._profiling_render_start = time.perf_counter()
+        return response
+
+    def route(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return f'{request.method} {match.view_name if match else "unmatched"}'
+
+    def server_timing(self, profile):
+        return ', '.join([
+            f'db;dur={profile["sql_ms"]};desc="{profile["queries"]} queries"',
+            f'serialize;dur={profile["serialize_ms"]}',
+            f'render;dur={profile["render_ms"]}',
+            f'total;dur={profile["wall_ms"]}',
+        ])
+
+    def log(self, profile, slow):
+        level = logging.WARNING if profile['duplicate_queries'] else logging.INFO
+        logger.log(level, json.dumps({'event': 'request', **profile}))
+        for sql, elapsed, alias in slow:
+            logger.warning(json.dumps({
+                'event': 'slow_query', 'route': profile['route'], 'database': alias,
+                'ms': round(elapsed * 1000, 2), 'sql': sql,
+            }))
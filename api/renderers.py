@@ -0,0 +1,65 @@
+# renderers.py
+"""
+Fast JSON rendering.
+
+``dumps()`` encodes with orjson when it is installed and with the stdlib
+``json`` module otherwise, producing the same JSON as DRF's JSONRenderer:
+datetimes in ISO 8601 with ``Z`` for UTC, Decimals as numbers, lazy
+strings, UUIDs and querysets through DRF's JSONEncoder, ``U+2028`` /
+``U+2029`` escaped. ``FastJSONRenderer`` is the DRF renderer built on it,
+set in ``REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']``; the async views,
+JSON lines exports and response ETags use ``dumps()`` directly.
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+
+_LINE_SEPARATOR = '\u2028'.encode()
+_PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    # Decimals, lazy strings, querysets... the way DRF encodes them
+    return _encoder.default(value)
+
+
+def _escape(content):
+    """Keep the output a strict JavaScript subset, like DRF"""
+    if _LINE_SEPARATOR in content or _PARAGRAPH_SEPARATOR in content:
+        content = content.replace(_LINE_SEPARATOR, b'\\u2028').replace(_PARAGRAPH_SEPARATOR, b'\\u2029')
+    return content
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes of ``data``"""
+    if orjson is not None:
+        try:
+            return _escape(orjson.dumps(data, default=_default, option=_OPTIONS))
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits, recursion limits...
+            pass
+    content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return _escape(content.encode())
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding through ``dumps()``, indented output stays with DRF"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
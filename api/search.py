@@ -0,0 +1,216 @@
+# search.py
+"""
+Full-text search over clients.
+
+SQLite keeps a trigram FTS5 table (``api_client_search``) that is updated
+from model signals and from the ``clients_changed`` signal sent by bulk
+writes (see api/signals.py). MySQL uses ngram FULLTEXT indexes on the
+tables themselves. Any other backend, and terms too short for a trigram,
+fall back to the original ``icontains`` scan so results stay the same.
+Only active clients are indexed, archived ones (see api/archive.py) are
+always scanned.
+"""
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'api_client_search'
+
+# The table the index covers
+INDEXED_TABLE = 'api_client'
+
+# Columns searched by each query param
+SEARCH_FIELDS = {
+    'q': ['client', 'email', 'phone', 'job_role'],
+    'search': [
+        'client', 'email', 'phone', 'job_role',
+        'status', 'remarks', 'lead_owner', 'company_name',
+    ],
+}
+
+# Trigram tokens need at least 3 characters to match anything
+MIN_INDEXED_LENGTH = 3
+
+_SELECT_DOCUMENTS = (
+    "SELECT c.id, c.client, c.email, c.phone, c.job_role, c.status, c.remarks, "
+    "c.lead_owner, co.company_name "
+    "FROM api_client c LEFT JOIN api_company co ON co.id = c.company_id"
+)
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        client, email, phone, job_role, status, remarks, lead_owner, company_name,
+        tokenize='trigram'
+    )""",
+]
+
+# Keep IN (...) lists under SQLite's variable limit
+INDEX_CHUNK_SIZE = 500
+
+
+def _quote(term):
+    """Quote a user term as a single phrase for MATCH"""
+    return '"%s"' % term.replace('"', '""')
+
+
+def fallback_q(term, fields):
+    """The original icontains predicate for the given fields"""
+    condition = Q()
+    for field in fields:
+        lookup = 'company__company_name' if field == 'company_name' else field
+        condition |= Q(**{f'{lookup}__icontains': term})
+    return condition
+
+
+class ClientSearch:
+    """Applies ``q`` / ``search`` terms to a Client queryset"""
+
+    _available = {}
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def is_available(self):
+        """Whether the search index exists on this database"""
+        if self.using not in self._available:
+            vendor = self.connection.vendor
+            if vendor == 'sqlite':
+                tables = self.connection.introspection.table_names()
+                available = SEARCH_TABLE in tables
+            elif vendor == 'mysql':
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT COUNT(*) FROM information_schema.statistics "
+                        "WHERE table_schema = DATABASE() AND index_name = 'api_client_search_ft'"
+                    )
+                    available = cursor.fetchone()[0] > 0
+            else:
+                available = False
+            self._available[self.using] = available
+        return self._available[self.using]
+
+    def condition(self, term, fields):
+        """Return a Q matching clients that contain ``term`` in any of ``fields``"""
+        if len(term) < MIN_INDEXED_LENGTH or not self.is_available():
+            return fallback_q(term, fields)
+
+        if self.connection.vendor == 'sqlite':
+            match = '{%s} : %s' % (' '.join(fields), _quote(term))
+            return Q(id__in=RawSQL(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match]
+            ))
+
+        # MATCH() column lists must equal the FULLTEXT index column lists
+        # created by migration 0004
+        client_fields = [f for f in fields if f != 'company_name']
+        condition = Q(id__in=RawSQL(
+            f"SELECT id FROM api_client WHERE MATCH({', '.join(client_fields)}) "
+            f"AGAINST (%s IN BOOLEAN MODE)", [_quote(term)]
+        ))
+        if 'company_name' in fields:
+            condition |= Q(company_id__in=RawSQL(
+                "SELECT id FROM api_company WHERE MATCH(company_name) "
+                "AGAINST (%s IN BOOLEAN MODE)", [_quote(term)]
+            ))
+        return condition
+
+    def rank(self, term, fields):
+        """Return an expression scoring relevance (lower is better), or None"""
+        if len(term) < MIN_INDEXED_LENGTH or not self.is_available():
+            return None
+
+        if self.connection.vendor == 'sqlite':
+            match = '{%s} : %s' % (' '.join(fields), _quote(term))
+            return RawSQL(
+                f"SELECT rank FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = api_client.id", [match]
+            )
+
+        client_fields = [f for f in fields if f != 'company_name']
+        return RawSQL(
+            f"-MATCH(api_client.{', api_client.'.join(client_fields)}) AGAINST (%s IN BOOLEAN MODE)",
+            [_quote(term)]
+        )
+
+    def filter(self, queryset, term, param='search', ranked=False):
+        """Filter ``queryset`` by ``term`` using the fields searched by ``param``"""
+        fields = SEARCH_FIELDS[param]
+        indexed = queryset.model._meta.db_table == INDEXED_TABLE
+        queryset = queryset.filter(self.condition(term, fields) if indexed else fallback_q(term, fields))
+        if ranked and (rank := self.rank(term, fields)) is not None:
+            if not indexed:
+                # Ranks are <= 0, unindexed rows come after every indexed match
+                rank = Value(0.0, output_field=FloatField())
+            queryset = queryset.annotate(search_rank=rank).order_by('search_rank', '-created_at')
+        return queryset
+
+    def _uses_table(self):
+        return self.connection.vendor == 'sqlite' and self.is_available()
+
+    def index_clients(self, client_ids):
+        """(Re)index the given clients, MySQL FULLTEXT indexes maintain themselves"""
+        if not self._uses_table():
+            return
+        client_ids = list(client_ids)
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(client_ids), INDEX_CHUNK_SIZE):
+                chunk = client_ids[start:start + INDEX_CHUNK_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", chunk)
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE}(rowid, client, email, phone, job_role, status, "
+                    f"remarks, lead_owner, company_name) {_SELECT_DOCUMENTS} WHERE c.id IN ({placeholders})",
+                    chunk
+                )
+
+    def remove_clients(self, client_ids):
+        if not self._uses_table():
+            return
+        client_ids = list(client_ids)
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(client_ids), INDEX_CHUNK_SIZE):
+                chunk = client_ids[start:start + INDEX_CHUNK_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+    def rename_company(self, company_id, company_name):
+        """Propagate a company rename to its clients' documents"""
+        if not self._uses_table():
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SEARCH_TABLE} SET company_name = %s "
+                f"WHERE rowid IN (SELECT id FROM api_client WHERE company_id = %s)",
+                [company_name, company_id]
+            )
+
+    def rebuild(self):
+        """Rebuild the index from scratch, returns the number of indexed clients"""
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'sqlite':
+                for statement in SQLITE_SCHEMA:
+                    cursor.execute(statement)
+                cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+                cursor.execute(
+                    f"INSERT INTO {SEARCH_TABLE}(rowid, client, email, phone, job_role, status, "
+                    f"remarks, lead_owner, company_name) {_SELECT_DOCUMENTS}"
+                )
+                cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+                cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+            elif self.connection.vendor == 'mysql':
+                cursor.execute("OPTIMIZE TABLE api_client, api_company")
+                cursor.fetchall()
+                cursor.execute("SELECT COUNT(*) FROM api_client")
+            else:
+                return 0
+            count = cursor.fetchone()[0]
+        self._available.pop(self.using, None)
+        return count
+
+
+client_search = ClientSearch()
+
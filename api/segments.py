@@ -0,0 +1,116 @@
+# segments.py
+"""
+Segment lists: a List whose members are the clients matching ``filters``,
+the same params ``GET /api/clients/`` takes.
+
+Membership is materialized into the List.clients table, so reading a
+segment costs the same as reading a static list. A new or edited segment
+is refreshed in full with an ``INSERT ... SELECT`` and a ``DELETE ... NOT
+IN``; client writes re-evaluate only the touched clients against each
+segment's predicate (see api/signals.py).
+"""
+from django.db import connections, router, transaction
+
+from .changes import log_memberships, record_membership_events
+from .filters import client_filters
+from .models import Client, List
+
+Membership = List.clients.through
+
+# Params of client_filters a segment may use
+SEGMENT_FILTERS = client_filters.params
+
+# Keep IN (...) lists under SQLite's variable limit
+EVALUATE_CHUNK_SIZE = 500
+
+
+def segment_queryset(filters, queryset=None):
+    """Clients matching a segment definition"""
+    if queryset is None:
+        queryset = Client.objects.all()
+    return client_filters.filter(queryset, filters).order_by()
+
+
+class Segments:
+    """Keeps materialized segment membership up to date"""
+
+    def __init__(self, using=None):
+        self.using = using or router.db_for_write(Membership)
+        self.connection = connections[self.using]
+        self.table = self.connection.ops.quote_name(Membership._meta.db_table)
+
+    def _changed(self, deltas):
+        from .signals import memberships_changed
+
+        if deltas:
+            memberships_changed.send(sender=List, deltas=deltas, using=self.using)
+
+    def refresh(self, segment):
+        """Re-run a segment's filters over every client, returns added / removed counts"""
+        matching = segment_queryset(segment.filters).values('id')
+        select_sql, params = matching.query.sql_with_params()
+        with transaction.atomic(using=self.using):
+            log_memberships(
+                self.using, 'remove',
+                f"SELECT t.list_id, t.client_id FROM {self.table} t "
+                f"WHERE t.list_id = %s AND t.client_id NOT IN ({select_sql})",
+                [segment.pk, *params]
+            )
+            removed, _ = (
+                Membership.objects.using(self.using)
+                .filter(list_id=segment.pk).exclude(client_id__in=matching).delete()
+            )
+            select = (
+                f"SELECT %s AS list_id, m.id AS client_id FROM ({select_sql}) m "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {self.table} x WHERE x.list_id = %s AND x.client_id = m.id)"
+            )
+            select_params = [segment.pk, *params, segment.pk]
+            log_memberships(self.using, 'add', select, select_params)
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {self.table} (list_id, client_id) {select}", select_params)
+                added = cursor.rowcount
+            if added or removed:
+                self._changed({segment.pk: added - removed})
+        return {'added': added, 'removed': removed}
+
+    def evaluate(self, client_ids):
+        """Re-check only ``client_ids`` against every segment, returns the changed list ids"""
+        client_ids = list(client_ids)
+        segments = list(List.objects.filter(kind='segment').values_list('id', 'filters'))
+        if not client_ids or not segments:
+            return set()
+
+        deltas = {}
+        with transaction.atomic(using=self.using):
+            for start in range(0, len(client_ids), EVALUATE_CHUNK_SIZE):
+                chunk = client_ids[start:start + EVALUATE_CHUNK_SIZE]
+                current = {}
+                for list_id, client_id in (
+                    Membership.objects.filter(list_id__in=[pk for pk, _ in segments], client_id__in=chunk)
+                    .values_list('list_id', 'client_id')
+                ):
+                    current.setdefault(list_id, set()).add(client_id)
+
+                for list_id, filters in segments:
+                    matching = set(segment_queryset(filters, Client.objects.filter(id__in=chunk))
+                                   .values_list('id', flat=True))
+                    members = current.get(list_id, set())
+                    if added := matching - members:
+                        Membership.objects.bulk_create(
+                            [Membership(list_id=list_id, client_id=client_id) for client_id in added],
+                            ignore_conflicts=True,
+                        )
+                        record_membership_events('add', [(list_id, client_id) for client_id in added])
+                    if removed := members - matching:
+                        Membership.objects.filter(list_id=list_id, client_id__in=removed).delete()
+                        record_membership_events('remove', [(list_id, client_id) for client_id in removed])
+                    if added or removed:
+                        deltas[list_id] = deltas.get(list_id, 0) + len(added) - len(removed)
+            self._changed(deltas)
+        return set(deltas)
+
+    def evaluate_company(self, company_id):
+        """Re-check a company's clients, company fields feed several filters"""
+        if not List.objects.filter(kind='segment').exists():
+            return set()
+        return self.evaluate(Client.objects.filter(company_id=company_id).values_list('id', flat=True))
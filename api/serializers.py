@@ -1,21 +1,154 @@
 # serializers.py
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Company, Client, List
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+from .list_ops import ListOperations
+from .models import Company, Client, ClientDuplicate, CompanyDuplicate, Job, List, MembershipEvent, Tombstone
+from .profiling import serializing
+from .segments import SEGMENT_FILTERS
 
-class CompanySerializer(serializers.ModelSerializer):
-    client_count = serializers.SerializerMethodField()
+# Keep IN (...) lists under SQLite's variable limit
+PK_CHUNK_SIZE = 500
+
+
+class EagerLoadingMixin:
+    """
+    Serializers declare the relations and annotations they read, and the
+    viewsets apply them to the queryset so a page costs a fixed number of
+    queries regardless of its size.
+    """
+    select_related = []
+    prefetch_related = []
+    annotations = {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if prefetch_related := cls.get_prefetch_related():
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if cls.annotations:
+            queryset = queryset.annotate(**cls.annotations)
+        return queryset
+
+    @classmethod
+    def get_prefetch_related(cls):
+        return cls.prefetch_related
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField resolving ids in chunked ``pk__in`` queries
+    instead of one ``get()`` per id. With ``many=True`` it validates to the
+    list of primary keys, not instances. A ``many=True`` parent serializer
+    can ``preload()`` the ids of every row before validating them.
+    """
+
+    def __init__(self, **kwargs):
+        self.preloaded = None
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        """``data`` as a primary key value, or a validation error"""
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def chunks(self, pks):
+        queryset = self.get_queryset()
+        pks = list(pks)
+        for start in range(0, len(pks), PK_CHUNK_SIZE):
+            yield queryset.filter(pk__in=pks[start:start + PK_CHUNK_SIZE])
+
+    def existing(self, pks):
+        """Which of ``pks`` exist"""
+        found = set()
+        for chunk in self.chunks(pks):
+            found.update(chunk.values_list('pk', flat=True))
+        return found
+
+    def preload(self, values):
+        """Resolve ``values`` at once, to_internal_value() then looks them up"""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except serializers.ValidationError:
+                continue
+        self.preloaded = dict.fromkeys(pks)
+        for chunk in self.chunks(pks):
+            self.preloaded.update((instance.pk, instance) for instance in chunk)
+
+    def to_internal_value(self, data):
+        if self.preloaded is None:
+            return super().to_internal_value(data)
+        pk = self.to_pk(data)
+        if pk not in self.preloaded:
+            return super().to_internal_value(data)
+        if (instance := self.preloaded[pk]) is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """``many=True`` BulkPrimaryKeyRelatedField, every missing id is reported at once"""
+    default_error_messages = {
+        'does_not_exist': 'Invalid pk(s) - object(s) do not exist: {pk_values}.',
+    }
+    # Off for ids that only need to be well-formed, e.g. ones to remove
+    check_exists = True
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = list(dict.fromkeys(self.child_relation.to_pk(item) for item in data))
+        if self.check_exists:
+            found = self.child_relation.existing(pks)
+            if missing := [pk for pk in pks if pk not in found]:
+                self.fail('does_not_exist', pk_values=', '.join(str(pk) for pk in missing))
+        return pks
+
+
+class CompanySerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    client_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Company
-        fields = '__all__'
+        exclude = ['domain_key']
         read_only_fields = ['created_at', 'updated_at', 'client_count']
-    
-    def get_client_count(self, obj):
-        return obj.clients.count()
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientListSerializer(serializers.ListSerializer):
+    """Many clients at once, their ``company_id`` values resolved together"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.fields['company_id'].preload(
+                row['company_id'] for row in data if isinstance(row, dict) and row.get('company_id') is not None
+            )
+        return super().to_internal_value(data)
+
+class ClientSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     company_name = serializers.CharField(source='company.company_name', read_only=True)
-    company_id = serializers.PrimaryKeyRelatedField(
+    company_id = BulkPrimaryKeyRelatedField(
         queryset=Company.objects.all(),
         source='company',
         write_only=True,
@@ -25,8 +158,11 @@ class ClientSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Client
-        fields = '__all__'
+        exclude = ['email_key', 'phone_key']
         read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = ClientListSerializer
+    
+    select_related = ['company']
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -41,9 +177,123 @@ class ClientSerializer(serializers.ModelSerializer):
             representation['company'] = None
         return representation
 
-class ListSerializer(serializers.ModelSerializer):
-    count = serializers.IntegerField(read_only=True)
-    client_ids = serializers.PrimaryKeyRelatedField(
+class FastClientSerializer:
+    """
+    Read-only ClientSerializer for ``.values()`` rows.
+
+    The field plan (output key, ORM lookup, converter) is compiled once from
+    ClientSerializer, so the default output is identical to it while rows
+    skip model instances and per-field DRF machinery. ``fields`` narrows
+    the output (and the SELECT); ``expand=['company']`` renders ``company``
+    as the nested object instead of its id.
+    """
+    COMPANY_FIELDS = ['id', 'company_name', 'location', 'industry']
+    _plan = None
+
+    def __init__(self, fields=None, expand=None):
+        plan = self.get_plan()
+        unknown = [name for name in (expand or []) if name != 'company']
+        if unknown:
+            raise serializers.ValidationError({'expand': [f'Cannot expand: {", ".join(unknown)}']})
+        if fields is None:
+            # Default output matches ClientSerializer, company included
+            fields, expand = list(plan), ['company']
+        unknown = [name for name in fields if name not in plan]
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field(s): {", ".join(unknown)}']})
+
+        self.expand_company = 'company' in (expand or [])
+        self.fields = [name for name in plan if name in fields]
+        self.lookups = []
+        for name in self.fields:
+            if name == 'company':
+                self.lookups.append('company_id')
+                if self.expand_company:
+                    self.lookups += [f'company__{field}' for field in self.COMPANY_FIELDS[1:]]
+            else:
+                self.lookups.append(plan[name][0])
+        if 'company_name' in self.fields and 'company_id' not in self.lookups:
+            self.lookups.append('company_id')
+
+    @classmethod
+    def from_request(cls, request):
+        """Build from ``?fields=a,b`` and ``?expand=company``"""
+        params = getattr(request, 'query_params', request.GET)
+        fields = [f.strip() for f in params.get('fields', '').split(',') if f.strip()] or None
+        expand = [f.strip() for f in params.get('expand', '').split(',') if f.strip()]
+        return cls(fields, expand)
+
+    @classmethod
+    def get_plan(cls):
+        """Output key -> (values() lookup, converter), in ClientSerializer order"""
+        if cls._plan is None:
+            plan = {}
+            for name, field in ClientSerializer().fields.items():
+                if field.write_only:
+                    continue
+                lookup = '__'.join(field.source.split('.')) if field.source != '*' else name
+                if isinstance(field, serializers.DateTimeField):
+                    converter = datetime_to_representation
+                else:
+                    converter = None
+                plan[name] = (lookup, converter)
+            cls._plan = plan
+        return cls._plan
+
+    def get_queryset(self, queryset, extra=()):
+        """Narrow ``queryset`` to the ``.values()`` this plan reads"""
+        lookups = list(dict.fromkeys([*self.lookups, *extra]))
+        return queryset.values(*lookups)
+
+    def to_representation(self, row, tz=None):
+        tz = tz or timezone.get_current_timezone()
+        plan = self._plan
+        data = {}
+        for name in self.fields:
+            if name == 'company':
+                company_id = row['company_id']
+                if not self.expand_company or company_id is None:
+                    data['company'] = company_id
+                else:
+                    data['company'] = {
+                        'id': company_id,
+                        'company_name': row['company__company_name'],
+                        'location': row['company__location'],
+                        'industry': row['company__industry'],
+                    }
+                continue
+            lookup, converter = plan[name]
+            value = row[lookup]
+            if name == 'company_name' and row['company_id'] is None:
+                # ClientSerializer skips dotted sources through a null FK
+                continue
+            if converter is not None and value is not None:
+                value = converter(value, tz)
+            data[name] = value
+        if 'archived' in row:
+            # ?include_archived=true, see api/archive.py
+            data['archived'] = row['archived']
+        return data
+
+    def many(self, rows):
+        tz = timezone.get_current_timezone()
+        with serializing():
+            return [self.to_representation(row, tz) for row in rows]
+
+
+def datetime_to_representation(value, tz):
+    """Same output as DRF's DateTimeField in the time zone ``tz``"""
+    if value.tzinfo is not None:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+class ListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    count = serializers.IntegerField(source='client_count', read_only=True)
+    # Validates to the list of ids, written by ListOperations
+    client_ids = BulkPrimaryKeyRelatedField(
         queryset=Client.objects.all(),
         many=True,
         write_only=True,
@@ -53,11 +303,130 @@ class ListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = List
-        fields = ['id', 'name', 'folder', 'count', 'client_ids', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'folder', 'kind', 'filters', 'count', 'client_ids', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at', 'count']
     
+    def validate_filters(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Must be an object of client filter params.')
+        if unknown := sorted(set(value) - set(SEGMENT_FILTERS)):
+            raise serializers.ValidationError(f'Unknown filter(s): {", ".join(unknown)}')
+        if any(not isinstance(v, str) for v in value.values()):
+            raise serializers.ValidationError('Filter values must be strings.')
+        return {key: v for key, v in value.items() if v.strip()}
+    
+    def validate(self, attrs):
+        kind = attrs.get('kind', self.instance.kind if self.instance else 'static')
+        filters = attrs.get('filters', self.instance.filters if self.instance else {})
+        if kind == 'segment':
+            if not filters:
+                raise serializers.ValidationError({'filters': ['A segment needs at least one filter.']})
+            if 'clients' in attrs:
+                raise serializers.ValidationError({'client_ids': ['Segment members come from its filters.']})
+        return attrs
+    
+    def create(self, validated_data):
+        client_ids = validated_data.pop('clients', None)
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            if client_ids:
+                ListOperations().add_clients(instance.pk, client_ids)
+        return instance
+    
+    def update(self, instance, validated_data):
+        client_ids = validated_data.pop('clients', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if client_ids is not None:
+                ListOperations().set_clients(instance.pk, client_ids)
+        return instance
+    
+    @classmethod
+    def get_prefetch_related(cls):
+        clients = ClientSerializer.setup_eager_loading(Client.objects.all())
+        return [Prefetch('clients', queryset=clients)]
+    
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['clients'] = ClientSerializer(instance.clients.all(), many=True).data
         return representation
 
+
+
+class ClientIdsSerializer(serializers.Serializer):
+    """``{"client_ids": [...]}`` of the list add / remove actions"""
+    client_ids = BulkPrimaryKeyRelatedField(queryset=Client.objects.all(), many=True, allow_empty=False)
+    
+    def __init__(self, *args, check_exists=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['client_ids'].check_exists = check_exists
+
+
+class ClientDuplicateSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ClientDuplicate
+        fields = ['id', 'first', 'second', 'score', 'reasons', 'status', 'created_at']
+        read_only_fields = ['first', 'second', 'score', 'reasons', 'created_at']
+    
+    select_related = ['first', 'second']
+    
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        for side in ('first', 'second'):
+            client = getattr(instance, side)
+            representation[side] = {
+                'id': client.id,
+                'client': client.client,
+                'email': client.email,
+                'phone': client.phone,
+                'company_id': client.company_id,
+            }
+        return representation
+
+class CompanyDuplicateSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    class Meta:
+        model = CompanyDuplicate
+        fields = ['id', 'first', 'second', 'score', 'reasons', 'status', 'created_at']
+        read_only_fields = ['first', 'second', 'score', 'reasons', 'created_at']
+    
+    select_related = ['first', 'second']
+    
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        for side in ('first', 'second'):
+            company = getattr(instance, side)
+            representation[side] = {
+                'id': company.id,
+                'company_name': company.company_name,
+                'domain': company.domain,
+                'client_count': company.client_count,
+            }
+        return representation
+
+
+class JobSerializer(serializers.HyperlinkedModelSerializer):
+    progress = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'url', 'kind', 'params', 'status', 'progress', 'result', 'error', 'attempts',
+            'max_attempts', 'created_at', 'started_at', 'finished_at', 'updated_at',
+        ]
+    
+    def get_progress(self, obj):
+        percent = None
+        if obj.progress_total:
+            percent = round(100 * obj.progress_done / obj.progress_total, 1)
+        return {'done': obj.progress_done, 'total': obj.progress_total, 'percent': percent}
+
+
+class TombstoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tombstone
+        fields = ['id', 'model', 'object_id', 'deleted_at']
+
+class MembershipEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MembershipEvent
+        fields = ['id', 'list_id', 'client_id', 'action', 'created_at']
@@ -0,0 +1,381 @@
+# signals.py
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from .cache import bump_generation
+from .changes import record_membership_events, record_tombstones
+from .counters import adjust_company_counts, adjust_list_counts, list_counts, refresh_company_counts
+from .dedup import ClientDeduplicator, CompanyDeduplicator, set_client_keys, set_company_keys
+from .membership_index import membership_index
+from .models import Company, Client, List
+from .search import client_search
+from .segments import Segments
+
+Membership = List.clients.through
+
+# Sent by code that changes List.clients with raw SQL or bulk queries, where
+# m2m_changed does not fire. Receives ``deltas``, ``{list_id: added - removed}``
+# counted from the writes' row counts, for every list touched.
+memberships_changed = Signal()
+
+# Sent by bulk client writes (bulk_create, queryset update / delete).
+# Receives ``client_ids`` and ``company_ids`` (old and new companies).
+clients_changed = Signal()
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_client_changes():
+    """
+    Skip the per-instance Client receivers inside the block, e.g. while a
+    queryset ``.delete()`` sends pre/post_delete for every row. The caller
+    sends ``clients_changed`` / ``memberships_changed`` once instead.
+    """
+    _bulk.depth = getattr(_bulk, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _bulk.depth -= 1
+
+
+def _in_bulk():
+    return getattr(_bulk, 'depth', 0) > 0
+
+
+def _company_cascade(origin):
+    """Whether a Client delete cascades from deleting companies, see release_company_clients"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Company
+
+
+# ========== SEARCH INDEX ==========
+@receiver(post_save, sender=Client)
+def index_client(sender, instance, **kwargs):
+    if _in_bulk():
+        return
+    client_search.index_clients([instance.pk])
+
+
+@receiver(post_delete, sender=Client)
+def unindex_client(sender, instance, origin=None, **kwargs):
+    if _in_bulk() or _company_cascade(origin):
+        return
+    client_search.remove_clients([instance.pk])
+
+
+@receiver(clients_changed)
+def index_changed_clients(sender, client_ids=None, **kwargs):
+    if client_ids:
+        client_search.index_clients(client_ids)
+
+
+@receiver(post_init, sender=Company)
+def remember_company_name(sender, instance, **kwargs):
+    instance._loaded_company_name = instance.__dict__.get('company_name')
+
+
+@receiver(post_save, sender=Company)
+def reindex_company_name(sender, instance, created, **kwargs):
+    if not created and instance.company_name != instance._loaded_company_name:
+        client_search.rename_company(instance.pk, instance.company_name)
+    instance._loaded_company_name = instance.company_name
+
+
+# ========== MEMBERSHIP COUNTERS ==========
+@receiver(m2m_changed, sender=Membership)
+def update_list_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep List.client_count in step with List.clients"""
+    if action == 'post_add' and pk_set:
+        # Django only reports the rows it actually inserted
+        if reverse:
+            adjust_list_counts({list_id: 1 for list_id in pk_set})
+        else:
+            adjust_list_counts({instance.pk: len(pk_set)})
+
+    elif action in ('pre_remove', 'pre_clear'):
+        # Remember which memberships really exist before they go
+        memberships = Membership.objects.filter(**{'client_id' if reverse else 'list_id': instance.pk})
+        if action == 'pre_remove':
+            if not pk_set:
+                instance._removed_memberships = []
+                return
+            memberships = memberships.filter(**{'list_id__in' if reverse else 'client_id__in': pk_set})
+        instance._removed_memberships = list(
+            memberships.values_list('list_id' if reverse else 'client_id', flat=True)
+        )
+
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_removed_memberships', [])
+        if reverse:
+            adjust_list_counts({list_id: -1 for list_id in removed})
+        else:
+            adjust_list_counts({instance.pk: -len(removed)})
+
+
+@receiver(memberships_changed)
+def adjust_changed_list_counts(sender, deltas, **kwargs):
+    adjust_list_counts(deltas)
+
+
+@receiver(post_init, sender=Client)
+def remember_company(sender, instance, **kwargs):
+    instance._loaded_company_id = instance.__dict__.get('company_id')
+
+
+@receiver(post_save, sender=Client)
+def update_company_counts(sender, instance, created, raw=False, **kwargs):
+    """Keep Company.client_count in step with Client.company"""
+    if raw or _in_bulk():
+        return
+    previous = None if created else instance._loaded_company_id
+    if previous != instance.company_id:
+        adjust_company_counts({previous: -1, instance.company_id: 1})
+    instance._loaded_company_id = instance.company_id
+
+
+@receiver(pre_delete, sender=Client)
+def remember_client_lists(sender, instance, origin=None, **kwargs):
+    if _in_bulk() or _company_cascade(origin):
+        return
+    # The through rows are removed without m2m_changed
+    instance._deleted_from_lists = list(
+        Membership.objects.filter(client_id=instance.pk).values_list('list_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Client)
+def release_client_counts(sender, instance, origin=None, **kwargs):
+    if _in_bulk() or _company_cascade(origin):
+        return
+    adjust_list_counts({list_id: -1 for list_id in getattr(instance, '_deleted_from_lists', [])})
+    adjust_company_counts({instance.company_id: -1})
+
+
+@receiver(pre_delete, sender=Company)
+def remember_company_clients(sender, instance, **kwargs):
+    # Read before the cascade deletes the clients and their memberships
+    clients = Client.objects.filter(company_id=instance.pk).order_by()
+    instance._deleted_client_ids = list(clients.values_list('id', flat=True))
+    instance._deleted_list_counts = {}
+    if instance._deleted_client_ids:
+        instance._deleted_list_counts = list_counts(Membership.objects.filter(client__company_id=instance.pk))
+
+
+@receiver(post_delete, sender=Company)
+def release_company_clients(sender, instance, using=None, **kwargs):
+    """
+    The clients a company delete cascades to skip their per-instance
+    receivers and are recorded here once per company. The collector may
+    delete their rows after this runs, so nothing here reads them.
+    """
+    client_ids = getattr(instance, '_deleted_client_ids', [])
+    if not client_ids:
+        return
+    client_search.remove_clients(client_ids)
+    record_tombstones('client', client_ids)
+    _bump_on_commit('client', using=using)
+    if instance._deleted_list_counts:
+        memberships_changed.send(
+            sender=List, deltas={list_id: -count for list_id, count in instance._deleted_list_counts.items()},
+            using=using,
+        )
+
+
+@receiver(clients_changed)
+def refresh_changed_company_counts(sender, company_ids=None, **kwargs):
+    if company_ids:
+        refresh_company_counts(company_ids)
+
+
+# ========== DEDUP ==========
+@receiver(pre_save, sender=Client)
+def update_client_keys(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = (instance.email_key, instance.phone_key)
+    set_client_keys(instance)
+    instance._dedup_keys_changed = instance._state.adding or before != (instance.email_key, instance.phone_key)
+
+
+@receiver(pre_save, sender=Company)
+def update_company_keys(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = instance.domain_key
+    set_company_keys(instance)
+    instance._dedup_keys_changed = instance._state.adding or before != instance.domain_key
+
+
+@receiver(post_save, sender=Client)
+def check_client_duplicates(sender, instance, raw=False, **kwargs):
+    if raw or _in_bulk() or not getattr(instance, '_dedup_keys_changed', False):
+        return
+    ClientDeduplicator().find([instance.pk])
+
+
+@receiver(post_save, sender=Company)
+def check_company_duplicates(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, '_dedup_keys_changed', False):
+        return
+    CompanyDeduplicator().find([instance.pk])
+
+
+@receiver(clients_changed)
+def check_changed_duplicates(sender, client_ids=None, company_ids=None, **kwargs):
+    # Bulk writers store the keys themselves (pre_save does not fire)
+    if client_ids:
+        ClientDeduplicator().find(client_ids)
+    if company_ids:
+        CompanyDeduplicator().find(company_ids)
+
+
+# ========== SEGMENTS ==========
+@receiver(post_init, sender=List)
+def remember_segment(sender, instance, **kwargs):
+    filters = instance.__dict__.get('filters')
+    # A copy, so in-place edits of instance.filters count as changes
+    instance._loaded_segment = (instance.__dict__.get('kind'), dict(filters) if isinstance(filters, dict) else filters)
+
+
+@receiver(post_save, sender=List)
+def materialize_segment(sender, instance, created, raw=False, **kwargs):
+    """Rebuild a segment's members when it is created or its definition changes"""
+    if raw:
+        return
+    definition = (instance.kind, dict(instance.filters or {}))
+    if instance.kind == 'segment' and (created or definition != instance._loaded_segment):
+        Segments().refresh(instance)
+    instance._loaded_segment = definition
+
+
+@receiver(post_save, sender=Client)
+def evaluate_client_segments(sender, instance, raw=False, **kwargs):
+    if raw or _in_bulk():
+        return
+    Segments().evaluate([instance.pk])
+
+
+@receiver(post_save, sender=Company)
+def evaluate_company_segments(sender, instance, created, raw=False, **kwargs):
+    # Company name / location / industry feed the client filters
+    if raw or created:
+        return
+    Segments().evaluate_company(instance.pk)
+
+
+@receiver(clients_changed)
+def evaluate_changed_segments(sender, client_ids=None, **kwargs):
+    if client_ids:
+        Segments().evaluate(client_ids)
+
+
+# ========== MEMBERSHIP INDEX ==========
+@receiver(m2m_changed, sender=Membership)
+def update_membership_index(sender, instance, action, reverse, pk_set, **kwargs):
+    """Apply this process's membership writes once committed (see api/membership_index.py)"""
+    if action == 'post_add' and pk_set:
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        transaction.on_commit(lambda: membership_index.apply('add', pairs))
+    elif action in ('post_remove', 'post_clear'):
+        # Stashed by update_list_counts, must run before record_membership_changes
+        pairs = [
+            (pk, instance.pk) if reverse else (instance.pk, pk)
+            for pk in getattr(instance, '_removed_memberships', [])
+        ]
+        transaction.on_commit(lambda: membership_index.apply('remove', pairs))
+
+
+@receiver(memberships_changed)
+def expire_membership_index(sender, **kwargs):
+    # Bulk writers only leave change feed rows, read them on the next use
+    transaction.on_commit(membership_index.expire)
+
+
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=List)
+def expire_membership_index_on_delete(sender, origin=None, **kwargs):
+    if _company_cascade(origin):
+        return
+    transaction.on_commit(membership_index.expire)
+
+
+# ========== CHANGE FEED ==========
+@receiver(m2m_changed, sender=Membership)
+def record_membership_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        record_membership_events('add', [
+            (pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set
+        ])
+    elif action in ('post_remove', 'post_clear'):
+        # Stashed by update_list_counts in pre_remove / pre_clear
+        record_membership_events('remove', [
+            (pk, instance.pk) if reverse else (instance.pk, pk)
+            for pk in getattr(instance, '_removed_memberships', [])
+        ])
+        instance._removed_memberships = []
+
+
+@receiver(post_delete, sender=Client)
+def record_client_tombstone(sender, instance, origin=None, **kwargs):
+    # Bulk and company deletes record theirs in one go
+    if _in_bulk() or _company_cascade(origin):
+        return
+    record_tombstones('client', [instance.pk])
+
+
+@receiver(post_delete, sender=Company)
+def record_company_tombstone(sender, instance, **kwargs):
+    record_tombstones('company', [instance.pk])
+
+
+@receiver(post_delete, sender=List)
+def record_list_tombstone(sender, instance, **kwargs):
+    record_tombstones('list', [instance.pk])
+
+
+# ========== CACHE GENERATIONS ==========
+# Bumped once the write commits: a bump inside the transaction lets a
+# concurrent read cache the pre-commit rows under the new generation
+def _bump_on_commit(*names, using=None):
+    transaction.on_commit(partial(bump_generation, *names), using=using)
+
+
+@receiver([post_save, post_delete], sender=Client)
+def bump_client_generation(sender, using=None, origin=None, **kwargs):
+    if _in_bulk() or _company_cascade(origin):
+        return
+    # Company client counts change with clients
+    _bump_on_commit('client', 'company', using=using)
+
+
+@receiver([post_save, post_delete], sender=Company)
+def bump_company_generation(sender, using=None, **kwargs):
+    _bump_on_commit('company', using=using)
+
+
+@receiver(clients_changed)
+def bump_bulk_client_generation(sender, using=None, **kwargs):
+    _bump_on_commit('client', 'company', using=using)
+
+
+@receiver([post_save, post_delete], sender=List)
+def bump_list_generation(sender, using=None, **kwargs):
+    _bump_on_commit('list', using=using)
+
+
+@receiver(m2m_changed, sender=Membership)
+def bump_membership_generation(sender, action, using=None, **kwargs):
+    if action.startswith('post_'):
+        _bump_on_commit('list', using=using)
+
+
+@receiver(memberships_changed)
+def bump_bulk_membership_generation(sender, using=None, **kwargs):
+    _bump_on_commit('list', using=using)
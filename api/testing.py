@@ -0,0 +1,41 @@
+# testing.py
+"""Helpers for asserting per-endpoint query budgets in tests"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def query_budget(budget, using=DEFAULT_DB_ALIAS):
+    """Fail if the block runs more than ``budget`` queries"""
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > budget:
+        queries = '\n'.join(
+            f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1)
+        )
+        raise AssertionError(f'{executed} queries executed, budget is {budget}\n{queries}')
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: ``with self.assertQueryBudget(4): self.client.get(url)``"""
+
+    def assertQueryBudget(self, budget, using=DEFAULT_DB_ALIAS):
+        return query_budget(budget, using=using)
+
+    def assertConstantQueries(self, request, grow, budget, using=DEFAULT_DB_ALIAS):
+        """
+        Run ``request`` before and after ``grow`` adds more rows, and check
+        both stay within ``budget`` and run the same number of queries.
+        """
+        with query_budget(budget, using=using) as before:
+            request()
+        grow()
+        with query_budget(budget, using=using) as after:
+            request()
+        self.assertEqual(
+            len(before.captured_queries), len(after.captured_queries),
+            'Query count depends on result size'
+        )
@@ -1,3 +1,1453 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import uuid
+import zlib
+from array import array
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .archive import ClientArchive
+from .batch import ClientBatch
+from .cache import GENERATION_PREFIX, bump_generation, get_cache, get_generations
+from .checks import check_dedup_settings
+from .compression import (
+    AVAILABLE, CompressionMiddleware, Throughput, accepted_encoding, brotli, compress_stream, zstandard,
+)
+from .counters import drifted_companies, drifted_lists
+from .dedup import (
+    ClientDeduplicator, CompanyDeduplicator, Deduplicator, email_key, phone_key, registrable_domain,
+)
+from .filters import prefix_range
+from .importers import ClientImporter
+from .jobs import HANDLERS, Worker, enqueue
+from .list_ops import ListOperations
+from .membership_index import Bitmap, MembershipIndex
+from .models import (
+    ArchivedClient, Company, Client, ClientDuplicate, CompanyDuplicate, Job, List, MembershipEvent, Tombstone,
+)
+from .profiling import ProfilingMiddleware, histogram
+from .renderers import FastJSONRenderer
+from .search import SEARCH_FIELDS, SEARCH_TABLE, client_search, fallback_q
+from .segments import Segments
+from .serializers import ClientIdsSerializer, ClientSerializer, FastClientSerializer
+from .testing import QueryBudgetMixin
+
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'MEMBERSHIP_INDEX_PATH': '',
+    'PROFILING_SAMPLE_RATE': 0,
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class APITestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        caches['default'].clear()
+
+
+# ========== QUERY BUDGETS ==========
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """A 1-row and a 500-row page run the same queries"""
+
+    def add_companies(self, count):
+        start = Company.objects.count()
+        return Company.objects.bulk_create(
+            [Company(company_name=f'Company {start + i}') for i in range(count)]
+        )
+
+    def add_clients(self, count):
+        company = Company.objects.first() or Company.objects.create(company_name='Acme')
+        start = Client.objects.count()
+        return Client.objects.bulk_create([
+            Client(client=f'Client {start + i}', email=f'client{start + i}@example.com', company=company)
+            for i in range(count)
+        ])
+
+    def add_lists(self, count):
+        clients = self.add_clients(2)
+        start = List.objects.count()
+        lists = List.objects.bulk_create([List(name=f'List {start + i}') for i in range(count)])
+        List.clients.through.objects.bulk_create([
+            List.clients.through(list_id=lst.pk, client_id=client.pk) for lst in lists for client in clients
+        ])
+        return lists
+
+    def get(self, url):
+        # bulk_create sends no signals, so cached responses are not invalidated
+        caches['default'].clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.returned = len(data['results'] if isinstance(data, dict) else data)
+
+    def test_companies(self):
+        self.add_companies(1)
+        self.assertConstantQueries(lambda: self.get('/api/companies/'), lambda: self.add_companies(499), budget=1)
+        self.assertEqual(self.returned, 500)
+
+    def test_clients(self):
+        self.add_clients(1)
+        self.assertConstantQueries(
+            lambda: self.get('/api/clients/?page_size=500'), lambda: self.add_clients(499), budget=2
+        )
+        self.assertEqual(self.returned, 500)
+
+    def test_lists(self):
+        self.add_lists(1)
+        self.assertConstantQueries(lambda: self.get('/api/lists/'), lambda: self.add_lists(499), budget=2)
+        self.assertEqual(self.returned, 500)
+
+
+    def test_company_delete(self):
+        """Clients cascading from a company delete are handled in one batch"""
+        leads = List.objects.create(name='Leads')
+        first = Company.objects.create(company_name='First')
+        second = Company.objects.create(company_name='Second')
+
+        def add_clients(company, count):
+            leads.clients.add(*[
+                Client.objects.create(client=f'{company.company_name} {i}', company=company) for i in range(count)
+            ])
+
+        add_clients(first, 1)
+        add_clients(second, 1)
+        companies = [first, second]
+        self.assertConstantQueries(lambda: companies.pop(0).delete(), lambda: add_clients(second, 49), budget=13)
+        leads.refresh_from_db()
+        self.assertEqual(leads.client_count, 0)
+        self.assertEqual(Tombstone.objects.filter(model='client').count(), 51)
+
+# ========== SEARCH ==========
+class SearchIndexMixin:
+    def require_index(self):
+        # Checked per test, the test database does not exist at import time
+        if not client_search.is_available():
+            self.skipTest('needs SQLite FTS5 or MySQL FULLTEXT')
+
+
+class SearchTests(SearchIndexMixin, APITestCase):
+    """The full-text index finds exactly what the old icontains scan did"""
+    TERMS = ['ali', 'ALICE', 'smith', 'globex', 'engineer', '@example.org', '555-01', 'ex in', 'xyz', 'a']
+
+    def setUp(self):
+        super().setUp()
+        self.require_index()
+        globex = Company.objects.create(company_name='Globex Industries')
+        initech = Company.objects.create(company_name='Initech')
+        Client.objects.create(client='Alice Smith', email='alice@example.org', job_role='Engineer', company=globex)
+        Client.objects.create(client='Bob Alison', phone='555-0100', status='Contacted', company=initech)
+        Client.objects.create(client='Carol', remarks='Met at the Globex booth', lead_owner='Smithers')
+        Client.objects.create(client='Dan', email='dan@index.io', job_role='Sales engineer')
+
+    def assertMatchesIcontains(self, param):
+        for term in self.TERMS:
+            expected = set(Client.objects.filter(fallback_q(term, SEARCH_FIELDS[param])).values_list('id', flat=True))
+            found = set(client_search.filter(Client.objects.all(), term, param).values_list('id', flat=True))
+            self.assertEqual(found, expected, f'{param}={term!r}')
+            response = self.client.get('/api/clients/', {param: term, 'page_size': 100})
+            self.assertEqual({row['id'] for row in response.json()['results']}, expected, f'{param}={term!r}')
+
+    def test_q_matches_icontains(self):
+        self.assertMatchesIcontains('q')
+
+    def test_search_matches_icontains(self):
+        self.assertMatchesIcontains('search')
+
+    def test_index_follows_writes(self):
+        client = Client.objects.get(client='Dan')
+        client.client = 'Daniel Quux'
+        client.save()
+        Company.objects.filter(company_name='Initech').update(company_name='Unused')
+        company = Company.objects.get(company_name='Globex Industries')
+        company.company_name = 'Hooli'
+        company.save()
+        self.TERMS = ['quux', 'dan', 'hooli', 'globex']
+        self.assertMatchesIcontains('search')
+
+    def test_relevance_ordering(self):
+        response = self.client.get('/api/clients/', {'search': 'smith', 'ordering': 'relevance'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row['client'] for row in response.json()['results']}, {'Alice Smith', 'Carol'}
+        )
+
+
+# ========== KEYSET PAGINATION ==========
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        base = timezone.now()
+        for i in range(25):
+            client = Client.objects.create(client=f'Client {i}')
+            # Pairs of equal timestamps, the id breaks the tie
+            Client.objects.filter(pk=client.pk).update(created_at=base - timedelta(minutes=i // 2))
+        self.expected = list(Client.objects.order_by('-created_at', 'id').values_list('id', flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row['id'] for row in data['results']])
+            url = data[link]
+        return pages
+
+    def test_forward_and_back(self):
+        forward = self.walk('/api/clients/?page_size=10', 'next')
+        self.assertEqual([len(page) for page in forward], [10, 10, 5])
+        self.assertEqual(sum(forward, []), self.expected)
+
+        last = self.client.get('/api/clients/?page_size=10').json()
+        while last['next']:
+            last = self.client.get(last['next']).json()
+        backward = self.walk(last['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_count_modes(self):
+        self.assertEqual(self.client.get('/api/clients/?page_size=5').json()['count'], 25)
+        self.assertIsNone(self.client.get('/api/clients/?page_size=5&count=none').json()['count'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/clients/?cursor=bogus').status_code, 404)
+
+
+# ========== IMPORT ==========
+class ImportTests(SearchIndexMixin, APITestCase):
+    CSV = (
+        'client,email,company_name,domain,nurturing_stage\n'
+        'Alice,alice@globex.com,Globex,https://www.globex.com,hot\n'
+        'Bob,bob@globex.com,Globex Inc,globex.com,\n'
+        'Carol,not-an-email,Initech,,\n'
+        'Dan,dan@initech.com,Initech,,cold\n'
+    )
+
+    def upload(self, content, name='clients.csv'):
+        return self.client.post(
+            '/api/clients/import/', {'file': SimpleUploadedFile(name, content.encode())}, format='multipart'
+        )
+
+    def test_csv(self):
+        response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual((result['rows'], result['created'], result['failed']), (4, 3, 1))
+        self.assertEqual(result['errors'][0]['row'], 4)
+        self.assertIn('email', result['errors'][0]['errors'])
+        self.assertEqual(result['companies_created'], 2)
+
+        # Rows sharing a domain share the company
+        globex = Company.objects.get(domain_key='globex.com')
+        self.assertEqual(set(globex.clients.values_list('client', flat=True)), {'Alice', 'Bob'})
+        self.assertEqual(globex.client_count, 2)
+        self.assertEqual(Client.objects.get(client='Bob').nurturing_stage, 'warm')
+
+    def test_jsonl_reuses_companies(self):
+        company = Company.objects.create(company_name='Globex', domain='globex.com')
+        content = '\n'.join([
+            json.dumps({'client': 'Eve', 'domain': 'globex.com', 'social_media': {'x': '@eve'}}),
+            json.dumps({'client': 'Frank', 'company_id': company.pk}),
+            json.dumps({'client': 'Grace', 'company_id': 999999}),
+            'not json',
+        ])
+        result = self.upload(content, 'clients.jsonl').json()
+        self.assertEqual((result['created'], result['failed'], result['companies_created']), (2, 2, 0))
+        self.assertEqual(company.clients.count(), 2)
+        self.assertEqual(Client.objects.get(client='Eve').social_media, {'x': '@eve'})
+
+    def test_imported_clients_are_searchable(self):
+        self.require_index()
+        self.upload(self.CSV)
+        self.assertEqual(
+            set(client_search.filter(Client.objects.all(), 'globex').values_list('client', flat=True)),
+            {'Alice', 'Bob'},
+        )
+
+    def test_batch_create_reports_ids(self):
+        response = self.client.post(
+            '/api/clients/batch/create/', {'clients': [{'client': 'Heidi'}, {'client': 'Ivan'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        ids = [result['id'] for result in response.json()['results']]
+        self.assertEqual(list(Client.objects.filter(id__in=ids).values_list('client', flat=True).order_by('id')),
+                         ['Heidi', 'Ivan'])
+
+    def test_ids_without_returning(self):
+        created = {}
+        importer = ClientImporter(on_created=lambda line_number, client: created.update({line_number: client.pk}))
+        # Rows a key could not tell apart
+        row = {'client': 'Same', 'email': 'same@example.com', 'domain': 'same.com'}
+        rows = [(line_number, dict(row)) for line_number in (1, 2, 3)]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            result = importer.run(rows)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(len(set(created.values())), 3)
+        self.assertEqual(set(created.values()), set(Client.objects.values_list('id', flat=True)))
+        self.assertEqual(Client.objects.get(pk=created[2]).email_key, 'same@example.com')
+        self.assertEqual(Company.objects.get(domain_key='same.com').client_count, 3)
+
+
+# ========== EXPORT ==========
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.acme = Company.objects.create(company_name='Acme', location='Berlin', industry='Retail')
+        self.alice = Client.objects.create(
+            client='Alice', email='alice@acme.com', company=self.acme, nurturing_stage='hot',
+            social_media={'linkedin': 'alice'},
+        )
+        self.bob = Client.objects.create(client='Bob, Jr.', remarks='line one\nline two')
+        Client.objects.create(client='Carol', nurturing_stage='cold')
+        self.list = List.objects.create(name='Leads')
+        self.list.clients.add(self.alice, self.bob)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get('/api/clients/export/', {'nurturing_stage': 'hot'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="clients.csv"')
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual((row['id'], row['client'], row['company_name']), (str(self.alice.pk), 'Alice', 'Acme'))
+        self.assertEqual(json.loads(row['social_media']), {'linkedin': 'alice'})
+        # Same datetime format as the JSON API
+        detail = self.client.get(f'/api/clients/{self.alice.pk}/').json()
+        self.assertEqual(row['created_at'], detail['created_at'])
+
+    def test_csv_quoting(self):
+        rows = list(csv.DictReader(io.StringIO(self.content(self.client.get('/api/clients/export/')))))
+        bob = next(row for row in rows if row['id'] == str(self.bob.pk))
+        self.assertEqual((bob['client'], bob['remarks'], bob['company_name']), ('Bob, Jr.', 'line one\nline two', ''))
+
+    @override_settings(EXPORT_WRITE_BATCH=1, EXPORT_CHUNK_SIZE=1)
+    def test_list_jsonl(self):
+        response = self.client.get(f'/api/lists/{self.list.pk}/export/', {'file_format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/jsonl')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual({row['client'] for row in rows}, {'Alice', 'Bob, Jr.'})
+        self.assertIsNone(next(row for row in rows if row['client'] == 'Bob, Jr.')['company_id'])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/clients/export/', {'file_format': 'xlsx'}).status_code, 400)
+
+
+# ========== LIST ALGEBRA ==========
+class ListAlgebraTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clients = [Client.objects.create(client=f'Client {i}') for i in range(6)]
+        self.a = self.make_list('A', 0, 1, 2, 3)
+        self.b = self.make_list('B', 2, 3, 4)
+        self.c = self.make_list('C', 3, 5)
+
+    def make_list(self, name, *indexes):
+        lst = List.objects.create(name=name)
+        lst.clients.add(*[self.clients[i] for i in indexes])
+        return lst
+
+    def members(self, lst):
+        ids = {client.pk: i for i, client in enumerate(self.clients)}
+        return {ids[pk] for pk in lst.clients.values_list('id', flat=True)}
+
+    def combine(self, operation, *lists):
+        response = self.client.post(
+            f'/api/lists/{self.a.pk}/combine/',
+            {'operation': operation, 'list_ids': [lst.pk for lst in lists]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertMembers(self, lst, expected):
+        self.assertEqual(self.members(lst), expected)
+        lst.refresh_from_db()
+        self.assertEqual(lst.client_count, len(expected))
+
+    def test_union(self):
+        result = self.combine('union', self.b, self.c)
+        self.assertEqual((result['added_count'], result['removed_count']), (2, 0))
+        self.assertMembers(self.a, {0, 1, 2, 3, 4, 5})
+
+    def test_intersect(self):
+        result = self.combine('intersect', self.b, self.c)
+        self.assertEqual((result['added_count'], result['removed_count']), (0, 3))
+        self.assertMembers(self.a, {3})
+
+    def test_difference(self):
+        result = self.combine('difference', self.b, self.c)
+        self.assertEqual((result['added_count'], result['removed_count']), (0, 2))
+        self.assertMembers(self.a, {0, 1})
+
+    def test_move(self):
+        response = self.client.post(
+            f'/api/lists/{self.b.pk}/move/', {'target_list_id': self.c.pk, 'remove_from_source': True}, format='json'
+        )
+        self.assertEqual((response.json()['added_count'], response.json()['removed_count']), (2, 3))
+        self.assertMembers(self.b, set())
+        self.assertMembers(self.c, {2, 3, 4, 5})
+
+    def test_insert_counts_new_rows(self):
+        new = [self.clients[4].pk, self.clients[5].pk]
+        operations = ListOperations()
+        logged = MembershipEvent.objects.count()
+        # 0 and 1 are members already, 4 is given twice
+        result = operations.add_clients(self.a.pk, [self.clients[0].pk, self.clients[1].pk, *new, new[0]])
+        self.assertEqual(result, {'added': 2, 'removed': 0})
+        events = MembershipEvent.objects.order_by('id')[logged:]
+        self.assertEqual([(event.action, event.client_id) for event in events], [('add', new[0]), ('add', new[1])])
+        self.assertEqual(operations.insert(self.a.pk, new), 0)
+        self.assertMembers(self.a, {0, 1, 2, 3, 4, 5})
+
+    def test_membership_events(self):
+        self.combine('difference', self.b)
+        removed = set(MembershipEvent.objects.filter(list_id=self.a.pk, action='remove')
+                      .values_list('client_id', flat=True))
+        self.assertEqual(removed, {self.clients[2].pk, self.clients[3].pk})
+
+    def test_unknown_operation(self):
+        response = self.client.post(
+            f'/api/lists/{self.a.pk}/combine/', {'operation': 'xor', 'list_ids': [self.b.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# ========== COUNTERS ==========
+class CounterTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(company_name='Acme')
+        self.other = Company.objects.create(company_name='Other')
+        self.clients = [Client.objects.create(client=f'Client {i}', company=self.company) for i in range(6)]
+        self.first = List.objects.create(name='First')
+        self.second = List.objects.create(name='Second')
+
+    def counts(self, *objects):
+        return [type(obj).objects.get(pk=obj.pk).client_count for obj in objects]
+
+    def assertNoDrift(self):
+        self.assertEqual(list(drifted_lists()), [])
+        self.assertEqual(list(drifted_companies()), [])
+
+    def test_m2m_writes(self):
+        self.first.clients.add(*self.clients[:4])
+        self.first.clients.add(*self.clients[:2])
+        self.clients[4].lists.add(self.first, self.second)
+        self.assertEqual(self.counts(self.first, self.second), [5, 1])
+        self.first.clients.remove(self.clients[0], self.clients[5])
+        self.clients[4].lists.remove(self.second)
+        self.assertEqual(self.counts(self.first, self.second), [4, 0])
+        self.clients[1].delete()
+        self.assertEqual(self.counts(self.first, self.company), [3, 5])
+        self.first.clients.clear()
+        self.assertEqual(self.counts(self.first), [0])
+        self.assertNoDrift()
+
+    def test_company_writes(self):
+        client = self.clients[0]
+        client.company = self.other
+        client.save()
+        self.assertEqual(self.counts(self.company, self.other), [5, 1])
+        Client.objects.create(client='New', company=self.other)
+        self.assertEqual(self.counts(self.other), [2])
+        self.assertNoDrift()
+
+    def test_bulk_writes(self):
+        ids = [client.pk for client in self.clients]
+        operations = ListOperations()
+        operations.add_clients(self.first.pk, ids[:4])
+        operations.add_clients(self.second.pk, ids[2:])
+        operations.union(self.first.pk, [self.second.pk])
+        operations.remove_clients(self.second.pk, ids[:3])
+        self.assertEqual(self.counts(self.first, self.second), [6, 3])
+
+        ClientBatch().update(ids[:2], {'company_id': self.other.pk})
+        ClientBatch().delete(ids[4:])
+        self.assertEqual(self.counts(self.first, self.second, self.company, self.other), [4, 1, 2, 2])
+        self.assertNoDrift()
+
+    def test_company_delete(self):
+        self.first.clients.add(*self.clients[:3])
+        self.second.clients.add(self.clients[0])
+        Client.objects.create(client='Other client', company=self.other)
+        self.company.delete()
+        self.assertEqual(self.counts(self.first, self.second, self.other), [0, 0, 1])
+        ids = [client.pk for client in self.clients]
+        self.assertEqual(Tombstone.objects.filter(model='client', object_id__in=ids).count(), 6)
+        if client_search.is_available() and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT rowid FROM {SEARCH_TABLE}")
+                self.assertEqual([row[0] for row in cursor.fetchall()], [Client.objects.get().pk])
+        self.assertNoDrift()
+
+    def test_merge(self):
+        self.first.clients.add(self.clients[0], self.clients[1])
+        self.second.clients.add(self.clients[1])
+        ClientDeduplicator().merge(self.clients[0].pk, [self.clients[1].pk])
+        self.assertEqual(self.counts(self.first, self.second, self.company), [1, 1, 5])
+        self.assertNoDrift()
+
+
+# ========== FACETS ==========
+class FacetTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        acme = Company.objects.create(company_name='Acme', industry='Retail', location='Berlin')
+        globex = Company.objects.create(company_name='Globex', industry='Energy', location='Berlin')
+        Client.objects.create(client='A', nurturing_stage='hot', lead_owner='Ann', company=acme,
+                              social_media={'linkedin': 'a', 'x': '@a'})
+        Client.objects.create(client='B', nurturing_stage='hot', lead_owner='Ann', company=globex,
+                              social_media={'linkedin': 'b'})
+        Client.objects.create(client='C', nurturing_stage='cold', lead_owner='Bo', social_media={})
+        Client.objects.create(client='D', nurturing_stage='warm', lead_owner='Ann', company=acme)
+
+    def facets(self, **params):
+        response = self.client.get('/api/clients/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts(self):
+        data = self.facets()
+        self.assertEqual(data['count'], 4)
+        facets = data['facets']
+        self.assertEqual(facets['nurturing_stage'], [
+            {'value': 'hot', 'count': 2}, {'value': 'cold', 'count': 1}, {'value': 'warm', 'count': 1},
+        ])
+        self.assertEqual(facets['lead_owner'][0], {'value': 'Ann', 'count': 3})
+        self.assertEqual(facets['company__location'], [{'value': 'Berlin', 'count': 3}, {'value': None, 'count': 1}])
+        self.assertEqual(facets['platform'], [{'value': 'linkedin', 'count': 2}, {'value': 'x', 'count': 1}])
+
+    def test_filters_and_limit(self):
+        data = self.facets(lead_owner='ann', facet_limit=1)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['facets']['nurturing_stage'], [{'value': 'hot', 'count': 2}])
+        self.assertEqual(data['facets']['company__industry'], [{'value': 'Retail', 'count': 2}])
+        self.assertEqual(self.client.get('/api/clients/facets/', {'facet_limit': 'many'}).status_code, 400)
+
+    @override_settings(FACETS_CACHE_TIMEOUT=60)
+    def test_cache(self):
+        self.assertFalse(self.facets()['cached'])
+        self.assertTrue(self.facets()['cached'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(client='E', nurturing_stage='hot')
+        data = self.facets()
+        self.assertEqual((data['cached'], data['count']), (False, 5))
+        self.assertFalse(self.facets(nocache='true')['cached'])
+
+
+# ========== RESPONSE CACHE ==========
+class CacheInvalidationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.acme = Company.objects.create(company_name='Acme')
+        self.alice = Client.objects.create(client='Alice', company=self.acme)
+        self.list = List.objects.create(name='Leads')
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/clients/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/clients/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/clients/', HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+    def test_write_invalidates(self):
+        etag = self.client.get('/api/clients/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/clients/{self.alice.pk}/', {'client': 'Alicia'}, format='json')
+        response = self.client.get('/api/clients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['client'], 'Alicia')
+
+    def test_company_rename_invalidates_clients(self):
+        self.client.get('/api/clients/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.acme.company_name = 'Acme Corp'
+            self.acme.save()
+        self.assertEqual(self.client.get('/api/clients/').json()['results'][0]['company_name'], 'Acme Corp')
+
+    def test_bulk_membership_write_invalidates_lists(self):
+        self.assertEqual(self.client.get('/api/lists/').json()[0]['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ListOperations().add_clients(self.list.pk, [self.alice.pk])
+        self.assertEqual(self.client.get('/api/lists/').json()[0]['count'], 1)
+
+    def test_no_bump_before_commit(self):
+        before = get_generations('client')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Client.objects.create(client='Bob')
+        self.assertEqual(get_generations('client'), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_generations('client'), before)
+
+    def test_lost_generation_is_not_reused(self):
+        bump_generation('client')
+        before = get_generations('client')
+        get_cache().delete(GENERATION_PREFIX + 'client')
+        self.assertNotEqual(get_generations('client'), before)
+
+
+# ========== SERIALIZERS ==========
+class FastClientSerializerTests(APITestCase):
+    """FastClientSerializer renders the same bytes as ClientSerializer"""
+
+    def setUp(self):
+        super().setUp()
+        acme = Company.objects.create(company_name='Acme', location=None, industry='Retail')
+        Client.objects.create(
+            client='Alice', email='alice@acme.com', company=acme, nurturing_stage='hot',
+            social_media={'linkedin': 'alice', 'nested': {'followers': 12, 'tags': ['a', None]}},
+        )
+        # No company, empty media and mostly null columns
+        Client.objects.create(client=None, social_media={})
+        unicode = Client.objects.create(
+            client='Zo\u00eb \u2028 "quoted"', remarks='\u00fcn\u00efcode\n', social_media={'x': '\u2029'}
+        )
+        # Whole-second timestamps render without a fraction
+        Client.objects.filter(pk=unicode.pk).update(created_at=timezone.now().replace(microsecond=0))
+        self.queryset = Client.objects.order_by('id')
+
+    def assertSameBytes(self):
+        expected = JSONRenderer().render(ClientSerializer(self.queryset, many=True).data)
+        serializer = FastClientSerializer()
+        rows = serializer.many(serializer.get_queryset(self.queryset))
+        self.assertEqual(JSONRenderer().render(rows), expected)
+        self.assertEqual(FastJSONRenderer().render(rows), expected)
+
+    def test_default_output(self):
+        self.assertSameBytes()
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_other_time_zone(self):
+        self.assertSameBytes()
+
+    def test_endpoint(self):
+        response = self.client.get('/api/clients/', {'page_size': 10, 'ordering': 'id'})
+        rows = sorted(response.json()['results'], key=lambda row: row['id'])
+        expected = json.loads(JSONRenderer().render(ClientSerializer(self.queryset, many=True).data))
+        self.assertEqual(rows, expected)
+
+    def test_sparse_fields(self):
+        serializer = FastClientSerializer(['client', 'company_name', 'company'])
+        rows = serializer.many(serializer.get_queryset(self.queryset))
+        company_id = Company.objects.get().pk
+        self.assertEqual(rows[0], {'client': 'Alice', 'company_name': 'Acme', 'company': company_id})
+        # ClientSerializer leaves company_name out without a company
+        self.assertEqual(rows[1], {'client': None, 'company': None})
+
+
+# ========== DEDUP ==========
+class DedupTests(APITestCase):
+
+    def test_keys(self):
+        self.assertEqual(email_key('  Alice@Example.COM '), 'alice@example.com')
+        self.assertIsNone(email_key('not an email'))
+        self.assertEqual(registrable_domain('https://www.Example.co.uk/about'), 'example.co.uk')
+        self.assertEqual(registrable_domain('sales@mail.globex.com'), 'globex.com')
+        self.assertIsNone(registrable_domain('localhost'))
+        self.assertEqual(phone_key('+1 (415) 555-0100'), '+14155550100')
+        self.assertEqual(phone_key('0044 20 7946 0958'), '+442079460958')
+        self.assertEqual(phone_key('(415) 555-0100', country_code='1'), '+14155550100')
+        self.assertEqual(phone_key('020 7946 0958', country_code='44'), '+442079460958')
+        self.assertIsNone(phone_key('12'))
+
+    @override_settings(DEDUP_DEFAULT_COUNTRY_CODE='1')
+    def test_default_country_code(self):
+        client = Client.objects.create(client='Alice', phone='415.555.0100')
+        self.assertEqual(client.phone_key, '+14155550100')
+
+    def test_country_code_check(self):
+        for value, errors in (('', []), ('91', []), ('+91', ['api.E001']), ('999', ['api.E001'])):
+            with self.subTest(value=value), override_settings(DEDUP_DEFAULT_COUNTRY_CODE=value):
+                found = [message.id for message in check_dedup_settings(None) if message.id.startswith('api.E')]
+                self.assertEqual(found, errors)
+
+    def test_deduplicator_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Deduplicator()
+
+    def test_saves_find_candidates(self):
+        alice = Client.objects.create(client='Alice Smith', email='alice@example.com')
+        twin = Client.objects.create(client='alice smith', email='ALICE@example.com ')
+        Client.objects.create(client='Bob', email='bob@example.com')
+        candidate = ClientDuplicate.objects.get()
+        self.assertEqual((candidate.first_id, candidate.second_id), (alice.pk, twin.pk))
+        self.assertEqual(candidate.reasons, ['email', 'name'])
+        self.assertEqual(candidate.score, 0.8)
+
+        acme = Company.objects.create(company_name='Acme Inc', domain='https://acme.com')
+        other = Company.objects.create(company_name='ACME', company_email='sales@acme.com')
+        Company.objects.create(company_name='Gmail user', company_email='someone@gmail.com')
+        candidate = CompanyDuplicate.objects.get()
+        self.assertEqual(
+            (candidate.first_id, candidate.second_id, candidate.reasons), (acme.pk, other.pk, ['domain', 'name'])
+        )
+
+    def test_large_blocks_are_skipped(self):
+        Client.objects.bulk_create([
+            Client(client=f'Desk {i}', email='info@example.com', email_key='info@example.com') for i in range(4)
+        ])
+        self.assertEqual(ClientDeduplicator(max_block_size=3).find(), 0)
+        self.assertEqual(ClientDeduplicator(max_block_size=4).find(), 6)
+
+    def test_dismissed_pairs_stay_dismissed(self):
+        Client.objects.create(client='Alice', email='alice@example.com')
+        Client.objects.create(client='Alice', email='alice@example.com')
+        candidate = ClientDuplicate.objects.get()
+        response = self.client.post(f'/api/duplicates/clients/{candidate.pk}/dismiss/')
+        self.assertEqual(response.json()['status'], 'dismissed')
+        ClientDeduplicator().find()
+        self.assertEqual(ClientDuplicate.objects.get().status, 'dismissed')
+        self.assertEqual(self.client.get('/api/duplicates/clients/').json()['results'], [])
+
+    def test_merge(self):
+        acme = Company.objects.create(company_name='Acme')
+        keep = Client.objects.create(client='Alice', email='alice@example.com', social_media={'x': '@alice'})
+        other = Client.objects.create(
+            client='Alice S.', email='alice@example.com', phone='+1 415 555 0100', company=acme,
+            social_media={'x': '@other', 'linkedin': 'alice'},
+        )
+        first, second = List.objects.create(name='First'), List.objects.create(name='Second')
+        first.clients.add(keep, other)
+        second.clients.add(other)
+        candidate = ClientDuplicate.objects.get()
+
+        response = self.client.post(f'/api/duplicates/clients/{candidate.pk}/merge/', {'keep': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/api/duplicates/clients/{candidate.pk}/merge/')
+        self.assertEqual(response.json(), {'kept': keep.pk, 'merged': other.pk})
+
+        keep.refresh_from_db()
+        self.assertFalse(Client.objects.filter(pk=other.pk).exists())
+        self.assertEqual((keep.client, keep.phone, keep.company_id), ('Alice', '+1 415 555 0100', acme.pk))
+        self.assertEqual(keep.social_media, {'x': '@alice', 'linkedin': 'alice'})
+        self.assertEqual(set(keep.lists.values_list('name', flat=True)), {'First', 'Second'})
+        self.assertEqual(list(drifted_lists()), [])
+        self.assertEqual(list(drifted_companies()), [])
+        self.assertFalse(ClientDuplicate.objects.exists())
+
+
+# ========== SEGMENTS ==========
+class SegmentTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.acme = Company.objects.create(company_name='Acme', location='Berlin')
+        self.hot = Client.objects.create(client='Hot', nurturing_stage='hot', company=self.acme)
+        self.cold = Client.objects.create(client='Cold', nurturing_stage='cold', company=self.acme)
+        response = self.client.post(
+            '/api/lists/', {'name': 'Hot in Berlin', 'kind': 'segment',
+                            'filters': {'nurturing_stage': 'hot', 'location': 'berlin'}}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.segment = List.objects.get(pk=response.json()['id'])
+
+    def assertSegment(self, *clients):
+        self.assertEqual(set(self.segment.clients.values_list('id', flat=True)), {client.pk for client in clients})
+        self.segment.refresh_from_db()
+        self.assertEqual(self.segment.client_count, len(clients))
+
+    def test_materialized_on_create(self):
+        self.assertSegment(self.hot)
+
+    def test_client_writes(self):
+        self.cold.nurturing_stage = 'hot'
+        self.cold.save()
+        new = Client.objects.create(client='New', nurturing_stage='hot', company=self.acme)
+        self.assertSegment(self.hot, self.cold, new)
+        self.hot.nurturing_stage = 'warm'
+        self.hot.save()
+        ClientBatch().update([new.pk], {'nurturing_stage': 'cold'})
+        self.assertSegment(self.cold)
+        events = MembershipEvent.objects.filter(list_id=self.segment.pk)
+        self.assertEqual(events.filter(action='remove').count(), 2)
+
+    def test_company_writes(self):
+        self.acme.location = 'Paris'
+        self.acme.save()
+        self.assertSegment()
+
+    def test_definition_change(self):
+        response = self.client.patch(
+            f'/api/lists/{self.segment.pk}/', {'filters': {'nurturing_stage': 'cold'}}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertSegment(self.cold)
+
+    def test_refresh(self):
+        # A queryset update bypasses the per-client evaluation
+        Client.objects.filter(pk=self.cold.pk).update(nurturing_stage='hot')
+        self.assertSegment(self.hot)
+        response = self.client.post(f'/api/lists/{self.segment.pk}/refresh/')
+        self.assertEqual(response.status_code, 200)
+        self.assertSegment(self.hot, self.cold)
+        self.assertEqual(Segments().refresh(self.segment), {'added': 0, 'removed': 0})
+
+    def test_validation(self):
+        response = self.client.post(
+            f'/api/lists/{self.segment.pk}/add_clients/', {'client_ids': [self.cold.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        for filters in ({}, {'unknown': 'x'}, {'nurturing_stage': 1}):
+            response = self.client.post('/api/lists/', {'name': 'S', 'kind': 'segment', 'filters': filters},
+                                        format='json')
+            self.assertEqual(response.status_code, 400, filters)
+
+
+# ========== CHANGE FEED ==========
+class ChangeFeedTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.acme = Company.objects.create(company_name='Acme')
+        self.clients = [Client.objects.create(client=f'Client {i}', company=self.acme) for i in range(3)]
+        self.ids = [client.pk for client in self.clients]
+        self.list = List.objects.create(name='Leads')
+
+    def test_tombstones(self):
+        for client in self.clients:
+            client.delete()
+        List.objects.create(name='Gone').delete()
+        response = self.client.get('/api/tombstones/', {'model': 'client'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['object_id'] for row in response.json()['results']], self.ids)
+        self.assertEqual(self.client.get('/api/tombstones/').json()['results'][-1]['model'], 'list')
+
+    def test_tombstones_updated_since(self):
+        self.clients[0].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=2))
+        self.clients[1].delete()
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get('/api/tombstones/', {'updated_since': since})
+        self.assertEqual([row['object_id'] for row in response.json()['results']], [self.ids[1]])
+        response = self.client.get('/api/tombstones/', {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_resumes(self):
+        self.clients[0].delete()
+        self.clients[1].delete()
+        body = self.client.get('/api/tombstones/', {'page_size': 1}).json()
+        self.assertEqual([row['object_id'] for row in body['results']], [self.ids[0]])
+        body = self.client.get('/api/tombstones/', {'cursor': body['cursor']}).json()
+        self.assertEqual([row['object_id'] for row in body['results']], [self.ids[1]])
+        # Nothing new: an empty page hands the same cursor back
+        cursor = body['cursor']
+        body = self.client.get('/api/tombstones/', {'cursor': cursor}).json()
+        self.assertEqual((body['results'], body['cursor']), ([], cursor))
+        self.clients[2].delete()
+        body = self.client.get('/api/tombstones/', {'cursor': cursor}).json()
+        self.assertEqual([row['object_id'] for row in body['results']], [self.ids[2]])
+
+    def test_membership_events(self):
+        ids = self.ids
+        other = List.objects.create(name='Other')
+        self.client.post(f'/api/lists/{self.list.pk}/add_clients/', {'client_ids': ids}, format='json')
+        self.client.post(f'/api/lists/{other.pk}/add_clients/', {'client_ids': ids[:1]}, format='json')
+        self.client.post(f'/api/lists/{self.list.pk}/remove_clients/', {'client_ids': ids[:1]}, format='json')
+        response = self.client.get('/api/membership-events/', {'list_id': self.list.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['client_id'], row['action']) for row in response.json()['results']],
+            [(ids[0], 'add'), (ids[1], 'add'), (ids[2], 'add'), (ids[0], 'remove')],
+        )
+        self.assertEqual(len(self.client.get('/api/membership-events/').json()['results']), 5)
+        self.assertEqual(self.client.get('/api/membership-events/', {'list_id': 'x'}).status_code, 400)
+
+
+# ========== INDEXED FILTERS ==========
+class IndexedFilterTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        roles = ['Sales Lead', 'sales ops', 'Salesforce Admin', 'Presales', 'a\U0010ffff', 'a\U0010ffffz', 'b\ud7ff']
+        for role in roles:
+            Client.objects.create(client=role, job_role=role)
+
+    def filtered_roles(self, **params):
+        response = self.client.get('/api/clients/', params)
+        self.assertEqual(response.status_code, 200)
+        return {row['job_role'] for row in response.json()['results']}
+
+    def test_prefix_range(self):
+        self.assertEqual(prefix_range('sales'), ('sales', 'salet'))
+        self.assertEqual(prefix_range('a\U0010ffff'), ('a\U0010ffff', 'b'))
+        self.assertEqual(prefix_range('\U0010ffff'), ('\U0010ffff', None))
+        self.assertEqual(prefix_range('\ud7ff'), ('\ud7ff', '\ue000'))
+
+    def test_prefix_and_exact(self):
+        self.assertEqual(self.filtered_roles(role__prefix='SALES'), {'Sales Lead', 'sales ops', 'Salesforce Admin'})
+        self.assertEqual(self.filtered_roles(role__prefix='sales o'), {'sales ops'})
+        self.assertEqual(self.filtered_roles(role__exact='sales lead'), {'Sales Lead'})
+        self.assertEqual(self.filtered_roles(role='sales'), {'Sales Lead', 'sales ops', 'Salesforce Admin', 'Presales'})
+
+    def test_prefix_past_the_last_character(self):
+        self.assertEqual(self.filtered_roles(role__prefix='a\U0010ffff'), {'a\U0010ffff', 'a\U0010ffffz'})
+        self.assertEqual(self.filtered_roles(role__prefix='\U0010ffff'), set())
+        self.assertEqual(self.filtered_roles(role__prefix='b\ud7ff'), {'b\ud7ff'})
+
+
+# ========== PROFILING ==========
+class ProfilingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        histogram.clear()
+        self.acme = Company.objects.create(company_name='Acme')
+        self.clients = [Client.objects.create(client=f'Client {i}', company=self.acme) for i in range(3)]
+
+    def route_stats(self, route):
+        return self.client.get('/api/metrics/').json()['routes'][route]
+
+    def test_unsampled(self):
+        response = self.client.get('/api/clients/')
+        self.assertNotIn('Server-Timing', response)
+        stats = self.route_stats('GET client-list')
+        self.assertEqual((stats['count'], stats['profiled'], stats['queries_mean']), (1, 0, None))
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled(self):
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            response = self.client.get('/api/clients/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=')
+        profile = json.loads(logs.records[0].getMessage())
+        self.assertEqual((profile['event'], profile['route'], profile['status']), ('request', 'GET client-list', 200))
+        self.assertEqual(profile['bytes'], len(response.content))
+        self.assertGreater(profile['queries'], 0)
+        self.assertEqual(profile['duplicate_queries'], [])
+        self.assertEqual(histogram.snapshot()['GET client-list']['profiled'], 1)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DUPLICATE_THRESHOLD=3, PROFILING_SLOW_QUERY_MS=0)
+    def test_duplicate_and_slow_queries(self):
+        def n_plus_one(request):
+            for client in Client.objects.order_by('id'):
+                Company.objects.get(pk=client.company_id)
+            return HttpResponse('ok')
+
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            ProfilingMiddleware(n_plus_one)(RequestFactory().get('/n-plus-one/'))
+        request, *slow = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(logs.records[0].levelname, 'WARNING')
+        self.assertEqual(request['queries'], 4)
+        [duplicate] = request['duplicate_queries']
+        self.assertEqual(duplicate['count'], 3)
+        self.assertIn('api_company', duplicate['sql'])
+        self.assertEqual([row['event'] for row in slow], ['slow_query'] * 4)
+
+
+# ========== JOBS ==========
+class JobTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.list = List.objects.create(name='Leads')
+        self.ids = [Client.objects.create(client=f'Client {i}').pk for i in range(3)]
+        self.calls = []
+        handlers = mock.patch.dict(HANDLERS, {'test.flaky': self.flaky})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def flaky(self, context, failures):
+        """Fails ``failures`` times, checkpointing before each failure"""
+        self.calls.append(dict(context.state))
+        context.checkpoint(calls=len(self.calls))
+        if len(self.calls) <= failures:
+            raise RuntimeError('flaky')
+        return {'done': True}
+
+    def run_job(self, job, worker='worker'):
+        self.assertTrue(Worker(worker).run_once())
+        job.refresh_from_db()
+        return job
+
+    def test_async_action(self):
+        url = f'/api/lists/{self.list.pk}/add_clients/?async=true'
+        headers = {'Idempotency-Key': 'add-1'}
+        response = self.client.post(url, {'client_ids': self.ids}, format='json', headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], response.json()['url'])
+        again = self.client.post(url, {'client_ids': self.ids}, format='json', headers=headers)
+        self.assertEqual((again.status_code, again.json()['id']), (200, response.json()['id']))
+
+        job = self.run_job(Job.objects.get(pk=response.json()['id']))
+        self.assertEqual((job.status, job.result['added_count'], job.progress_done), ('succeeded', 3, 3))
+        self.assertEqual(self.list.clients.count(), 3)
+        self.assertFalse(Worker('worker').run_once())
+
+    def test_claimed_once(self):
+        job, _ = enqueue('test.flaky', {'failures': 0})
+        self.assertEqual(Worker('first').claim().pk, job.pk)
+        self.assertIsNone(Worker('second').claim())
+
+    def test_expired_lease_taken_over(self):
+        job, _ = enqueue('test.flaky', {'failures': 0})
+        first = Worker('first')
+        claimed = first.claim()
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        job = self.run_job(job, worker='second')
+        self.assertEqual((job.status, job.attempts, job.result), ('succeeded', 2, {'calls': 1, 'done': True}))
+        # The first worker lost its lease, its outcome is dropped
+        first.finish(claimed, status='failed', error='late')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+
+    def test_lost_worker_gives_up(self):
+        job, _ = enqueue('test.flaky', {'failures': 0})
+        Job.objects.filter(pk=job.pk).update(max_attempts=1)
+        Worker('first').claim()
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        job = self.run_job(job)
+        self.assertEqual((job.status, self.calls), ('failed', []))
+        self.assertIn('last worker was lost', job.error)
+
+    @override_settings(JOB_RETRY_DELAY=5)
+    def test_retry_with_backoff(self):
+        job, _ = enqueue('test.flaky', {'failures': 2})
+        for attempt, delay in [(1, 5), (2, 10)]:
+            before = timezone.now()
+            with self.assertLogs('api.jobs', 'ERROR'):
+                job = self.run_job(job)
+            self.assertEqual((job.status, job.attempts, job.error), ('queued', attempt, "RuntimeError('flaky')"))
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            self.assertLess(job.run_after, before + timedelta(seconds=delay + 5))
+            self.assertFalse(Worker('worker').run_once())
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = self.run_job(job)
+        self.assertEqual((job.status, job.attempts, job.error), ('succeeded', 3, ''))
+        # Each attempt resumed from the previous attempt's checkpoint
+        self.assertEqual(self.calls, [{}, {'calls': 1}, {'calls': 2}])
+
+    def test_failed_and_retried(self):
+        job, _ = enqueue('test.flaky', {'failures': 5})
+        Job.objects.filter(pk=job.pk).update(max_attempts=1)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            job = self.run_job(job)
+        self.assertEqual(job.status, 'failed')
+
+        response = self.client.post(f'/api/jobs/{job.pk}/retry/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.json()['status'], response.json()['attempts']), ('queued', 0))
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/retry/').status_code, 400)
+
+    def test_permanent_error(self):
+        job, _ = enqueue('list.add_clients', {'list_id': 0, 'client_ids': self.ids})
+        job = self.run_job(job)
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 1, 'List 0 not found'))
+
+
+# ========== ASYNC VIEWS ==========
+@override_settings(**TEST_SETTINGS)
+class AsyncViewTests(TransactionTestCase):
+    """Pages and counts are read in worker threads, which only see committed rows"""
+    client_class = APIClient
+
+    def setUp(self):
+        caches['default'].clear()
+        self.acme = Company.objects.create(company_name='Acme', location='Berlin')
+        self.clients = [
+            Client.objects.create(client=f'Client {i}', nurturing_stage=stage, company=self.acme)
+            for i, stage in enumerate(['hot', 'cold', 'hot'])
+        ]
+        self.list = List.objects.create(name='Leads')
+        ListOperations().add_clients(self.list.pk, [client.pk for client in self.clients[:2]])
+
+    def test_same_results_as_sync(self):
+        for path in ['clients/', 'clients/?nurturing_stage=hot&page_size=1', f'lists/{self.list.pk}/get_clients/']:
+            sync, async_ = self.client.get(f'/api/{path}').json(), self.client.get(f'/api/async/{path}').json()
+            for data in sync, async_:
+                data.pop('next'), data.pop('previous')
+            self.assertEqual(async_, sync, path)
+
+    def test_detail(self):
+        pk = self.clients[0].pk
+        response = self.client.get(f'/api/async/clients/{pk}/')
+        self.assertEqual(response.content, self.client.get(f'/api/clients/{pk}/').content)
+        self.assertEqual(self.client.get('/api/async/clients/0/').status_code, 404)
+        self.assertEqual(self.client.post('/api/async/clients/').status_code, 405)
+
+    def test_facets(self):
+        response = self.client.get('/api/async/clients/facets/', {'nurturing_stage': 'hot'})
+        sync = self.client.get('/api/clients/facets/', {'nurturing_stage': 'hot'})
+        self.assertEqual(response.json()['facets'], sync.json()['facets'])
+        self.assertEqual(response.json()['count'], 2)
+
+    async def streamed(self, path, **params):
+        response = await self.async_client.get(path, params)
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_export(self):
+        body = await self.streamed('/api/async/clients/export/', file_format='jsonl')
+        self.assertEqual(sorted(json.loads(line)['client'] for line in body.splitlines()),
+                         ['Client 0', 'Client 1', 'Client 2'])
+        body = await self.streamed(f'/api/async/lists/{self.list.pk}/export/', nurturing_stage='hot')
+        self.assertEqual([row['client'] for row in csv.DictReader(io.StringIO(body))], ['Client 0'])
+
+    def test_conditional_get(self):
+        for path in ['clients/', f'clients/{self.clients[0].pk}/', f'lists/{self.list.pk}/get_clients/']:
+            response = self.client.get(f'/api/async/{path}')
+            etag = response['ETag']
+            self.assertEqual(etag, self.client.get(f'/api/async/{path}')['ETag'])
+            self.assertEqual(self.client.get(f'/api/async/{path}', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(f'/api/async/{path}', HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+    def test_cached_until_a_write(self):
+        etag = self.client.get('/api/async/clients/')['ETag']
+        with mock.patch('api.async_views.paginate') as paginate:
+            self.assertEqual(self.client.get('/api/async/clients/')['ETag'], etag)
+        paginate.assert_not_called()
+        self.client.patch(f'/api/clients/{self.clients[0].pk}/', {'client': 'Renamed'}, format='json')
+        response = self.client.get('/api/async/clients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', [row['client'] for row in response.json()['results']])
+
+
+# ========== BULK RELATED FIELDS ==========
+class BulkRelatedFieldTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.companies = [Company.objects.create(company_name=f'Company {i}') for i in range(2)]
+        self.ids = [Client.objects.create(client=f'Client {i}').pk for i in range(5)]
+
+    def validate_ids(self, client_ids, **kwargs):
+        serializer = ClientIdsSerializer(data={'client_ids': client_ids}, **kwargs)
+        serializer.is_valid()
+        return serializer
+
+    @mock.patch('api.serializers.PK_CHUNK_SIZE', 2)
+    def test_ids_checked_in_chunks(self):
+        with self.assertNumQueries(3):
+            serializer = self.validate_ids([str(pk) for pk in self.ids] + [self.ids[0]])
+        self.assertEqual(serializer.validated_data['client_ids'], self.ids)
+
+    def test_missing_ids_reported_at_once(self):
+        missing = max(self.ids) + 1
+        serializer = self.validate_ids([self.ids[0], missing, missing + 1])
+        self.assertEqual(serializer.errors['client_ids'],
+                         [f'Invalid pk(s) - object(s) do not exist: {missing}, {missing + 1}.'])
+        with self.assertNumQueries(0):
+            serializer = self.validate_ids([self.ids[0], missing], check_exists=False)
+        self.assertEqual(serializer.validated_data['client_ids'], [self.ids[0], missing])
+
+    def test_malformed(self):
+        self.assertIn('Incorrect type', self.validate_ids([self.ids[0], 'x']).errors['client_ids'][0])
+        self.assertIn('Incorrect type', self.validate_ids([True]).errors['client_ids'][0])
+        self.assertIn('Expected a list', self.validate_ids(self.ids[0]).errors['client_ids'][0])
+        self.assertIn('may not be empty', self.validate_ids([]).errors['client_ids'][0])
+
+    def test_preloaded_for_many_rows(self):
+        rows = [{'client': f'New {i}', 'company_id': self.companies[i % 2].pk} for i in range(10)]
+        serializer = ClientSerializer(data=rows + [{'client': 'No company', 'company_id': None}], many=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual([row['company'] for row in serializer.validated_data], [*self.companies * 5, None])
+
+        missing = max(company.pk for company in self.companies) + 1
+        serializer = ClientSerializer(data=rows + [{'client': 'Lost', 'company_id': missing}], many=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {10: {'company_id': [f'Invalid pk "{missing}" - object does not exist.']}})
+
+
+# ========== MEMBERSHIP INDEX ==========
+class BitmapTests(SimpleTestCase):
+
+    def setUp(self):
+        generator = random.Random(23)
+        # A dense and a sparse container in the first chunk, sparse ones further out
+        self.first = set(range(0, 16000, 2)) | {70000, 70001, 1 << 40}
+        self.second = set(generator.sample(range(140000), 6000)) | {1 << 40}
+
+    def assertBitmap(self, bitmap, ids):
+        self.assertEqual(list(bitmap), sorted(ids))
+        self.assertEqual(len(bitmap), len(ids))
+
+    def test_containers(self):
+        bitmap = Bitmap.from_ids(self.first)
+        self.assertIsInstance(bitmap.containers[0], int)
+        self.assertIsInstance(bitmap.containers[1], array)
+        bitmap.discard(range(0, 16000, 4))
+        # Back under ARRAY_MAX ids, the dense container turns sparse again
+        self.assertIsInstance(bitmap.containers[0], array)
+        bitmap.discard([70000, 70001])
+        self.assertNotIn(1, bitmap.containers)
+        self.assertBitmap(bitmap, set(range(2, 16000, 4)) | {1 << 40})
+
+    def test_set_operations(self):
+        first, second = Bitmap.from_ids(self.first), Bitmap.from_ids(self.second)
+        self.assertBitmap(first & second, self.first & self.second)
+        self.assertBitmap(first | second, self.first | self.second)
+        self.assertEqual(first.intersection_count(second), len(self.first & self.second))
+        self.assertBitmap(first & Bitmap(), set())
+        for pk in [0, 1, 2, 70000, 70002, 1 << 40, (1 << 40) + 1]:
+            self.assertEqual(pk in first, pk in self.first, pk)
+        first.add([1, 3, 70002])
+        self.assertBitmap(first, self.first | {1, 3, 70002})
+
+    def test_bytes_round_trip(self):
+        for ids in self.first, self.second, set():
+            self.assertBitmap(Bitmap.from_buffer(Bitmap.from_ids(ids).to_bytes()), ids)
+
+
+class MembershipIndexTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [Client.objects.create(client=f'Client {i}').pk for i in range(4)]
+        self.leads, self.customers = List.objects.create(name='Leads'), List.objects.create(name='Customers')
+        ListOperations().add_clients(self.leads.pk, self.ids[:3])
+        ListOperations().add_clients(self.customers.pk, self.ids[2:])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'memberships.idx')
+
+    def test_snapshot_round_trip(self):
+        self.assertEqual(MembershipIndex().build().save(self.path), self.path)
+        index = MembershipIndex()
+        self.assertTrue(index.load(self.path))
+        # Lists are decoded on first read
+        self.assertIsInstance(index.lists[self.leads.pk], tuple)
+        self.assertEqual(list(index.get(self.leads.pk)), self.ids[:3])
+        self.assertIsInstance(index.lists[self.leads.pk], Bitmap)
+        self.assertEqual(index.overlap([self.leads.pk, self.customers.pk]), {
+            'counts': [3, 2], 'matrix': [[3, 1], [1, 2]], 'intersection': 1, 'union': 4,
+        })
+
+    def test_catch_up_after_load(self):
+        MembershipIndex().build().save(self.path)
+        ListOperations().add_clients(self.customers.pk, self.ids[:1])
+        Client.objects.get(pk=self.ids[1]).delete()
+        self.leads.delete()
+        index = MembershipIndex()
+        index.load(self.path)
+        index.catch_up()
+        self.assertNotIn(self.leads.pk, index.lists)
+        self.assertEqual(list(index.get(self.customers.pk)), [self.ids[0], *self.ids[2:]])
+
+    def test_unreadable_snapshot(self):
+        index = MembershipIndex()
+        self.assertFalse(index.load(self.path))
+        for content in [b'', b'not an index at all, no magic here']:
+            with open(self.path, 'wb') as file:
+                file.write(content)
+            self.assertFalse(index.load(self.path))
+        self.assertIsNone(index.lists)
+
+
+# ========== RENDERING AND COMPRESSION ==========
+class FastJSONRendererTests(SimpleTestCase):
+    """FastJSONRenderer renders the same bytes as DRF's JSONRenderer"""
+
+    data = {
+        'utc': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'offset': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=2))),
+        'date': date(2024, 5, 1),
+        'decimal': Decimal('12.50'),
+        'uuid': uuid.UUID(int=42),
+        'lazy': gettext_lazy('Leads'),
+        'separators': 'line \u2028 paragraph \u2029',
+        'nested': [{'unicode': 'Zo\u00eb', 'none': None, 'float': 1.5}, (1, 2)],
+    }
+
+    def assertSameBytes(self, data, accepted_media_type=None):
+        self.assertEqual(FastJSONRenderer().render(data, accepted_media_type),
+                         JSONRenderer().render(data, accepted_media_type))
+
+    def test_same_bytes(self):
+        self.assertSameBytes(self.data)
+        self.assertSameBytes([{'id': 1}, {'id': 2}])
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_beyond_orjson(self):
+        # 2**70 is too large for orjson, the stdlib encodes it
+        self.assertSameBytes({'big': 2 ** 70, **self.data})
+
+    def test_without_orjson(self):
+        with mock.patch('api.renderers.orjson', None):
+            self.assertSameBytes(self.data)
+
+    def test_indented(self):
+        self.assertSameBytes(self.data, 'application/json; indent=2')
+
+
+class CompressionTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        acme = Company.objects.create(company_name='Acme')
+        Client.objects.bulk_create([Client(client=f'Client {i}', company=acme, remarks='x' * 50) for i in range(40)])
+
+    def get(self, path, encoding='', **extra):
+        return self.client.get(path, HTTP_ACCEPT_ENCODING=encoding, **extra)
+
+    def decompress(self, encoding, content):
+        if encoding == 'br':
+            return brotli.decompress(content)
+        if encoding == 'zstd':
+            return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        return gzip.decompress(content)
+
+    @mock.patch.dict('api.compression.AVAILABLE', {'br': True, 'zstd': True})
+    def test_accepted_encoding(self):
+        for header, encoding in [
+            ('gzip, deflate, br, zstd', 'zstd'),
+            ('gzip, br;q=0.5', 'gzip'),
+            ('GZIP;q=0.2, br;q=0.8', 'br'),
+            ('*', 'zstd'),
+            ('*;q=0, gzip', 'gzip'),
+            ('zstd;q=0, *;q=0.5', 'br'),
+            ('gzip;q=x, br', 'br'),
+            ('gzip;q=0', None),
+            ('identity', None),
+            ('', None),
+        ]:
+            self.assertEqual(accepted_encoding(header), encoding, header)
+        self.assertEqual(accepted_encoding('gzip, br, zstd', preferred=['gzip', 'br']), 'gzip')
+        with mock.patch.dict('api.compression.AVAILABLE', {'zstd': False}):
+            self.assertEqual(accepted_encoding('zstd, br'), 'br')
+
+    def test_json_compressed(self):
+        plain = self.get('/api/clients/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        for encoding in [name for name in ('gzip', 'br', 'zstd') if AVAILABLE[name]]:
+            response = self.get('/api/clients/', encoding)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(response['ETag'], f'W/{plain["ETag"]}')
+            self.assertEqual(int(response['Content-Length']), len(response.content))
+            self.assertLess(len(response.content), len(plain.content))
+            self.assertEqual(self.decompress(encoding, response.content), plain.content)
+            # The weak ETag still revalidates
+            self.assertEqual(self.get('/api/clients/', encoding, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_left_alone(self):
+        # Small bodies, HTML and 304s are sent as is
+        pk = Client.objects.first().pk
+        self.assertNotIn('Content-Encoding', self.get(f'/api/clients/{pk}/', 'gzip'))
+        page = CompressionMiddleware(lambda request: HttpResponse('<p>page</p>' * 1000))
+        self.assertNotIn('Content-Encoding', page(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')))
+        etag = self.get('/api/clients/')['ETag']
+        self.assertNotIn('Content-Encoding', self.get('/api/clients/', 'gzip', HTTP_IF_NONE_MATCH=etag))
+
+    def test_streaming_export(self):
+        plain = b''.join(self.get('/api/clients/export/').streaming_content)
+        response = self.get('/api/clients/export/', 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_stream_flushed(self):
+        content = ''.join(f'row {i},{"x" * 100}\n' for i in range(20)).encode()
+        chunks = [content[start:start + 100] for start in range(0, len(content), 100)]
+        *outputs, last = compress_stream(iter(chunks), 'gzip', 1, flush_bytes=500)
+        # All but the input since the last flush decodes before the stream ends
+        received = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(b''.join(outputs))
+        self.assertEqual(received, content[:len(received)])
+        self.assertGreater(len(received), len(content) - 500)
+        self.assertEqual(gzip.decompress(b''.join(outputs) + last), content)
+
+    def test_level_within_budget(self):
+        rates = Throughput()
+        self.assertEqual(rates.choose_level('gzip', 1_000_000, budget_seconds=1), 6)
+        self.assertEqual(rates.choose_level('gzip', 1_000_000, budget_seconds=0.02), 4)
+        self.assertEqual(rates.choose_level('gzip', 100_000_000, budget_seconds=0.02), 1)
+        # Measured slower than seeded, the middle level no longer fits
+        rates.record('gzip', 4, 1_000_000, 0.1)
+        rates.record('gzip', 4, 1_000_000, 0.1)
+        self.assertEqual(rates.choose_level('gzip', 1_000_000, budget_seconds=0.02), 1)
+
+
+# ========== ARCHIVE ==========
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(company_name='Acme')
+        self.list = List.objects.create(name='Leads')
+        self.cold = [Client.objects.create(client=f'Cold {i}', nurturing_stage='cold', company=self.company)
+                     for i in range(3)]
+        self.warm = Client.objects.create(client='Warm', nurturing_stage='warm', company=self.company)
+        self.recent = Client.objects.create(client='Recent cold', nurturing_stage='cold', company=self.company)
+        Client.objects.filter(pk__in=[c.pk for c in [*self.cold, self.warm]]).update(
+            updated_at=timezone.now() - timedelta(days=400)
+        )
+        self.list.clients.add(*self.cold, self.warm)
+        self.archive = ClientArchive(chunk_size=2)
+
+    def archive_cold(self):
+        return sum(self.archive.run(self.archive.policy(stages=['cold'], days=180)))
+
+    def test_archive(self):
+        self.assertEqual(self.archive_cold(), 3)
+        ids = [client.pk for client in self.cold]
+        self.assertFalse(Client.objects.filter(pk__in=ids).exists())
+        self.assertEqual(set(ArchivedClient.objects.values_list('id', flat=True)), set(ids))
+        self.assertEqual(
+            set(ArchivedClient.lists.through.objects.values_list('archivedclient_id', flat=True)), set(ids)
+        )
+        self.list.refresh_from_db()
+        self.company.refresh_from_db()
+        self.assertEqual((self.list.client_count, self.company.client_count), (1, 2))
+        self.assertEqual(Tombstone.objects.filter(model='client', object_id__in=ids).count(), 3)
+        self.assertEqual(list(drifted_lists()), [])
+
+    def test_include_archived(self):
+        self.archive_cold()
+        active = self.client.get('/api/clients/').json()['results']
+        self.assertEqual({row['client'] for row in active}, {'Warm', 'Recent cold'})
+        rows = self.client.get('/api/clients/?include_archived=true').json()['results']
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(sum(row['archived'] for row in rows), 3)
+        members = self.client.get(f'/api/lists/{self.list.pk}/get_clients/?include_archived=true').json()
+        self.assertEqual(len(members['clients']), 4)
+        detail = self.client.get(f'/api/clients/{self.cold[0].pk}/?include_archived=true')
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(self.client.get(f'/api/clients/{self.cold[0].pk}/').status_code, 404)
+
+    def test_restore(self):
+        self.archive_cold()
+        ids = [client.pk for client in self.cold]
+        response = self.client.post('/api/clients/restore/', {'ids': [*ids, 999999]}, format='json')
+        self.assertEqual(response.json()['restored'], 3)
+        self.assertEqual(response.json()['not_found'], 1)
+        self.assertEqual(Client.objects.filter(pk__in=ids).count(), 3)
+        self.assertFalse(ArchivedClient.objects.exists())
+        self.assertEqual(set(self.list.clients.values_list('id', flat=True)), {*ids, self.warm.pk})
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.client_count, 4)
+        self.assertFalse(Tombstone.objects.filter(model='client', object_id__in=ids).exists())
+        self.assertEqual(list(drifted_lists()), [])
+        self.assertEqual(list(drifted_companies()), [])
+
+    def test_company_merge_and_delete_keep_archived_clients(self):
+        self.archive_cold()
+        keep = Company.objects.create(company_name='Acme Inc')
+        CompanyDeduplicator().merge(keep.pk, [self.company.pk])
+        self.assertEqual(set(ArchivedClient.objects.values_list('company_id', flat=True)), {keep.pk})
+        keep.delete()
+        self.assertEqual(ArchivedClient.objects.count(), 3)
+        self.assertEqual(set(ArchivedClient.objects.values_list('company_id', flat=True)), {None})
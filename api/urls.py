@@ -1,13 +1,34 @@
 # urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CompanyViewSet, ClientViewSet, ListViewSet
+from . import async_views
+from .views import (
+    CompanyViewSet, ClientViewSet, ListViewSet, ClientDuplicateViewSet, CompanyDuplicateViewSet,
+    TombstoneViewSet, MembershipEventViewSet, JobViewSet, MetricsViewSet,
+)
 
 router = DefaultRouter()
 router.register(r'companies', CompanyViewSet)
 router.register(r'clients', ClientViewSet)
 router.register(r'lists', ListViewSet)
+router.register(r'duplicates/clients', ClientDuplicateViewSet)
+router.register(r'duplicates/companies', CompanyDuplicateViewSet)
+router.register(r'tombstones', TombstoneViewSet)
+router.register(r'membership-events', MembershipEventViewSet)
+router.register(r'jobs', JobViewSet)
+router.register(r'metrics', MetricsViewSet, basename='metrics')
+
+# Async variants of the hot reads, for ASGI servers (see api/async_views.py)
+async_urlpatterns = [
+    path('clients/', async_views.client_list, name='async-client-list'),
+    path('clients/facets/', async_views.client_facets, name='async-client-facets'),
+    path('clients/export/', async_views.client_export, name='async-client-export'),
+    path('clients/<int:pk>/', async_views.client_detail, name='async-client-detail'),
+    path('lists/<int:pk>/get_clients/', async_views.list_clients, name='async-list-get-clients'),
+    path('lists/<int:pk>/export/', async_views.list_export, name='async-list-export'),
+]
 
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls)),
 ]
\ No newline at end of file
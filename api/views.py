@@ -1,21 +1,147 @@
 # views.py
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    ArchivedClient, Company, Client, ClientDuplicate, CompanyDuplicate, Job, List, MembershipEvent, Tombstone,
+)
+from .serializers import (
+    CompanySerializer, ClientSerializer, ClientIdsSerializer, FastClientSerializer, ListSerializer,
+    ClientDuplicateSerializer, CompanyDuplicateSerializer, JobSerializer, MembershipEventSerializer,
+    TombstoneSerializer,
+)
+from .archive import ClientArchive, client_rows, include_archived
+from .batch import BatchTargetSerializer, ClientBatch, summarize, validate_patch
+from .dedup import ClientDeduplicator, CompanyDeduplicator
+from .cache import CachedResponseMixin, get_cache, make_key, params_signature
+from .exporters import EXPORT_FORMATS, stream_export
+from .facets import compute_facets
+from .filters import client_filters, explain, list_filters, wants_explain
+from .importers import IMPORT_FORMATS, guess_format, import_clients
+from .jobs import enqueue
+from .list_ops import OPERATIONS as LIST_OPERATIONS, ListOperations
+from .membership_index import membership_index
+from .pagination import KeysetPagination
+from .profiling import histogram
+from .segments import Segments
+from .writes import serialized_write
+
+
+class QueryPlanMixin:
+    """Apply the serializer's eager loading plan on read actions"""
+    eager_loading_actions = ('list', 'retrieve', 'changes')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.eager_loading_actions:
+            queryset = self.get_serializer_class().setup_eager_loading(queryset)
+        return queryset
+
+
+def feed_response(request, queryset, field, serialize):
+    """
+    Rows with ``field >= ?updated_since``, oldest first, keyset paginated on
+    ``(field, id)``. ``cursor`` in the body resumes after the last row, so a
+    sync job stores it and polls with ``?cursor=`` next time.
+    """
+    if since := request.query_params.get('updated_since'):
+        parsed = parse_datetime(since)
+        if parsed is None:
+            return Response({'error': 'updated_since must be an ISO 8601 datetime'}, status=400)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        queryset = queryset.filter(**{f'{field}__gte': parsed})
+    
+    paginator = KeysetPagination(ordering=(field, 'id'))
+    paginator.default_count = 'none'
+    page = paginator.paginate_queryset(queryset, request)
+    return Response({
+        **paginator.get_paginated_data(),
+        'cursor': paginator.get_resume_cursor(),
+        'results': serialize(page),
+    })
+
+
+class ChangeFeedMixin:
+    """``GET .../changes/?updated_since=`` - rows created or updated since then"""
+
+    def get_change_queryset(self):
+        return self.get_queryset()
+
+    def serialize_changes(self, page):
+        return self.get_serializer(page, many=True).data
+
+    @action(detail=False, methods=['GET'])
+    def changes(self, request):
+        return feed_response(request, self.get_change_queryset(), 'updated_at', self.serialize_changes)
+
+
+def client_filters_applied(params):
+    """Echo of the client list filters"""
+    return {
+        'q': params.get('q', '').strip(),
+        'role': params.get('role'),
+        'location': params.get('location'),
+        'company': params.get('company'),
+        'status': params.get('status'),
+        'remarks': params.get('remarks'),
+        'lead_owner': params.get('lead_owner'),
+        'nurturing_stage': params.get('nurturing_stage'),
+        'platform': params.get('platform'),
+        **{key: value for key, value in params.items() if key.endswith(('__exact', '__prefix'))}
+    }
+
+
+def list_filters_applied(params):
+    """Echo of the get_clients filters"""
+    return {
+        'role': params.get('role'),
+        'location': params.get('location'),
+        'company': params.get('company'),
+        'media': params.get('media'),
+        'lead_owner': params.get('lead_owner'),
+        **{key: value for key, value in params.items() if key.endswith(('__exact', '__prefix'))}
+    }
+
+
+def explain_response(paginator, queryset, request, plan):
+    """``?explain=1``: the page query and its plan instead of the page"""
+    return Response(explain(paginator.prepare(queryset, request), plan))
+
+
+def wants_async(request):
+    """``?async=true`` (or ``"async": true`` in the body) runs the action as a job"""
+    value = request.query_params.get('async', request.data.get('async', ''))
+    return str(value).lower() in ('true', '1')
+
+
+def job_response(request, kind, params):
+    """Queue a job and answer 202 with its status, see api/jobs.py"""
+    job, created = enqueue(kind, params, idempotency_key=request.headers.get('Idempotency-Key'))
+    serializer = JobSerializer(job, context={'request': request})
+    response = Response(serializer.data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+    response['Location'] = serializer.data['url']
+    return response
 
-from .models import Company, Client, List
-from .serializers import CompanySerializer, ClientSerializer, ListSerializer
 
 # ========== COMPANY API ==========
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(CachedResponseMixin, ChangeFeedMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    cache_depends_on = ('company',)
 
 # ========== CLIENT API ==========
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(CachedResponseMixin, ChangeFeedMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    cache_depends_on = ('client', 'company')
     
     # 1. CREATE - POST /api/clients/
     # 2. GET SINGLE - GET /api/clients/{id}/
@@ -25,99 +151,156 @@ class ClientViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         """List clients with ALL filters in one endpoint"""
-        queryset = Client.objects.all()
+        queryset = self.get_queryset()
         
-        # Get all query parameters
         params = request.query_params
         
-        # Build filter conditions
-        filters = Q()
-        
-        query = params.get('q', '').strip()
-        search = params.get('search', '').strip()
-        
-        if query:  # Simple search using 'q'
-            filters &= (
-                Q(client__icontains=query) |
-                Q(email__icontains=query) |
-                Q(phone__icontains=query) |
-                Q(job_role__icontains=query)
-            )
-        
-        if search:  # Advanced search using 'search'
-            filters &= (
-                Q(client__icontains=search) |
-                Q(email__icontains=search) |
-                Q(phone__icontains=search) |
-                Q(job_role__icontains=search) |
-                Q(status__icontains=search) |
-                Q(remarks__icontains=search) |
-                Q(lead_owner__icontains=search) |
-                Q(company__company_name__icontains=search)
-            )
-        
-        # Filter by role
-        if role := params.get('role'):
-            filters &= Q(job_role__icontains=role)
-        
-        # Filter by location (client location or company location)
-        if location := params.get('location'):
-            filters &= (
-                Q(company__location__icontains=location) |
-                Q(location__icontains=location)
-            )
-        
-        # Filter by company name
-        if company := params.get('company'):
-            filters &= Q(company__company_name__icontains=company)
-        
-        # Filter by status
-        if status := params.get('status'):
-            filters &= Q(status__icontains=status)
-        
-        # Filter by remarks
-        if remarks := params.get('remarks'):
-            filters &= Q(remarks__icontains=remarks)
-        
-        # Filter by lead owner
-        if lead_owner := params.get('lead_owner'):
-            filters &= Q(lead_owner__icontains=lead_owner)
-        
-        # Filter by nurturing stage
-        if nurturing_stage := params.get('nurturing_stage'):
-            filters &= Q(nurturing_stage=nurturing_stage)
-        
-        # Filter by social media
-        if params.get('has_social') == 'true':
-            filters &= ~Q(social_media__isnull=True) & ~Q(social_media={})
-        
-        # Filter by specific social media platform
-        if platform := params.get('platform'):
-            filters &= Q(social_media__has_key=platform)
-        
-        # Apply all filters at once
-        queryset = queryset.filter(filters)
+        # Apply all filters at once (compiled plan, see api/filters.py)
+        plan = client_filters.compile(params)
+        queryset = plan.apply(queryset)
+        # ?include_archived=true pages through the archive too (see api/archive.py)
+        archived = plan.apply(ArchivedClient.objects.all()) if include_archived(params) else None
+        
+        # Keyset pagination, ranked searches page by relevance first
+        paginator = KeysetPagination()
+        if 'search_rank' in queryset.query.annotations:
+            paginator.ordering = ('search_rank', '-created_at', 'id')
+        
+        # Only SELECT what ?fields= / ?expand= asks for, rows stay plain dicts
+        serializer = FastClientSerializer.from_request(request)
+        querysets = client_rows(serializer, paginator.ordering_fields(), queryset, archived)
+        if wants_explain(params):
+            return explain_response(paginator, querysets[0], request, plan)
+        page = paginator.paginate_querysets(querysets, request, view=self)
         
         # Return results
-        serializer = ClientSerializer(queryset, many=True)
         return Response({
-            'count': queryset.count(),
-            'results': serializer.data,
-            'filters_applied': {
-                'q': query,
-                'role': params.get('role'),
-                'location': params.get('location'),
-                'company': params.get('company'),
-                'status': params.get('status'),
-                'remarks': params.get('remarks'),
-                'lead_owner': params.get('lead_owner'),
-                'nurturing_stage': params.get('nurturing_stage'),
-                'platform': params.get('platform')
-            }
+            **paginator.get_paginated_data(),
+            'results': serializer.many(page),
+            'filters_applied': client_filters_applied(params),
         })
 
 
 
+    def retrieve(self, request, *args, **kwargs):
+        """GET /api/clients/{id}/, archived clients too with ?include_archived=true"""
+        if not include_archived(request.query_params):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            response = super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = get_object_or_404(ArchivedClient.objects.select_related('company'), pk=kwargs['pk'])
+            # Same columns, ClientSerializer renders it like a client
+            return Response({**self.get_serializer(archived).data, 'archived': True})
+        response.data['archived'] = False
+        return response
+    
+    def get_change_queryset(self):
+        # Same rows as list, honours ?fields= / ?expand=
+        self.change_serializer = FastClientSerializer.from_request(self.request)
+        return self.change_serializer.get_queryset(Client.objects.all(), extra=('updated_at', 'id'))
+    
+    def serialize_changes(self, page):
+        return self.change_serializer.many(page)
+    
+    @action(detail=False, methods=['GET'])
+    def facets(self, request):
+        """Grouped counts per filter value - GET /api/clients/facets/"""
+        params = request.query_params
+        try:
+            limit = max(1, min(int(params.get('facet_limit', 50)), 500))
+        except ValueError:
+            return Response({'error': 'facet_limit must be an integer'}, status=400)
+        
+        # Cached per filter set, invalidated by any client / company write
+        timeout = settings.FACETS_CACHE_TIMEOUT
+        use_cache = timeout > 0 and params.get('nocache') != 'true'
+        if use_cache:
+            key = make_key('facets', params_signature(params, ignore=('nocache',)), ('client', 'company'))
+            if (data := get_cache().get(key)) is not None:
+                return Response({**data, 'cached': True})
+        
+        queryset = client_filters.filter(Client.objects.all(), params)
+        data = compute_facets(queryset, limit=limit)
+        if use_cache:
+            get_cache().set(key, data, timeout)
+        return Response({**data, 'cached': False})
+    
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        """Stream filtered clients as CSV / JSONL - GET /api/clients/export/"""
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+        
+        plan = client_filters.compile(request.query_params)
+        queryset = plan.apply(Client.objects.all())
+        archived = None
+        if include_archived(request.query_params):
+            archived = plan.apply(ArchivedClient.objects.all())
+        return stream_export(queryset, file_format, 'clients', archived=archived)
+    
+    @action(detail=False, methods=['POST'], url_path='import')
+    def bulk_import(self, request):
+        """Bulk import clients from a CSV / JSONL upload - POST /api/clients/import/"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file required'}, status=400)
+        
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(IMPORT_FORMATS)}'}, status=400)
+        
+        result = import_clients(upload.file, file_format)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else 200)
+    
+    @action(detail=False, methods=['POST'], url_path='batch/create')
+    def batch_create(self, request):
+        """Create many clients - POST /api/clients/batch/create/ {"clients": [...]}"""
+        rows = request.data.get('clients')
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'clients must be a non-empty list'}, status=400)
+        
+        results = ClientBatch().create(rows)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        }, status=status.HTTP_201_CREATED if created else 400)
+    
+    @action(detail=False, methods=['POST'], url_path='batch/update')
+    def batch_update(self, request):
+        """Patch many clients - POST /api/clients/batch/update/ {"ids" | "filters", "patch"}"""
+        target = BatchTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        values = validate_patch(request.data.get('patch'))
+        
+        batch = ClientBatch()
+        ids = batch.target_ids(**target.validated_data)
+        return Response(summarize(batch.update(ids, values)))
+    
+    @action(detail=False, methods=['POST'], url_path='batch/delete')
+    def batch_delete(self, request):
+        """Delete many clients - POST /api/clients/batch/delete/ {"ids" | "filters"}"""
+        target = BatchTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        
+        batch = ClientBatch()
+        ids = batch.target_ids(**target.validated_data)
+        return Response(summarize(batch.delete(ids)))
+    
+    @action(detail=False, methods=['POST'])
+    def restore(self, request):
+        """Move archived clients back - POST /api/clients/restore/ {"ids" | "filters"}"""
+        target = BatchTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        
+        # Filters select among the archived clients (see api/archive.py)
+        archive = ClientArchive()
+        ids = archive.target_ids(**target.validated_data)
+        return Response(summarize(archive.restore(ids)))
+    
     @action(detail=True, methods=['POST'])
     def duplicate(self, request, pk=None):
         """Create duplicate of a client - POST /api/clients/{id}/duplicate/"""
@@ -144,19 +327,21 @@ class ClientViewSet(viewsets.ModelViewSet):
 
 
 # ========== LIST API ==========
-class ListViewSet(viewsets.ModelViewSet):
+class ListViewSet(CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """List API with client operations"""
     queryset = List.objects.all()
     serializer_class = ListSerializer
+    cache_actions = ('list', 'retrieve', 'get_clients', 'overlap')
+    cache_depends_on = ('list', 'client', 'company')
 
     def get_queryset(self):
         """Filter lists by folder and search"""
-        queryset = List.objects.all()
+        queryset = super().get_queryset()
         params = self.request.query_params
         
-        # Filter by folder
-        if folder := params.get('folder'):
-            queryset = queryset.filter(folder__icontains=folder)
+        # Filter by folder (also ?folder__exact= / ?folder__prefix=, indexed),
+        # kind (static / segment) and name, see api/filters.py
+        queryset = list_filters.filter(queryset, params)
         
         # Search by list name or ID using 'q' parameter
         if search_query := params.get('q', '').strip():
@@ -169,13 +354,27 @@ class ListViewSet(viewsets.ModelViewSet):
             except ValueError:
                 queryset = queryset.filter(name__icontains=search_query)
         
-        # Also support direct name search
-        if name := params.get('name'):
-            queryset = queryset.filter(name__icontains=name)
-        
         # Order by latest first
         return queryset.order_by('-created_at')
     
+    def perform_create(self, serializer):
+        # Members and counts are written in SQL, re-read the list with its
+        # query plan so the response doesn't load members one by one
+        serializer.instance = self.get_planned_list(serializer.save())
+    
+    def perform_update(self, serializer):
+        serializer.instance = self.get_planned_list(serializer.save())
+    
+    def get_planned_list(self, list_obj):
+        """Re-read a list with the ListSerializer query plan"""
+        return ListSerializer.setup_eager_loading(List.objects.filter(pk=list_obj.pk)).get()
+    
+    def segment_error(self, list_obj):
+        """Segment members follow their filters, they can't be edited by hand"""
+        if list_obj.kind == 'segment':
+            return Response({'error': f'List {list_obj.id} is a segment, its members come from its filters'}, status=400)
+        return None
+    
     
     @action(detail=True, methods=['GET'])
     def get_clients(self, request, pk=None):
@@ -185,89 +384,144 @@ class ListViewSet(viewsets.ModelViewSet):
         list_obj = self.get_object()
         clients = list_obj.clients.all()
         
-        # Apply filters (same logic as in retrieve method above)
+        # Same filter plans as the client list (see api/filters.py)
         params = request.query_params
-        
-        if role := params.get('role'):
-            clients = clients.filter(job_role__icontains=role)
-        
-        if location := params.get('location'):
-            clients = clients.filter(company__location__icontains=location)
-        
-        if company := params.get('company'):
-            clients = clients.filter(company__company_name__icontains=company)
-        
-        if media := params.get('media'):
-            clients = clients.filter(social_media__icontains=media)
-        
-        if lead_owner := params.get('lead_owner'):
-            clients = clients.filter(lead_owner__icontains=lead_owner)
-
-        print(f"DEBUG: query_params = {request.query_params}")
-
-        
-        # Add pagination
-        page = self.paginate_queryset(clients)
-        if page is not None:
-            serializer = ClientSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        
-        serializer = ClientSerializer(clients, many=True)
-        return Response({
+        plan = client_filters.compile(params)
+        clients = plan.apply(clients)
+        archived = plan.apply(list_obj.archived_clients.all()) if include_archived(params) else None
+        
+        # Keyset pagination over (-created_at, id) on plain value rows
+        paginator = KeysetPagination()
+        if 'search_rank' in clients.query.annotations:
+            paginator.ordering = ('search_rank', '-created_at', 'id')
+        serializer = FastClientSerializer.from_request(request)
+        querysets = client_rows(serializer, paginator.ordering_fields(), clients, archived)
+        if wants_explain(params):
+            return explain_response(paginator, querysets[0], request, plan)
+        page = paginator.paginate_querysets(querysets, request, view=self)
+        pagination = paginator.get_paginated_data()
+        
+        data = {
             'list_id': list_obj.id,
             'list_name': list_obj.name,
             'total_clients': list_obj.count,
-            'filtered_count': clients.count(),
-            'applied_filters': {
-                'role': params.get('role'),
-                'location': params.get('location'),
-                'company': params.get('company'),
-                'media': params.get('media'),
-                'lead_owner': params.get('lead_owner')
-            },
-            'clients': serializer.data
-        })
+            'filtered_count': pagination.pop('count'),
+            **pagination,
+            'applied_filters': list_filters_applied(params),
+            'clients': serializer.many(page)
+        }
+        if archived is not None:
+            # total_clients only counts active members
+            data['archived_clients'] = list_obj.archived_clients.count()
+        return Response(data)
 
 
+    @action(detail=True, methods=['GET'])
+    def export(self, request, pk=None):
+        """Stream a list's clients as CSV / JSONL, same filters as get_clients"""
+        list_obj = self.get_object()
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+        
+        plan = client_filters.compile(request.query_params)
+        clients = plan.apply(list_obj.clients.all())
+        archived = None
+        if include_archived(request.query_params):
+            archived = plan.apply(list_obj.archived_clients.all())
+        return stream_export(clients, file_format, f'list-{list_obj.id}', archived=archived)
+    
+    @action(detail=False, methods=['GET'])
+    def overlap(self, request):
+        """Shared members of lists - GET /api/lists/overlap/?ids=1,2,3 (see api/membership_index.py)"""
+        try:
+            list_ids = list(dict.fromkeys(
+                int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()
+            ))
+        except ValueError:
+            return Response({'error': 'ids must be comma-separated integers'}, status=400)
+        if not list_ids:
+            return Response({'error': 'ids required'}, status=400)
+        limit = settings.MEMBERSHIP_OVERLAP_MAX_LISTS
+        if len(list_ids) > limit:
+            return Response({'error': f'At most {limit} lists at a time'}, status=400)
+        
+        names = dict(List.objects.filter(id__in=list_ids).values_list('id', 'name'))
+        if missing := [list_id for list_id in list_ids if list_id not in names]:
+            return Response({'error': f'Lists not found: {", ".join(map(str, missing))}'}, status=404)
+        
+        result = membership_index.ensure().overlap(list_ids)
+        return Response({
+            'lists': [
+                {'id': list_id, 'name': names[list_id], 'count': count}
+                for list_id, count in zip(list_ids, result['counts'])
+            ],
+            'matrix': result['matrix'],
+            'intersection_count': result['intersection'],
+            'union_count': result['union'],
+        })
+    
     # 1. ADD CLIENTS TO LIST
     @action(detail=True, methods=['POST'])
+    @serialized_write
     def add_clients(self, request, pk=None):
         """Add clients to list"""
         list_obj = self.get_object()
         client_ids = request.data.get('client_ids', [])
         
+        if error := self.segment_error(list_obj):
+            return error
         if not client_ids:
             return Response({'error': 'client_ids required'}, status=400)
-        
-        clients = Client.objects.filter(id__in=client_ids)
-        list_obj.clients.add(*clients)
-        list_obj.refresh_from_db()
+        if wants_async(request):
+            ids = ClientIdsSerializer(data=request.data, check_exists=False)
+            ids.is_valid(raise_exception=True)
+            return job_response(request, 'list.add_clients', {
+                'list_id': list_obj.id, 'client_ids': ids.validated_data['client_ids'],
+            })
+        
+        # Every id checked in chunked queries, memberships written in bulk
+        ids = ClientIdsSerializer(data=request.data)
+        ids.is_valid(raise_exception=True)
+        result = ListOperations().add_clients(list_obj.id, ids.validated_data['client_ids'])
+        list_obj.refresh_from_db(fields=['client_count'])
         
         return Response({
-            'message': f'Added {clients.count()} clients to list',
-            'list': ListSerializer(list_obj).data
+            'message': f'Added {result["added"]} clients to list',
+            'list_id': list_obj.id,
+            'added_count': result['added'],
+            'total_clients': list_obj.count,
         })
     
     # 2. REMOVE CLIENTS FROM LIST
     @action(detail=True, methods=['POST'])
+    @serialized_write
     def remove_clients(self, request, pk=None):
         """Remove clients from list"""
         list_obj = self.get_object()
         client_ids = request.data.get('client_ids', [])
         
+        if error := self.segment_error(list_obj):
+            return error
         if not client_ids:
             return Response({'error': 'client_ids required'}, status=400)
         
-        list_obj.clients.remove(*client_ids)
-        list_obj.refresh_from_db()
+        # Only the members need to exist, other ids remove nothing
+        ids = ClientIdsSerializer(data=request.data, check_exists=False)
+        ids.is_valid(raise_exception=True)
+        result = ListOperations().remove_clients(list_obj.id, ids.validated_data['client_ids'])
+        list_obj.refresh_from_db(fields=['client_count'])
         
         return Response({
-            'message': f'Removed clients from list',
-            'list': ListSerializer(list_obj).data
+            'message': f'Removed {result["removed"]} clients from list',
+            'list_id': list_obj.id,
+            'removed_count': result['removed'],
+            'total_clients': list_obj.count,
         })
     
 
     @action(detail=True, methods=['POST'])
+    @serialized_write
     def duplicate(self, request, pk=None):
         """Duplicate a list with its clients"""
         original = self.get_object()
@@ -277,55 +531,229 @@ class ListViewSet(viewsets.ModelViewSet):
         if not new_name:
             new_name = f"{original.name} (Copy)"
         
-        # Create the duplicate list
-        duplicate = List.objects.create(
-            name=new_name,
-            folder=original.folder
-        )
+        if wants_async(request):
+            return job_response(request, 'list.duplicate', {'source_id': original.id, 'name': new_name})
         
-        # Copy all clients from original to duplicate
-        original_clients = original.clients.all()
-        duplicate.clients.add(*original_clients)
+        # Create the duplicate list and copy all clients in SQL
+        duplicate = ListOperations().duplicate(original, new_name)
         
-        serializer = ListSerializer(duplicate)
+        serializer = ListSerializer(self.get_planned_list(duplicate))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
 
     @action(detail=True, methods=['POST'])
+    @serialized_write
+    def refresh(self, request, pk=None):
+        """Re-run a segment's filters over every client"""
+        list_obj = self.get_object()
+        if list_obj.kind != 'segment':
+            return Response({'error': 'Only segments can be refreshed'}, status=400)
+        
+        result = Segments().refresh(list_obj)
+        return Response({
+            'list_id': list_obj.id,
+            'added_count': result['added'],
+            'removed_count': result['removed'],
+        })
+    
+    @action(detail=True, methods=['POST'])
+    @serialized_write
     def move(self, request, pk=None):
-        """Merge clients from one list to another"""
+        """Merge clients from one list to another, optionally removing them from the source"""
         source_list = self.get_object()
         target_list_id = request.data.get('target_list_id')
+        remove_from_source = str(request.data.get('remove_from_source', '')).lower() in ('true', '1')
         
         if not target_list_id:
             return Response({'error': 'target_list_id required'}, status=400)
         
         try:
             target_list = List.objects.get(id=target_list_id)
-        except List.DoesNotExist:
+        except (List.DoesNotExist, ValueError):
             return Response({'error': 'Target list not found'}, status=404)
         
         # Don't allow copying to same list
         if source_list.id == target_list.id:
             return Response({'error': 'Cannot copy to same list'}, status=400)
-        
-        # Count before merge
-        before_count = target_list.clients.count()
-        
-        # Merge clients (add() ignores duplicates)
-        source_clients = source_list.clients.all()
-        target_list.clients.add(*source_clients)
-        
-        # Count after merge
-        target_list.refresh_from_db()
-        after_count = target_list.clients.count()
-        
-        added = after_count - before_count
+        if error := self.segment_error(target_list):
+            return error
+        if remove_from_source and (error := self.segment_error(source_list)):
+            return error
+        if wants_async(request):
+            return job_response(request, 'list.move', {
+                'source_id': source_list.id, 'target_id': target_list.id, 'remove_from_source': remove_from_source,
+            })
+        
+        # INSERT ... SELECT (and DELETE) in one transaction, add() semantics for duplicates
+        result = ListOperations().move(source_list.id, target_list.id, remove_from_source=remove_from_source)
+        added = result['added']
         
         return Response({
             'success': True,
             'message': f'Added {added} clients to {target_list.name}',
             'added_count': added,
+            'removed_count': result['removed'],
             'source_list': source_list.name,
             'target_list': target_list.name
         })
+    
+    @action(detail=True, methods=['POST'])
+    @serialized_write
+    def combine(self, request, pk=None):
+        """Union / intersect / difference this list with others, in place"""
+        target_list = self.get_object()
+        operation = request.data.get('operation')
+        list_ids = request.data.get('list_ids', [])
+        
+        if error := self.segment_error(target_list):
+            return error
+        if operation not in LIST_OPERATIONS:
+            return Response({'error': f'operation must be one of {", ".join(LIST_OPERATIONS)}'}, status=400)
+        if not list_ids or not isinstance(list_ids, list):
+            return Response({'error': 'list_ids required'}, status=400)
+        
+        try:
+            list_ids = sorted({int(list_id) for list_id in list_ids})
+        except (TypeError, ValueError):
+            return Response({'error': 'list_ids must be integers'}, status=400)
+        found = set(List.objects.filter(id__in=list_ids).values_list('id', flat=True))
+        if missing := [list_id for list_id in list_ids if list_id not in found]:
+            return Response({'error': 'Lists not found', 'missing_ids': missing}, status=404)
+        
+        result = ListOperations().apply(operation, target_list.id, list_ids)
+        return Response({
+            'success': True,
+            'operation': operation,
+            'list_id': target_list.id,
+            'added_count': result['added'],
+            'removed_count': result['removed'],
+        })
+
+
+# ========== DUPLICATES API ==========
+class DuplicateViewSet(QueryPlanMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Candidate pairs found by api/dedup.py, best scores first"""
+    deduplicator_class = None
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(status=self.request.query_params.get('status', 'open'))
+        return queryset
+    
+    def list(self, request):
+        queryset = self.get_queryset()
+        paginator = KeysetPagination(ordering=('-score', 'id'))
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    @action(detail=True, methods=['POST'])
+    @serialized_write
+    def merge(self, request, pk=None):
+        """Merge the pair, keeping ``keep`` (the older row by default)"""
+        candidate = self.get_object()
+        keep = request.data.get('keep', candidate.first_id)
+        try:
+            keep = int(keep)
+        except (TypeError, ValueError):
+            return Response({'error': 'keep must be an id'}, status=400)
+        if keep not in (candidate.first_id, candidate.second_id):
+            return Response({'error': 'keep must be one of the pair'}, status=400)
+        
+        other = candidate.second_id if keep == candidate.first_id else candidate.first_id
+        self.deduplicator_class().merge(keep, [other])
+        return Response({'kept': keep, 'merged': other})
+    
+    @action(detail=True, methods=['POST'])
+    def dismiss(self, request, pk=None):
+        """Mark the pair as not a duplicate, it won't be suggested again"""
+        candidate = self.get_object()
+        candidate.status = 'dismissed'
+        candidate.save(update_fields=['status'])
+        return Response(self.get_serializer(candidate).data)
+
+
+class ClientDuplicateViewSet(DuplicateViewSet):
+    queryset = ClientDuplicate.objects.all()
+    serializer_class = ClientDuplicateSerializer
+    deduplicator_class = ClientDeduplicator
+
+
+class CompanyDuplicateViewSet(DuplicateViewSet):
+    queryset = CompanyDuplicate.objects.all()
+    serializer_class = CompanyDuplicateSerializer
+    deduplicator_class = CompanyDeduplicator
+
+
+# ========== CHANGE FEED API ==========
+class TombstoneViewSet(viewsets.GenericViewSet):
+    """Deleted clients / companies / lists - GET /api/tombstones/?model=client&updated_since="""
+    queryset = Tombstone.objects.all()
+    serializer_class = TombstoneSerializer
+    
+    def list(self, request):
+        queryset = self.get_queryset()
+        if model := request.query_params.get('model'):
+            queryset = queryset.filter(model=model)
+        return feed_response(request, queryset, 'deleted_at', lambda page: self.get_serializer(page, many=True).data)
+
+
+class MembershipEventViewSet(viewsets.GenericViewSet):
+    """List membership adds / removes - GET /api/membership-events/?list_id=&updated_since="""
+    queryset = MembershipEvent.objects.all()
+    serializer_class = MembershipEventSerializer
+    
+    def list(self, request):
+        queryset = self.get_queryset()
+        if list_id := request.query_params.get('list_id'):
+            try:
+                queryset = queryset.filter(list_id=int(list_id))
+            except ValueError:
+                return Response({'error': 'list_id must be an integer'}, status=400)
+        return feed_response(request, queryset, 'created_at', lambda page: self.get_serializer(page, many=True).data)
+
+
+# ========== JOBS API ==========
+class JobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Background jobs - GET /api/jobs/{id}/ for status and progress"""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if job_status := params.get('status'):
+            queryset = queryset.filter(status=job_status)
+        if kind := params.get('kind'):
+            queryset = queryset.filter(kind=kind)
+        return queryset
+    
+    def list(self, request):
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+    
+    @action(detail=True, methods=['POST'])
+    def retry(self, request, pk=None):
+        """Queue a failed job again, it resumes from its last checkpoint"""
+        job = self.get_object()
+        if job.status != 'failed':
+            return Response({'error': 'Only failed jobs can be retried'}, status=400)
+        Job.objects.filter(pk=job.pk, status='failed').update(
+            status='queued', attempts=0, error='', run_after=timezone.now(), finished_at=None,
+            updated_at=timezone.now(),
+        )
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+# ========== METRICS API ==========
+class MetricsViewSet(viewsets.ViewSet):
+    """Rolling request latency per endpoint - GET /api/metrics/ (see api/profiling.py)"""
+    
+    def list(self, request):
+        return Response({
+            'window_seconds': histogram.window,
+            'sample_rate': getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01),
+            'routes': histogram.snapshot(),
+        })
@@ -0,0 +1,123 @@
+# writes.py
+"""
+Single-writer serialization for heavy writes on SQLite.
+
+In WAL mode readers never wait for a writer, but writers still take turns
+on one database lock, and a writer that loses the race fails with
+``database is locked`` once busy_timeout runs out. Heavy writes (list
+actions, batch writes, import chunks) queue up on ``serialized_writes()``
+instead: a lock per database alias, shared by the threads of a process
+and, through a lock file next to the database, by every process. The
+lock is taken before the transaction starts and is re-entrant, so an
+endpoint can hold it around services that take it again.
+
+On other vendors, or with ``SQLITE_SERIALIZE_WRITES`` off, it is a no-op.
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.exceptions import APIException
+
+try:
+    import fcntl
+except ImportError:  # Windows, only threads of one process are serialized
+    fcntl = None
+
+
+class WriteBusy(APIException):
+    status_code = 503
+    default_detail = 'The database is busy with other writes, retry shortly.'
+    default_code = 'write_busy'
+
+
+class WriteLock:
+    """Re-entrant lock across threads and processes for one database"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.local = threading.local()
+        self.file = None
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        if not self.lock.acquire(timeout=timeout):
+            raise WriteBusy()
+        depth = getattr(self.local, 'depth', 0)
+        if depth == 0 and self.path and fcntl is not None:
+            try:
+                self._lock_file(deadline)
+            except BaseException:
+                self.lock.release()
+                raise
+        self.local.depth = depth + 1
+
+    def _lock_file(self, deadline):
+        if self.file is None:
+            self.file = open(self.path, 'a')
+        delay = 0.005
+        while True:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise WriteBusy()
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    def release(self):
+        self.local.depth -= 1
+        if self.local.depth == 0 and self.path and fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_path(connection):
+    name = str(connection.settings_dict['NAME'])
+    # In-memory databases only live in this process
+    if name == ':memory:' or name.startswith('file:') or 'mode=memory' in name:
+        return None
+    return f'{name}.write-lock'
+
+
+def get_write_lock(using=DEFAULT_DB_ALIAS):
+    """The lock of ``using``, None when writes there aren't serialized"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_SERIALIZE_WRITES', True):
+        return None
+    with _locks_guard:
+        if using not in _locks:
+            _locks[using] = WriteLock(_lock_path(connection))
+        return _locks[using]
+
+
+@contextmanager
+def serialized_writes(using=DEFAULT_DB_ALIAS):
+    """Wait for our turn to write, raises WriteBusy after SQLITE_WRITE_LOCK_TIMEOUT"""
+    lock = get_write_lock(using)
+    if lock is None:
+        yield
+        return
+    lock.acquire(getattr(settings, 'SQLITE_WRITE_LOCK_TIMEOUT', 30))
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def serialized_write(method):
+    """View method decorator, goes under ``@action``"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with serialized_writes():
+            return method(*args, **kwargs)
+    return wrapper
@@ -39,6 +39,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the other middleware too
+    'api.profiling.ProfilingMiddleware',
+    # Before anything that reads or sets the response body
+    'api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,26 +72,86 @@ TEMPLATES = [
 WSGI_APPLICATION = 'leads_magics.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: sqlite by default, SALESMAGICS_DB_ENGINE=mysql uses the other
+# SALESMAGICS_DB_* settings. Not DB_ENGINE, .env.example sets that to mysql.
+DB_ENGINE = config('SALESMAGICS_DB_ENGINE', default='sqlite')
+# Seconds a connection is reused across requests, 0 opens one per request
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+if DB_ENGINE == 'mysql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': config('SALESMAGICS_DB_NAME'),
+            'USER': config('SALESMAGICS_DB_USER'),
+            'PASSWORD': config('SALESMAGICS_DB_PASSWORD'),
+            'HOST': config('SALESMAGICS_DB_HOST'),
+            'PORT': config('SALESMAGICS_DB_PORT'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            }
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # WAL lets readers run alongside the writer, NORMAL sync is
+                # durable across app crashes and only fsyncs on checkpoints
+                'init_command': ';'.join([
+                    'PRAGMA journal_mode=WAL',
+                    'PRAGMA synchronous=NORMAL',
+                    'PRAGMA busy_timeout={}'.format(config('SQLITE_BUSY_TIMEOUT_MS', default=20000, cast=int)),
+                    'PRAGMA cache_size=-{}'.format(config('SQLITE_CACHE_SIZE_KB', default=65536, cast=int)),
+                    'PRAGMA mmap_size={}'.format(config('SQLITE_MMAP_SIZE', default=268435456, cast=int)),
+                    'PRAGMA temp_store=MEMORY',
+                ]),
+                # Take the write lock at BEGIN, a deferred transaction that
+                # upgrades later fails at once instead of waiting busy_timeout
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
-}
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.mysql',
-#         'NAME': config('SALESMAGICS_DB_NAME'),
-#         'USER': config('SALESMAGICS_DB_USER'),
-#         'PASSWORD': config('SALESMAGICS_DB_PASSWORD'),
-#         'HOST': config('SALESMAGICS_DB_HOST'),
-#         'PORT': config('SALESMAGICS_DB_PORT'),
-#         'OPTIONS': {
-#             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-#         }
-#     }
-# }
+# Heavy SQLite writes take turns on a lock instead of racing for the
+# database lock, waiting at most this many seconds (see api/writes.py)
+SQLITE_SERIALIZE_WRITES = config('SQLITE_SERIALIZE_WRITES', default=True, cast=bool)
+SQLITE_WRITE_LOCK_TIMEOUT = config('SQLITE_WRITE_LOCK_TIMEOUT', default=30, cast=int)
+
+# Cache: locmem or file locally, redis in production
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://:{password}@{host}:{port}/{db}'.format(
+                password=config('REDIS_PASSWORD', default=''),
+                host=config('REDIS_HOST', default='localhost'),
+                port=config('REDIS_PORT', default=6379, cast=int),
+                db=config('REDIS_DB', default=0, cast=int),
+            ),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,4 +194,106 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-#
\ No newline at end of file
+#
+# API pagination (see api/pagination.py)
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=100, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=1000, cast=int)
+API_APPROX_COUNT_LIMIT = config('API_APPROX_COUNT_LIMIT', default=10000, cast=int)
+
+# Bulk import (see api/importers.py)
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=1000, cast=int)
+
+# Streaming export (see api/exporters.py)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Facet counts cache in seconds, 0 disables it (see api/facets.py)
+FACETS_CACHE_TIMEOUT = config('FACETS_CACHE_TIMEOUT', default=60, cast=int)
+
+# ?explain=1 on the client list endpoints returns the compiled filters,
+# their SQL and the database's query plan (see api/filters.py). It shows
+# the schema and runs EXPLAIN on demand, so it is off unless DEBUG is set.
+API_EXPLAIN = config('API_EXPLAIN', default=DEBUG, cast=bool)
+
+# API response cache in seconds (see api/cache.py)
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=300, cast=int)
+
+# Rows per transaction for batch client writes (see api/batch.py)
+BATCH_CHUNK_SIZE = config('BATCH_CHUNK_SIZE', default=500, cast=int)
+
+# Duplicate detection (see api/dedup.py). Phone numbers without an
+# international prefix get this country calling code, e.g. 1 or 91
+# (validated by the api.E001 system check). Phone keys are parsed as E.164
+# by phonenumbers, without it they fall back to digits (api.W001).
+DEDUP_DEFAULT_COUNTRY_CODE = config('DEDUP_DEFAULT_COUNTRY_CODE', default='')
+DEDUP_MIN_SCORE = config('DEDUP_MIN_SCORE', default=0.5, cast=float)
+DEDUP_MAX_BLOCK_SIZE = config('DEDUP_MAX_BLOCK_SIZE', default=50, cast=int)
+
+# Days of tombstones / membership events kept for the change feed, a sync
+# client idle for longer must resync in full (see api/changes.py)
+CHANGE_FEED_RETENTION_DAYS = config('CHANGE_FEED_RETENTION_DAYS', default=30, cast=int)
+
+# Request profiling (see api/profiling.py). Every request is timed, this
+# share of them also gets SQL timing, Server-Timing headers and a log line.
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.01, cast=float)
+PROFILING_SLOW_QUERY_MS = config('PROFILING_SLOW_QUERY_MS', default=200, cast=int)
+PROFILING_DUPLICATE_THRESHOLD = config('PROFILING_DUPLICATE_THRESHOLD', default=5, cast=int)
+PROFILING_WINDOW_SECONDS = config('PROFILING_WINDOW_SECONDS', default=300, cast=int)
+
+# List membership bitmaps (see api/membership_index.py). Workers map the
+# snapshot written by build_membership_index (run it on deploy) and read
+# the change feed at most this often.
+MEMBERSHIP_INDEX_PATH = config('MEMBERSHIP_INDEX_PATH', default=str(BASE_DIR / '.cache' / 'membership_index.bin'))
+MEMBERSHIP_INDEX_SYNC_SECONDS = config('MEMBERSHIP_INDEX_SYNC_SECONDS', default=2, cast=float)
+# How long feed ids skipped by a sync are re-read, the longest a write
+# transaction may take to commit
+MEMBERSHIP_INDEX_LAG_SECONDS = config('MEMBERSHIP_INDEX_LAG_SECONDS', default=60, cast=int)
+MEMBERSHIP_OVERLAP_MAX_LISTS = config('MEMBERSHIP_OVERLAP_MAX_LISTS', default=500, cast=int)
+
+# Cold-lead archive (see api/archive.py). archive_clients moves clients in
+# these stages not updated for this many days out of the client table.
+ARCHIVE_STAGES = config('ARCHIVE_STAGES', default='cold', cast=Csv())
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=180, cast=int)
+ARCHIVE_CHUNK_SIZE = config('ARCHIVE_CHUNK_SIZE', default=500, cast=int)
+
+# JSON through orjson when it is installed (see api/renderers.py)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Response compression (see api/compression.py). Encodings in order of
+# preference, br and zstd need the brotli / zstandard packages. Bodies are
+# compressed at the best level expected to take at most the CPU budget.
+COMPRESSION_ENCODINGS = config('COMPRESSION_ENCODINGS', default='zstd,br,gzip', cast=Csv())
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_CPU_BUDGET_MS = config('COMPRESSION_CPU_BUDGET_MS', default=50, cast=float)
+COMPRESSION_STREAM_FLUSH_BYTES = config('COMPRESSION_STREAM_FLUSH_BYTES', default=65536, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': config('PROFILING_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'api.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Background jobs (see api/jobs.py). A running job whose worker stops
+# renewing its lease for this long is taken over by another worker.
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=300, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=5, cast=int)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=1.0, cast=float)